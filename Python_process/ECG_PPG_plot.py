@@ -1,5 +1,3 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import scipy.signal as signal
 
@@ -49,52 +47,61 @@ def calculate_vitals(ecg_segment, red_segment, ir_segment):
     return round(hr, 2), round(spo2, 2)
 
 # CHƯƠNG TRÌNH CHÍNH
-# 1. Đọc dữ liệu
-try:
-    df = pd.read_csv(r"..\data\test14.csv", header=0)
-    # Vẫn cần map đủ cột để đọc đúng dữ liệu, dù không vẽ PCG
-    df.columns = ["Timestamp", "PCG", "RED", "IR", "ECG"]
-except FileNotFoundError:
-    print("Không tìm thấy file CSV.")
-    exit()
-
-# 2. Chọn khoảng dữ liệu
-start = 80000
-end = 90000
-if end > len(df): end = len(df)
-
-ecg_data = df["ECG"][start:end].values
-red_data = df["RED"][start:end].values
-ir_data  = df["IR"][start:end].values
-x_axis = range(start, end)
-
-# 3. Tính toán
-bpm_val, spo2_val = calculate_vitals(ecg_data, red_data, ir_data)
-print(f"Kết quả: BPM={bpm_val}, SpO2={spo2_val}%")
-
-ecg_data = process_ecg(ecg_data)
-# 4. Vẽ biểu đồ (Chỉ 3 hàng: ECG, RED, IR)
-fig, axs = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
-fig.suptitle(f'Avg BPM: {bpm_val} | Avg SpO2: {spo2_val}%', fontsize=16, color='darkgreen', fontweight='bold')
-
-# --- Đồ thị 1: ECG ---
-axs[0].plot(x_axis, ecg_data, color='green')
-axs[0].set_title(f"1. ECG Signal", loc='left', fontweight='bold')
-axs[0].set_ylabel("Amplitude")
-axs[0].grid(True, linestyle='--', alpha=0.6)
-
-# --- Đồ thị 2: PPG RED ---
-axs[1].plot(x_axis, red_data, color='red')
-axs[1].set_title("2. PPG RED Signal", loc='left', fontweight='bold')
-axs[1].set_ylabel("Amplitude")
-axs[1].grid(True, linestyle='--', alpha=0.6)
-
-# --- Đồ thị 3: PPG IR ---
-axs[2].plot(x_axis, ir_data, color='darkblue')
-axs[2].set_title(f"3. PPG IR Signal", loc='left', fontweight='bold')
-axs[2].set_xlabel("Sample Index")
-axs[2].set_ylabel("Amplitude")
-axs[2].grid(True, linestyle='--', alpha=0.6)
-
-plt.tight_layout()
-plt.show()
\ No newline at end of file
+def main():
+    # pandas / matplotlib chỉ tải khi chạy như script (import module không tốn chi phí này)
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    # 1. Đọc dữ liệu
+    try:
+        df = pd.read_csv(r"..\data\test14.csv", header=0)
+        # Vẫn cần map đủ cột để đọc đúng dữ liệu, dù không vẽ PCG
+        df.columns = ["Timestamp", "PCG", "RED", "IR", "ECG"]
+    except FileNotFoundError:
+        print("Không tìm thấy file CSV.")
+        return
+
+    # 2. Chọn khoảng dữ liệu
+    start = 80000
+    end = 90000
+    if end > len(df): end = len(df)
+
+    ecg_data = df["ECG"][start:end].values
+    red_data = df["RED"][start:end].values
+    ir_data  = df["IR"][start:end].values
+    x_axis = range(start, end)
+
+    # 3. Tính toán
+    bpm_val, spo2_val = calculate_vitals(ecg_data, red_data, ir_data)
+    print(f"Kết quả: BPM={bpm_val}, SpO2={spo2_val}%")
+
+    ecg_data = process_ecg(ecg_data)
+    # 4. Vẽ biểu đồ (Chỉ 3 hàng: ECG, RED, IR)
+    fig, axs = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
+    fig.suptitle(f'Avg BPM: {bpm_val} | Avg SpO2: {spo2_val}%', fontsize=16, color='darkgreen', fontweight='bold')
+
+    # --- Đồ thị 1: ECG ---
+    axs[0].plot(x_axis, ecg_data, color='green')
+    axs[0].set_title(f"1. ECG Signal", loc='left', fontweight='bold')
+    axs[0].set_ylabel("Amplitude")
+    axs[0].grid(True, linestyle='--', alpha=0.6)
+
+    # --- Đồ thị 2: PPG RED ---
+    axs[1].plot(x_axis, red_data, color='red')
+    axs[1].set_title("2. PPG RED Signal", loc='left', fontweight='bold')
+    axs[1].set_ylabel("Amplitude")
+    axs[1].grid(True, linestyle='--', alpha=0.6)
+
+    # --- Đồ thị 3: PPG IR ---
+    axs[2].plot(x_axis, ir_data, color='darkblue')
+    axs[2].set_title(f"3. PPG IR Signal", loc='left', fontweight='bold')
+    axs[2].set_xlabel("Sample Index")
+    axs[2].set_ylabel("Amplitude")
+    axs[2].grid(True, linestyle='--', alpha=0.6)
+
+    plt.tight_layout()
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import numpy as np
+
+from recording_io import FS, list_recordings
+from pulse_transit import PAT_RANGE_MS
+
+# CẤU HÌNH
+# Cờ hợp lệ (bitmask) thay cho NaN: các cột chỉ số giữ kiểu nguyên
+Q_OK, S_OK, FOOT_OK, PEAK_OK, RR_OK = 1, 2, 4, 8, 16
+MAX_OFFSET = np.iinfo(np.int16).max      # Q/S/chân sóng/đỉnh lưu dạng độ lệch so với R (int16, ±32 s)
+RR_MAX_S = 3.0                           # RR dài hơn (mất beat) không được đánh dấu hợp lệ
+DEDUP_S = 0.2                            # Đỉnh R cách beat cuối < 200ms coi là trùng (cửa sổ chồng lấn)
+
+# 1 beat = 21 byte (so với ~5 mảng float64 + list Python trước đây)
+BEAT_DTYPE = np.dtype([
+    ("r", "<i8"),        # Chỉ số mẫu tuyệt đối của đỉnh R
+    ("q", "<i2"),        # Độ lệch Q so với R (mẫu)
+    ("s", "<i2"),        # Độ lệch S so với R
+    ("foot", "<i2"),     # Độ lệch chân sóng PPG so với R (= PAT theo mẫu)
+    ("peak", "<i2"),     # Độ lệch đỉnh tâm thu PPG so với R
+    ("rr", "<i4"),       # RR tới beat trước (mẫu)
+    ("flags", "u1"),
+])
+
+
+def _pat_ok(off, fs):
+    """Độ lệch R -> chân sóng / đỉnh PPG (mẫu) nằm trong khoảng PAT sinh lý"""
+    ms = off * 1000.0 / fs
+    return (ms >= PAT_RANGE_MS[0]) & (ms <= PAT_RANGE_MS[1])
+
+
+class BeatTable:
+    """
+    Bảng beat dạng cột (mảng có cấu trúc NumPy), dùng chung cho live monitor và phân tích offline.
+    - append / extend: O(1) khấu hao (tăng gấp đôi dung lượng khi đầy)
+    - between(t0, t1): truy vấn theo thời gian bằng tìm kiếm nhị phân trên cột r (luôn tăng dần)
+    - save / load: file .npz (mảng có cấu trúc + fs)
+    """
+    def __init__(self, fs=FS, capacity=1024):
+        self.fs = fs
+        self._buf = np.zeros(capacity, dtype=BEAT_DTYPE)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def data(self):
+        """View (không sao chép) các beat đã có"""
+        return self._buf[:self._n]
+
+    def _reserve(self, extra):
+        need = self._n + extra
+        if need > len(self._buf):
+            grown = np.zeros(max(need, 2 * len(self._buf)), dtype=BEAT_DTYPE)
+            grown[:self._n] = self._buf[:self._n]
+            self._buf = grown
+
+    def extend(self, r, q=None, s=None, foot=None, peak=None):
+        """
+        Thêm nhiều beat (chỉ số tuyệt đối; -1 = không có). Đỉnh R không tăng hoặc trùng
+        với beat cuối (cửa sổ chồng lấn của live monitor) bị bỏ qua. Trả về số beat đã thêm.
+        """
+        r = np.asarray(r, dtype=np.int64)
+        cols = {name: (np.full(len(r), -1, dtype=np.int64) if v is None else np.asarray(v, dtype=np.int64))
+                for name, v in (("q", q), ("s", s), ("foot", foot), ("peak", peak))}
+        last = self._buf["r"][self._n - 1] if self._n else None
+        keep = np.ones(len(r), dtype=bool)
+        if last is not None:
+            keep &= r > last + DEDUP_S * self.fs
+        if len(r) > 1:
+            keep[1:] &= np.diff(r) > 0
+        r = r[keep]
+        if len(r) == 0:
+            return 0
+        self._reserve(len(r))
+        out = self._buf[self._n:self._n + len(r)]
+        out["r"] = r
+        flags = np.zeros(len(r), dtype=np.uint8)
+        for (name, v), bit in zip(cols.items(), (Q_OK, S_OK, FOOT_OK, PEAK_OK)):
+            off = v[keep] - r
+            ok = (v[keep] >= 0) & (np.abs(off) <= MAX_OFFSET)
+            if bit in (FOOT_OK, PEAK_OK):
+                ok &= _pat_ok(off, self.fs)
+            out[name] = np.where(ok, off, 0)
+            flags |= np.where(ok, bit, 0).astype(np.uint8)
+
+        prev = np.concatenate(([last if last is not None else -1], r[:-1]))
+        rr = r - prev
+        rr_ok = (prev >= 0) & (rr <= RR_MAX_S * self.fs)
+        out["rr"] = np.where(prev >= 0, rr, 0)
+        out["flags"] = flags | np.where(rr_ok, RR_OK, 0).astype(np.uint8)
+        self._n += len(r)
+        return len(r)
+
+    def append(self, r, q=-1, s=-1, foot=-1, peak=-1):
+        return self.extend([r], [q], [s], [foot], [peak])
+
+    def attach_ppg(self, feet, peaks, lookback=64):
+        """
+        Gán chân sóng / đỉnh PPG (chỉ số tuyệt đối) cho các beat gần đây chưa có,
+        ghép vector hóa bằng pulse_transit.pair_beats trên lookback beat cuối.
+        Chỉ nhận độ lệch trong PAT_RANGE_MS: giá trị đã gán không bao giờ bị sửa lại, nên chân sóng
+        sai (beat PPG bị mất -> ghép với beat sau) phải bị loại ngay, beat đó có thể được gán ở lần sau.
+        """
+        from pulse_transit import pair_beats
+        if self._n == 0:
+            return
+        tail = self._buf[max(0, self._n - lookback):self._n]
+        beats = pair_beats(tail["r"], feet, peaks, self.fs)
+        for name, bit in (("foot", FOOT_OK), ("peak", PEAK_OK)):
+            idx = beats[name]
+            new = (idx >= 0) & ((tail["flags"] & bit) == 0) & _pat_ok(idx - tail["r"], self.fs)
+            tail[name] = np.where(new, idx - tail["r"], tail[name])
+            tail["flags"] |= np.where(new, bit, 0).astype(np.uint8)
+
+    # --- TRUY VẤN ---
+    def between(self, t0_s, t1_s):
+        """Các beat có R trong [t0, t1) giây (view, tìm kiếm nhị phân)"""
+        r = self.data["r"]
+        lo, hi = np.searchsorted(r, [t0_s * self.fs, t1_s * self.fs], side='left')
+        return self.data[lo:hi]
+
+    def valid(self, bit, rows=None):
+        rows = self.data if rows is None else rows
+        return (rows["flags"] & bit) != 0
+
+    def absolute(self, name, rows=None):
+        """Chỉ số tuyệt đối của q / s / foot / peak và mặt nạ hợp lệ"""
+        rows = self.data if rows is None else rows
+        bit = {"q": Q_OK, "s": S_OK, "foot": FOOT_OK, "peak": PEAK_OK}[name]
+        return rows["r"] + rows[name], self.valid(bit, rows)
+
+    def rr_ms(self, rows=None):
+        """(RR ms, hợp lệ) - dùng chung cho HRV / cảnh báo thay vì tự tính lại np.diff"""
+        rows = self.data if rows is None else rows
+        return rows["rr"] * 1000.0 / self.fs, self.valid(RR_OK, rows)
+
+    def pat_ms(self, rows=None):
+        rows = self.data if rows is None else rows
+        return rows["foot"] * 1000.0 / self.fs, self.valid(FOOT_OK, rows)
+
+    # --- LƯU / ĐỌC ---
+    def save(self, path):
+        np.savez(path, beats=self.data, fs=self.fs)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            beats = z["beats"]
+            table = cls(float(z["fs"]), capacity=max(len(beats), 1))
+        table._buf[:len(beats)] = beats
+        table._n = len(beats)
+        return table
+
+    @classmethod
+    def from_recording(cls, rec, fs=FS):
+        """Batch: phát hiện R/Q/S + chân sóng / đỉnh PPG trên cả file ghi"""
+        from detectors import process_ecg, process_ppg
+        _, r, q, s = process_ecg(np.asarray(rec["ECG"], dtype=float), fs)
+        _, peaks, feet = process_ppg(-np.asarray(rec["IR"], dtype=float), fs)
+        table = cls(fs, capacity=max(len(r), 1))
+        table.extend(r, q, s)
+        table.attach_ppg(feet, peaks, lookback=len(r))
+        return table
+
+
+if __name__ == "__main__":
+    from gap_resample import load_resampled
+    parser = argparse.ArgumentParser(description="Tạo bảng beat (.npz) cho các file ghi")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("--out-dir", default=".", help="Thư mục lưu <tên>_beats.npz")
+    args = parser.parse_args()
+
+    for path in args.files or list_recordings():
+        rec, _ = load_resampled(path)
+        table = BeatTable.from_recording(rec)
+        out = f"{args.out_dir}/{rec['name']}_beats.npz"
+        table.save(out)
+        rr, rr_ok = table.rr_ms()
+        _, foot_ok = table.pat_ms()
+        print(f"{rec['name']}: {len(table)} beat, {table.data.nbytes} byte | RR hợp lệ {np.count_nonzero(rr_ok)}"
+              f" | có chân sóng PPG {np.count_nonzero(foot_ok)} -> {out}")
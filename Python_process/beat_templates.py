@@ -0,0 +1,192 @@
+import argparse
+import warnings
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from recording_io import FS, list_recordings
+from detectors import butter_bandpass_filter, process_ecg, process_ppg
+
+# CẤU HÌNH
+ECG_EPOCH_S = (0.25, 0.45)     # Cắt beat ECG: 250 ms trước R, 450 ms sau R
+PPG_EPOCH_S = (0.05, 0.75)     # Cắt beat PPG: 50 ms trước chân sóng, 750 ms sau
+PPG_MORPH_BAND = (0.5, 10)     # Dải lọc giữ được khuyết mạch (dicrotic notch)
+TEMPLATE_DEPTH = 16            # Số beat gần nhất dùng cho template trung vị
+CHUNK_BEATS = 512              # Xử lý template theo khối -> bộ nhớ giới hạn
+QRS_SLOPE_FRAC = 0.15          # Biên QRS: |đạo hàm| giảm dưới 15% cực đại
+OUTPUT_FILE = "beat_morphology.csv"
+
+
+def epoch_matrix(x, anchors, before, after):
+    """
+    Cắt các đoạn [a - before, a + after) quanh mọi mốc a thành ma trận (n_beats, before + after)
+    bằng 1 phép strided. Phần ngoài biên đệm NaN; trả về (epochs, valid) với valid = đoạn nằm trọn.
+    """
+    anchors = np.asarray(anchors, dtype=np.int64)
+    width = before + after
+    if len(anchors) == 0:
+        return np.empty((0, width)), np.empty(0, dtype=bool)
+    padded = np.concatenate((np.full(before, np.nan), np.asarray(x, dtype=float), np.full(after, np.nan)))
+    epochs = sliding_window_view(padded, width)[anchors]
+    valid = (anchors >= before) & (anchors + after <= len(x))
+    return epochs, valid
+
+
+def running_templates(epochs, depth=TEMPLATE_DEPTH, chunk=CHUNK_BEATS):
+    """
+    Template trung vị của depth beat TRƯỚC mỗi beat (beat đầu tiên dùng chính nó).
+    Tính theo khối chunk beat nên bộ nhớ tạm ~ chunk * depth * width thay vì n * depth * width.
+    """
+    n, width = epochs.shape
+    out = np.empty((n, width))
+    if n == 0:
+        return out
+    # Đệm đầu bằng beat đầu tiên để mọi beat đều có đủ depth beat phía trước
+    padded = np.concatenate((np.repeat(epochs[:1], depth, axis=0), epochs))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)   # Cột toàn NaN ở biên bản ghi -> NaN
+        for s in range(0, n, chunk):
+            e = min(n, s + chunk)
+            win = sliding_window_view(padded[s:e + depth - 1], depth, axis=0)   # (e-s, width, depth)
+            out[s:e] = np.nanmedian(win, axis=2)
+    return out
+
+
+def row_corr(a, b):
+    """Hệ số tương quan Pearson theo từng hàng (bỏ qua NaN ở biên)"""
+    m = np.isfinite(a) & np.isfinite(b)
+    n = m.sum(axis=1)
+    a = np.where(m, a, 0.0)
+    b = np.where(m, b, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        am = a - (a.sum(axis=1) / n)[:, None] * m
+        bm = b - (b.sum(axis=1) / n)[:, None] * m
+        return (am * bm).sum(axis=1) / np.sqrt((am * am).sum(axis=1) * (bm * bm).sum(axis=1))
+
+
+def _masked_arg(mat, lo, hi, fn=np.argmax):
+    """argmax/argmin mỗi hàng trong cột [lo, hi) riêng của hàng đó; -1 nếu cửa sổ rỗng"""
+    cols = np.arange(mat.shape[1])
+    lo = np.clip(np.asarray(lo), 0, mat.shape[1])
+    hi = np.clip(np.asarray(hi), 0, mat.shape[1])
+    mask = (cols >= lo[:, None]) & (cols < hi[:, None]) & np.isfinite(mat)
+    fill = -np.inf if fn is np.argmax else np.inf
+    idx = fn(np.where(mask, mat, fill), axis=1)
+    return np.where(mask.any(axis=1), idx, -1)
+
+
+def _take(mat, idx):
+    """mat[i, idx[i]] (NaN nếu idx = -1)"""
+    v = mat[np.arange(len(idx)), np.maximum(idx, 0)]
+    return np.where(idx >= 0, v, np.nan)
+
+
+def ecg_features(epochs, fs=FS, before=None):
+    """
+    Đặc trưng hình thái ECG theo beat (đoạn căn theo đỉnh R ở cột before):
+    độ rộng QRS, biên độ R so với đường nền PR, biên độ / độ trễ sóng T.
+    """
+    before = int(ECG_EPOCH_S[0] * fs) if before is None else before
+    n = len(epochs)
+    # Đường nền: trung vị 40 ms ở đoạn PR (80 - 40 ms trước R)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        baseline = np.nanmedian(epochs[:, before - int(0.08 * fs):before - int(0.04 * fs)], axis=1)
+    x = epochs - baseline[:, None]
+
+    # QRS: quanh R ±60 ms, biên là nơi |đạo hàm| rơi dưới QRS_SLOPE_FRAC * cực đại
+    slope = np.abs(np.diff(x, axis=1, prepend=np.nan))
+    w = int(0.06 * fs)
+    seg = slope[:, before - w:before + w]
+    thr = QRS_SLOPE_FRAC * np.nanmax(seg, axis=1, initial=0)
+    steep = seg > thr[:, None]
+    any_steep = steep.any(axis=1)
+    onset = np.argmax(steep, axis=1)
+    offset = seg.shape[1] - 1 - np.argmax(steep[:, ::-1], axis=1)
+    qrs_ms = np.where(any_steep, (offset - onset) * 1000.0 / fs, np.nan)
+
+    # Sóng T: cực trị |x| trong 150 - 400 ms sau R
+    t_lo = np.full(n, before + int(0.15 * fs))
+    t_hi = np.full(n, before + int(0.40 * fs))
+    t_idx = _masked_arg(np.abs(x), t_lo, t_hi)
+    return {
+        "r_amp": x[:, before],
+        "qrs_ms": qrs_ms,
+        "t_amp": _take(x, t_idx),
+        "t_latency_ms": np.where(t_idx >= 0, (t_idx - before) * 1000.0 / fs, np.nan),
+    }
+
+
+def ppg_features(epochs, fs=FS, before=None):
+    """
+    Đặc trưng hình thái PPG theo beat (đoạn căn theo chân sóng ở cột before):
+    biên độ & thời gian lên tâm thu, khuyết mạch (cực đại đạo hàm bậc 2 sau đỉnh),
+    đỉnh tâm trương và chỉ số tăng áp AI = (P2 - chân) / (P1 - chân).
+    """
+    before = int(PPG_EPOCH_S[0] * fs) if before is None else before
+    n = len(epochs)
+    x = epochs - epochs[:, before][:, None]
+    d2 = np.diff(x, n=2, axis=1, prepend=np.nan, append=np.nan)
+
+    sys_idx = _masked_arg(x, np.full(n, before + int(0.05 * fs)), np.full(n, before + int(0.40 * fs)))
+    p1 = _take(x, sys_idx)
+    notch_idx = _masked_arg(d2, sys_idx + int(0.05 * fs), sys_idx + int(0.35 * fs))
+    notch_idx = np.where(sys_idx >= 0, notch_idx, -1)
+    dia_idx = _masked_arg(x, notch_idx + 1, notch_idx + int(0.25 * fs))
+    dia_idx = np.where(notch_idx >= 0, dia_idx, -1)
+    p2 = _take(x, dia_idx)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {
+            "ppg_amp": p1,
+            "rise_ms": np.where(sys_idx >= 0, (sys_idx - before) * 1000.0 / fs, np.nan),
+            "notch_ms": np.where(notch_idx >= 0, (notch_idx - before) * 1000.0 / fs, np.nan),
+            "notch_rel": _take(x, notch_idx) / p1,
+            "aug_index": p2 / p1,
+        }
+
+
+def morphology_table(ecg_raw, ir_raw, fs=FS, depth=TEMPLATE_DEPTH):
+    """
+    Batch trên cả file ghi: phát hiện mốc -> ma trận beat -> template trung vị chạy
+    -> đặc trưng + tương quan với template. Trả về (bảng ECG, bảng PPG) dạng DataFrame.
+    """
+    ecg_f, r_peaks, _, _ = process_ecg(np.asarray(ecg_raw, dtype=float), fs)
+    ppg = -np.asarray(ir_raw, dtype=float)
+    _, _, feet = process_ppg(ppg, fs)
+    ppg_m = butter_bandpass_filter(ppg, *PPG_MORPH_BAND, fs)
+
+    tables = []
+    for sig, anchors, (b_s, a_s), feat in ((ecg_f, r_peaks, ECG_EPOCH_S, ecg_features),
+                                            (ppg_m, feet, PPG_EPOCH_S, ppg_features)):
+        before, after = int(b_s * fs), int(a_s * fs)
+        epochs, valid = epoch_matrix(sig, anchors, before, after)
+        templates = running_templates(epochs, depth)
+        df = pd.DataFrame(feat(epochs, fs, before))
+        df.insert(0, "index", anchors)
+        df.insert(1, "t_s", anchors / fs)
+        df["template_corr"] = row_corr(epochs, templates)
+        df["complete"] = valid
+        tables.append(df)
+    return tables[0], tables[1]
+
+
+if __name__ == "__main__":
+    from gap_resample import load_resampled
+    parser = argparse.ArgumentParser(description="Template beat và đặc trưng hình thái ECG / PPG")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE, help="File CSV kết quả (ECG và PPG nối dọc)")
+    args = parser.parse_args()
+
+    tables = []
+    for path in args.files or list_recordings():
+        rec, _ = load_resampled(path)
+        ecg_df, ppg_df = morphology_table(rec["ECG"], rec["IR"])
+        for kind, df in (("ECG", ecg_df), ("PPG", ppg_df)):
+            df.insert(0, "recording", rec["name"])
+            df.insert(1, "signal", kind)
+            tables.append(df)
+        print(f"{rec['name']}: {len(ecg_df)} beat ECG (QRS {ecg_df['qrs_ms'].median():.0f} ms, "
+              f"corr {ecg_df['template_corr'].median():.2f}) | {len(ppg_df)} beat PPG "
+              f"(AI {ppg_df['aug_index'].median():.2f}, corr {ppg_df['template_corr'].median():.2f})")
+    pd.concat(tables, ignore_index=True).to_csv(args.output, index=False)
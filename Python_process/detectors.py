@@ -0,0 +1,99 @@
+from functools import lru_cache
+
+import numpy as np
+import scipy.signal as signal
+
+import kernels
+
+# CẤU HÌNH HỆ THỐNG
+FS = 1000  # Tần số lấy mẫu (Hz)
+
+# Tham số mặc định (giống Filter_signal.py)
+QRS_WINDOW_S = 0.05      # Cửa sổ tìm Q/S quanh đỉnh R
+FOOT_WINDOW_S = 0.3      # Cửa sổ tìm chân sóng PPG trước đỉnh tâm thu
+PEAK_DISTANCE_S = 0.4    # Khoảng cách tối thiểu giữa 2 đỉnh
+R_HEIGHT = 0.6           # Ngưỡng đỉnh R = max * hệ số
+R_DETECTOR = "fixed"     # "fixed": find_peaks với ngưỡng max * R_HEIGHT; "adaptive": kernels.adaptive_qrs
+# Lọc float32 khi tần số cắt thấp >= 0.5Hz (sai số < 1e-3 biên độ, đo bằng dtype_check.py).
+# Cắt thấp hơn (PPG 0.1Hz: cực sát vòng tròn đơn vị) float32 sai tới ~3% -> giữ float64.
+FLOAT32_MIN_LOWCUT_HZ = 0.5
+
+
+def filter_dtype(lowcut):
+    return np.float32 if lowcut >= FLOAT32_MIN_LOWCUT_HZ else np.float64
+
+
+@lru_cache(maxsize=None)
+def _bandpass_sos(order, lowcut, highcut, fs):
+    return signal.butter(order, [lowcut, highcut], btype='band', fs=fs, output='sos')
+
+
+@lru_cache(maxsize=None)
+def _notch_sos(cutoff, Q, fs):
+    return signal.tf2sos(*signal.iirnotch(cutoff, Q, fs))
+
+
+def sos_filtfilt(sos, data, dtype=np.float64):
+    """
+    filtfilt dạng SOS với kiểu tính toán dtype. Trừ trung bình trước khi lọc (bộ lọc chặn DC
+    nên kết quả không đổi) để float32 không mất độ chính xác với DC lớn (IR ~30000).
+    """
+    x = np.asarray(data, dtype=dtype)
+    if len(x) == 0:
+        return x
+    x = x - dtype(x.mean(dtype=np.float64))
+    return signal.sosfiltfilt(sos.astype(dtype), x)
+
+
+def butter_bandpass_filter(data, lowcut, highcut, fs=FS, order=2, dtype=None):
+    """Bộ lọc Bandpass kỹ thuật số (dtype=None: float32 nếu tần số cắt cho phép, xem filter_dtype)"""
+    sos = _bandpass_sos(order, lowcut, highcut, fs)
+    return sos_filtfilt(sos, data, dtype or filter_dtype(lowcut))
+
+
+def notch_filter(data, cutoff=50.0, fs=FS, Q=30, dtype=None):
+    """Bộ lọc Notch để loại bỏ nhiễu nguồn điện (50Hz) - giữ kiểu float của đầu vào nếu có"""
+    x = np.asarray(data)
+    if dtype is None:
+        dtype = x.dtype.type if np.issubdtype(x.dtype, np.floating) else np.float64
+    x = x.astype(dtype, copy=False)
+    return signal.sosfiltfilt(_notch_sos(cutoff, Q, fs).astype(dtype), x)
+
+
+def window_argmin(x, centers, before, after):
+    """
+    argmin của x trong cửa sổ [c - before, c + after) cho mọi c cùng lúc. Trả về chỉ số tuyệt đối.
+    Chạy bằng kernels.window_argmin (numba nếu có, ngược lại 1 phép strided NumPy).
+    """
+    return kernels.window_argmin(x, centers, before, after)
+
+
+def process_ecg(ecg_raw, fs=FS, lowcut=0.5, highcut=49, order=2,
+                distance_s=PEAK_DISTANCE_S, height=R_HEIGHT, dtype=None, detector=R_DETECTOR):
+    """
+    Xử lý ECG: Bandpass + Notch + Find Peaks (R) + Q/S.
+    detector="adaptive": ngưỡng thích nghi kiểu Pan-Tompkins (bền hơn khi biên độ R thay đổi / có nhiễu lớn).
+    Trả về (filtered, r_peaks, q_points, s_points) - chỉ số nguyên.
+    """
+    filtered = butter_bandpass_filter(ecg_raw, lowcut, highcut, fs, order, dtype)
+    filtered = notch_filter(filtered, 50, fs)
+
+    if detector == "adaptive":
+        r_peaks = kernels.adaptive_qrs(filtered, fs)
+    else:
+        r_peaks, _ = signal.find_peaks(filtered, distance=fs * distance_s, height=np.max(filtered) * height)
+    window = int(QRS_WINDOW_S * fs)
+    q_points = window_argmin(filtered, r_peaks, window, 0)
+    s_points = window_argmin(filtered, r_peaks, 0, window)
+    return filtered, r_peaks, q_points, s_points
+
+
+def process_ppg(ppg_raw, fs=FS, lowcut=0.1, highcut=5, order=2, distance_s=PEAK_DISTANCE_S, dtype=None):
+    """
+    Xử lý PPG (đã đảo ngược để đỉnh hướng lên): Bandpass + đỉnh tâm thu + chân sóng.
+    Trả về (filtered, peaks, feet) - chỉ số nguyên.
+    """
+    filtered = butter_bandpass_filter(ppg_raw, lowcut, highcut, fs, order, dtype)
+    peaks, _ = signal.find_peaks(filtered, distance=fs * distance_s, height=np.mean(filtered))
+    feet = window_argmin(filtered, peaks, int(FOOT_WINDOW_S * fs), 0)
+    return filtered, peaks, feet
@@ -0,0 +1,180 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from recording_io import FS, COLUMNS, list_recordings, load_recording, save_compact, recording_nbytes
+from detectors import PEAK_DISTANCE_S, R_HEIGHT, process_ecg, process_ppg, butter_bandpass_filter, notch_filter
+
+# Đối chiếu đường xử lý kiểu gọn (int16/int32 + lọc float32) với đường float64 / int64 cũ
+# và đo bộ nhớ + băng thông đọc trên các file ghi có sẵn.
+
+# CẤU HÌNH
+MAX_REL_ERR = 1e-3       # Sai số tối đa của tín hiệu đã lọc / biên độ đỉnh-đỉnh
+PEAK_TOL = 2             # Đỉnh lệch <= 2 mẫu (2ms) coi là trùng
+HR_TOL_BPM = 0.5
+
+
+def _best_time(fn, repeat=3):
+    best, out = np.inf, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def rel_err(a, b):
+    return float(np.max(np.abs(a.astype(np.float64) - b)) / max(np.ptp(b), 1e-12))
+
+
+def _miss(x, y, tol=PEAK_TOL):
+    """Các đỉnh của x không có đỉnh nào của y trong ±tol mẫu"""
+    x, y = np.asarray(x), np.asarray(y)
+    if len(x) == 0 or len(y) == 0:
+        return x
+    j = np.clip(np.searchsorted(y, x), 1, len(y) - 1) if len(y) > 1 else np.zeros(len(x), dtype=int)
+    d = np.minimum(np.abs(x - y[j]), np.abs(x - y[np.maximum(j - 1, 0)]))
+    return x[d > tol]
+
+
+def unmatched(a, b, tol=PEAK_TOL):
+    """Số đỉnh của a không có đỉnh nào của b trong ±tol mẫu (và ngược lại)"""
+    return len(_miss(a, b, tol)) + len(_miss(b, a, tol))
+
+
+def marginal_mismatches(x32, x64, p32, p64, distance, height=R_HEIGHT, tol=PEAK_TOL):
+    """
+    Xét TỪNG đỉnh lệch (có ở 1 đường, không có ở đường kia): (số lệch giải thích được, số không giải thích được).
+    Cực đại địa phương là "sát biên" khi trong sai số float32 (err = max|x32 - x64|) nó có thể đổi quyết định
+    của find_peaks: biên độ cách ngưỡng height*max <= 2*err, hoặc cách 1 cực đại cạnh tranh trong ±distance
+    <= 2*err. 1 quyết định đổi kéo theo cả chuỗi đỉnh (cách nhau <= distance) bị loại / được giữ theo nó,
+    nên đỉnh lệch chỉ được giải thích khi cùng chuỗi với 1 cực đại sát biên; mọi đỉnh lệch khác là lỗi thật.
+    """
+    miss = np.sort(np.concatenate((_miss(p32, p64, tol), _miss(p64, p32, tol))))
+    if len(miss) == 0:
+        return 0, 0
+    err = float(np.max(np.abs(x32.astype(np.float64) - x64)))
+    margin = 2 * err
+    thr = height * np.max(x64)
+    band = margin + height * err          # Ngưỡng của đường float32 cũng lệch tới height*err
+    cand = np.flatnonzero((x64[1:-1] > x64[:-2]) & (x64[1:-1] >= x64[2:])) + 1
+    cand = cand[x64[cand] >= thr - band]  # Cực đại thấp hơn ngưỡng không bao giờ được chọn
+    v = x64[cand]
+    edge = np.abs(v - thr) <= band
+    # Cặp cực đại gần nhau (trong distance) có biên độ gần bằng nhau
+    j = np.searchsorted(cand, cand + distance, side='right')
+    for k in np.flatnonzero(~edge):
+        near = np.abs(v[k + 1:j[k]] - v[k]) <= margin
+        if np.any(near):
+            edge[k] = True
+            edge[k + 1:j[k]] |= near
+    marg = cand[edge]
+
+    # Chuỗi: các đỉnh lệch + cực đại sát biên, liên kết khi cách nhau <= distance
+    pts = np.concatenate((miss, marg))
+    is_miss = np.concatenate((np.ones(len(miss), bool), np.zeros(len(marg), bool)))
+    order = np.argsort(pts, kind='stable')
+    pts, is_miss = pts[order], is_miss[order]
+    chain = np.concatenate(([0], np.cumsum(np.diff(pts) > distance)))
+    has_marg = np.zeros(chain[-1] + 1, bool)
+    has_marg[chain[~is_miss]] = True
+    explained = int(np.count_nonzero(has_marg[chain[is_miss]]))
+    return explained, len(miss) - explained
+
+
+def _hr(r_peaks, fs=FS):
+    return 60.0 * fs / np.median(np.diff(r_peaks)) if len(r_peaks) > 2 else np.nan
+
+
+def check_dsp(rec, fs=FS):
+    """Các bước lọc / phát hiện đỉnh: kiểu gọn vs float64. Trả về dict kết quả + thời gian."""
+    out = {}
+    t32, (e32, r32, _, _) = _best_time(lambda: process_ecg(rec["ECG"], fs))
+    t64, (e64, r64, _, _) = _best_time(lambda: process_ecg(rec["ECG"].astype(np.float64), fs, dtype=np.float64))
+    explained, unexplained = marginal_mismatches(e32, e64, r32, r64, int(PEAK_DISTANCE_S * fs))
+    out["ecg"] = {"dtype": e32.dtype.name, "rel_err": rel_err(e32, e64), "peaks": len(r64),
+                  "peak_miss": unmatched(r32, r64), "hr_diff": abs(_hr(r32) - _hr(r64)),
+                  "marginal": explained, "unexplained": unexplained, "t32": t32, "t64": t64}
+
+    ppg = -rec["IR"]
+    t32, (p32, k32, _) = _best_time(lambda: process_ppg(ppg, fs))
+    t64, (p64, k64, _) = _best_time(lambda: process_ppg(ppg.astype(np.float64), fs, dtype=np.float64))
+    out["ppg"] = {"dtype": p32.dtype.name, "rel_err": rel_err(p32, p64), "peaks": len(k64),
+                  "peak_miss": unmatched(k32, k64), "t32": t32, "t64": t64}
+
+    # Bộ lọc hiển thị của live monitor (PCG 20-400Hz + notch, PPG 0.5-5Hz)
+    t32, c32 = _best_time(lambda: butter_bandpass_filter(notch_filter(rec["PCG"].astype(np.float32)), 20, 400, fs))
+    t64, c64 = _best_time(lambda: butter_bandpass_filter(notch_filter(rec["PCG"].astype(np.float64)), 20, 400, fs,
+                                                         dtype=np.float64))
+    out["pcg"] = {"dtype": c32.dtype.name, "rel_err": rel_err(c32, c64), "t32": t32, "t64": t64}
+    t32, v32 = _best_time(lambda: butter_bandpass_filter(ppg, 0.5, 5, fs))
+    t64, v64 = _best_time(lambda: butter_bandpass_filter(ppg, 0.5, 5, fs, dtype=np.float64))
+    out["ppg_live"] = {"dtype": v32.dtype.name, "rel_err": rel_err(v32, v64), "t32": t32, "t64": t64}
+    return out
+
+
+def check_io(path, tmp_dir):
+    """Bộ nhớ + băng thông đọc: CSV int64 / CSV kiểu gọn / .npy nhị phân"""
+    t_wide, wide = _best_time(lambda: load_recording(path, compact=False))
+    t_csv, rec = _best_time(lambda: load_recording(path))
+    for name in COLUMNS:
+        if not np.array_equal(rec[name], wide[name]):
+            raise SystemExit(f"{path}: cột {name} khác nhau giữa int64 và kiểu gọn")
+    npy = save_compact(rec, os.path.join(tmp_dir, rec["name"] + ".npy"))
+    t_npy, _ = _best_time(lambda: {k: np.array(v) for k, v in load_recording(npy).items() if k in COLUMNS})
+    return rec, {"mem_wide": recording_nbytes(wide), "mem": recording_nbytes(rec),
+                 "csv_bytes": os.path.getsize(path), "npy_bytes": os.path.getsize(npy),
+                 "t_wide": t_wide, "t_csv": t_csv, "t_npy": t_npy}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đối chiếu kiểu dữ liệu gọn với float64 + đo bộ nhớ / băng thông")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("--convert", metavar="DIR", help="Lưu bản nhị phân .npy (SAMPLE_DTYPE) vào DIR")
+    args = parser.parse_args()
+
+    failed, marginal = [], []
+    tot = dict.fromkeys(["mem_wide", "mem", "csv_bytes", "npy_bytes", "t_wide", "t_csv", "t_npy",
+                         "dsp32", "dsp64"], 0.0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in args.files or list_recordings():
+            rec, io = check_io(path, args.convert or tmp)
+            dsp = check_dsp(rec)
+            for k in ("mem_wide", "mem", "csv_bytes", "npy_bytes", "t_wide", "t_csv", "t_npy"):
+                tot[k] += io[k]
+            tot["dsp32"] += sum(v["t32"] for v in dsp.values())
+            tot["dsp64"] += sum(v["t64"] for v in dsp.values())
+
+            e, p = dsp["ecg"], dsp["ppg"]
+            print(f"{rec['name']:7s} RAM {io['mem_wide'] / 1e6:6.2f} -> {io['mem'] / 1e6:5.2f} MB"
+                  f" | ECG {e['dtype']} err {e['rel_err']:.1e}, R lệch {e['peak_miss']}/{e['peaks']}"
+                  f" | PPG {p['dtype']} err {p['rel_err']:.1e}, đỉnh lệch {p['peak_miss']}/{p['peaks']}"
+                  f" | PCG err {dsp['pcg']['rel_err']:.1e} | PPG live err {dsp['ppg_live']['rel_err']:.1e}")
+            bad = [k for k, v in dsp.items() if v["rel_err"] > MAX_REL_ERR]
+            if e["unexplained"]:
+                bad.append(f"ecg peaks ({e['unexplained']} lệch không do sát ngưỡng)")
+            elif e["hr_diff"] > HR_TOL_BPM and not e["marginal"]:
+                bad.append(f"ecg HR lệch {e['hr_diff']:.1f} bpm")
+            if p["peak_miss"]:
+                bad.append("ppg peaks")
+            if bad:
+                failed.append(f"{rec['name']}: {', '.join(bad)}")
+            elif e["marginal"]:
+                marginal.append(f"{rec['name']} ({e['marginal']} đỉnh, HR lệch {e['hr_diff']:.1f} bpm)")
+
+    print(f"\nBộ nhớ các kênh: {tot['mem_wide'] / 1e6:.1f} MB (int64) -> {tot['mem'] / 1e6:.1f} MB"
+          f" ({100 * (1 - tot['mem'] / tot['mem_wide']):.0f}% ít hơn)")
+    print(f"Dung lượng file: CSV {tot['csv_bytes'] / 1e6:.1f} MB -> .npy {tot['npy_bytes'] / 1e6:.1f} MB")
+    print(f"Đọc: CSV int64 {tot['t_wide']:.2f}s | CSV kiểu gọn {tot['t_csv']:.2f}s | .npy {tot['t_npy'] * 1000:.1f}ms"
+          f" ({tot['mem'] / 1e6 / max(tot['t_npy'], 1e-9):.0f} MB/s)")
+    print(f"Lọc + phát hiện đỉnh: float64 {tot['dsp64'] * 1000:.0f} ms -> kiểu gọn {tot['dsp32'] * 1000:.0f} ms")
+    if marginal:
+        # Không phải lỗi làm tròn bị che đi: float32 và float64 cho kết quả KHÁC nhau thật, vì có cực đại nằm
+        # trong sai số float32 quanh ngưỡng / đỉnh cạnh tranh (bộ phát hiện nhạy với chính quyết định đó)
+        print("CẢNH BÁO - đỉnh R khác nhau do cực đại sát ngưỡng / sát đỉnh cạnh tranh (trong sai số float32): "
+              + ", ".join(marginal))
+    if failed:
+        raise SystemExit("Vượt ngưỡng sai số:\n  " + "\n  ".join(failed))
+    print(f"Tất cả trong ngưỡng (sai số < {MAX_REL_ERR:g}, đỉnh lệch <= {PEAK_TOL} mẫu).")
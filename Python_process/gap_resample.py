@@ -0,0 +1,123 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+from recording_io import TARGET_INTERVAL_US, list_recordings, load_recording
+from kernels import scan_gaps
+
+# CẤU HÌNH
+CHANNELS = ["PCG", "RED", "IR", "ECG"]
+REPORT_FILE = "gap_report.csv"
+MIN_PERSIST = 20           # Bước nhảy phải kéo dài >= 20 mẫu mới tính là mất mẫu (chuỗi mẫu trễ dài nhất quan sát: 5)
+
+
+def assign_slots(ts, interval=TARGET_INTERVAL_US, min_persist=MIN_PERSIST):
+    """
+    Gán mỗi mẫu vào 1 slot trên lưới đều (vector hóa, 1 lượt).
+
+    Mẫu thứ i lấy tại tick j_i cộng độ trễ đánh thức late_i của processing_task
+    (0 <= late < ~800us, quan sát từ dữ liệu: dt dao động 250..1770us).
+    Phần dư r_i = ts_i - ts_0 - i*T = D_i*T + (late_i - late_0), với D_i = số mẫu mất
+    tích lũy (không giảm). Min lũy kế từ cuối về loại bỏ phần jitter và chỉ giữ
+    bước nhảy do mất mẫu, nên D_i = round((min_{k>=i} r_k - min r) / T).
+    min_persist mẫu cuối mỗi đoạn có quá ít mẫu phía sau để lấy min (vài mẫu trễ liên tiếp
+    sẽ bị làm tròn thành 1 mẫu mất giả) -> giữ nguyên mức sàn của mẫu cuối còn đủ min_persist mẫu sau nó.
+    ESP32 khởi động lại (timestamp chạy lùi) tạo đoạn mới nối tiếp ngay sau đoạn trước.
+    Trả về (slot, lateness_us, resets).
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(ts) < 0) + 1
+    edges = np.concatenate(([0], breaks, [len(ts)]))
+
+    slot = np.empty(len(ts), dtype=np.int64)
+    lateness = np.empty(len(ts), dtype=np.float64)
+    next_slot = 0
+    for s, e in zip(edges[:-1], edges[1:]):
+        idx = np.arange(e - s, dtype=np.int64)
+        r = (ts[s:e] - ts[s] - idx * interval).astype(np.float64)
+        floor = np.minimum.accumulate(r[::-1])[::-1]
+        tail = max(e - s - min_persist, 0)
+        floor[tail:] = floor[tail]
+        lost = np.rint((floor - floor[0]) / interval).astype(np.int64)
+        slot[s:e] = idx + lost + next_slot
+        lateness[s:e] = r - lost * interval - floor[0]
+        next_slot = slot[e - 1] + 1
+    return slot, lateness, len(breaks)
+
+
+def resample_recording(rec, interval=TARGET_INTERVAL_US):
+    """
+    Dựng lại lưới thời gian đều từ timestamp ESP32.
+    - Slot bị thiếu (gói bị DROP ở logging_queue): nội suy tuyến tính, đánh dấu Valid=False
+    Trả về (rec_uniform, report).
+    """
+    ts = np.asarray(rec["Timestamp"], dtype=np.int64)
+    slot, lateness, resets = assign_slots(ts, interval)
+    n_slots = int(slot[-1] + 1) if len(slot) else 0
+
+    valid = np.zeros(n_slots, dtype=bool)
+    valid[slot] = True
+    grid = np.arange(n_slots)
+
+    out = {"name": rec.get("name", ""), "has_timestamp": rec.get("has_timestamp", True)}
+    # Trục thời gian đã hiệu chỉnh: nội suy timestamp thực qua các slot
+    out["Timestamp"] = np.rint(np.interp(grid, slot, ts)).astype(np.int64)
+    for ch in CHANNELS:
+        if ch not in rec:
+            continue
+        vals = np.asarray(rec[ch])
+        filled = np.interp(grid, slot, vals.astype(np.float64))
+        out[ch] = np.rint(filled).astype(vals.dtype) if np.issubdtype(vals.dtype, np.integer) else filled
+    out["Valid"] = valid
+
+    # Báo cáo mất mẫu / jitter
+    step = np.diff(slot)
+    gap_idx = np.flatnonzero(step > 1)
+    gap_len = step[gap_idx] - 1
+    lost = int(n_slots - len(slot))
+    report = {
+        "recording": out["name"],
+        "has_timestamp": out["has_timestamp"],
+        "samples": len(ts),
+        "slots": n_slots,
+        "lost": lost,
+        # Cách đếm của store_data.py lúc ghi (từng khoảng > 1050us, không bù jitter) để đối chiếu
+        "logger_lost": int(scan_gaps(ts, interval)[1].sum()),
+        "loss_pct": 100.0 * lost / n_slots if n_slots else 0.0,
+        "gaps": len(gap_idx),
+        "max_gap_ms": float(gap_len.max() * interval / 1000) if len(gap_len) else 0.0,
+        "resets": resets,
+        "jitter_std_us": float(np.std(lateness)),
+        "jitter_p99_us": float(np.percentile(np.abs(lateness), 99)) if len(lateness) else 0.0,
+        "gap_list": [(int(slot[i] + 1), int(n)) for i, n in zip(gap_idx, gap_len)],
+    }
+    return out, report
+
+
+def load_resampled(path):
+    """Đọc file ghi và trả về bản đã đưa về lưới đều (dùng cho các bước phân tích)"""
+    return resample_recording(load_recording(path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Phát hiện mất mẫu / jitter và dựng lại lưới 1000Hz")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("-o", "--output", default=REPORT_FILE, help="File CSV báo cáo")
+    parser.add_argument("--write", metavar="DIR", help="Ghi file đã resample (thêm cột Valid) vào thư mục")
+    args = parser.parse_args()
+
+    rows = []
+    for path in args.files or list_recordings():
+        uniform, report = load_resampled(path)
+        rows.append(report)
+        if args.write:
+            os.makedirs(args.write, exist_ok=True)
+            cols = ["Timestamp"] + [c for c in CHANNELS if c in uniform] + ["Valid"]
+            pd.DataFrame({c: uniform[c] for c in cols}).to_csv(
+                os.path.join(args.write, f"{uniform['name']}_uniform.csv"), index=False)
+
+    table = pd.DataFrame(rows)
+    print("=== BÁO CÁO MẤT MẪU / JITTER ===")
+    print(table.drop(columns="gap_list").to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    table.to_csv(args.output, index=False)
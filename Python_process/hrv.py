@@ -0,0 +1,201 @@
+import time
+import argparse
+import numpy as np
+import scipy.signal as signal
+
+from recording_io import FS, list_recordings
+
+# CẤU HÌNH
+WINDOWS_S = (60, 300)          # Cửa sổ trượt 1 phút và 5 phút
+STEP_S = 30                    # Bước trượt (batch)
+RR_RANGE_MS = (300, 2000)      # RR hợp lệ sinh lý
+ECTOPIC_TOL = 0.2              # Lệch > 20% so với trung vị cục bộ -> loại (ngoại tâm thu / đỉnh giả)
+LF_BAND = (0.04, 0.15)
+HF_BAND = (0.15, 0.40)
+LS_FREQS = np.linspace(0.01, 0.5, 128)   # Lưới tần số Lomb-Scargle (Hz)
+OUTPUT_FILE = "hrv_windows.csv"
+
+
+def clean_rr(rr_ms, tol=ECTOPIC_TOL, k=5):
+    """Mặt nạ NN hợp lệ: trong khoảng sinh lý và không lệch quá tol so với trung vị trượt k beat"""
+    rr = np.asarray(rr_ms, dtype=float)
+    ok = (rr >= RR_RANGE_MS[0]) & (rr <= RR_RANGE_MS[1])
+    if len(rr) >= k:
+        pad = k // 2
+        padded = np.pad(rr, pad, mode='edge')
+        med = np.median(np.lib.stride_tricks.sliding_window_view(padded, k), axis=1)
+        ok &= np.abs(rr - med) <= tol * med
+    return ok
+
+
+def _csum(x):
+    """Tổng tích lũy có 0 ở đầu: sum(x[s:e]) = c[e] - c[s]"""
+    return np.concatenate(([0.0], np.cumsum(x, dtype=np.float64)))
+
+
+def window_metrics(rr_ms, ok, starts, ends):
+    """
+    Chỉ số miền thời gian cho nhiều cửa sổ [start, end) (chỉ số beat) cùng lúc bằng tổng tích lũy:
+    mỗi cửa sổ O(1) bất kể độ dài. Cặp sai phân chỉ tính khi cả 2 beat hợp lệ.
+    """
+    rr = np.where(ok, rr_ms, 0.0)
+    c_n, c_x, c_x2 = _csum(ok), _csum(rr), _csum(rr * rr)
+
+    d = np.diff(rr_ms)
+    pair_ok = ok[1:] & ok[:-1]
+    d = np.where(pair_ok, d, 0.0)
+    c_p, c_d2, c_50 = _csum(pair_ok), _csum(d * d), _csum(pair_ok & (np.abs(d) > 50))
+
+    starts = np.asarray(starts)
+    ends = np.asarray(ends)
+    n = c_n[ends] - c_n[starts]
+    # Cặp (i, i+1) nằm trong cửa sổ khi start <= i < end - 1
+    p_end = np.maximum(ends - 1, starts)
+    n_pairs = c_p[p_end] - c_p[starts]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (c_x[ends] - c_x[starts]) / n
+        var = (c_x2[ends] - c_x2[starts]) / n - mean * mean
+        sdnn = np.sqrt(np.maximum(var, 0.0))
+        rmssd = np.sqrt((c_d2[p_end] - c_d2[starts]) / n_pairs)
+        pnn50 = 100.0 * (c_50[p_end] - c_50[starts]) / n_pairs
+    return {"n_beats": n, "mean_nn_ms": mean, "hr_bpm": 60000.0 / mean,
+            "sdnn_ms": sdnn, "rmssd_ms": rmssd, "pnn50": pnn50}
+
+
+def lomb_lf_hf(t_s, rr_ms, freqs=LS_FREQS):
+    """Công suất LF / HF (ms^2) bằng Lomb-Scargle trên chuỗi RR không đều (không cần nội suy)"""
+    if len(t_s) < 16:
+        return np.nan, np.nan
+    x = np.asarray(rr_ms, dtype=float) - np.mean(rr_ms)
+    t = np.asarray(t_s, dtype=float)
+    p = signal.lombscargle(t, x, 2 * np.pi * freqs)
+    # Quy đổi về ms^2: tổng P * 2*df*T/N xấp xỉ phương sai của thành phần trong dải
+    df = freqs[1] - freqs[0]
+    power = p * 2 * df * (t[-1] - t[0]) / len(t)
+    lf = power[(freqs >= LF_BAND[0]) & (freqs < LF_BAND[1])].sum()
+    hf = power[(freqs >= HF_BAND[0]) & (freqs < HF_BAND[1])].sum()
+    return lf, hf
+
+
+def rolling_hrv(beat_t_s, rr_ms, window_s=300, step_s=STEP_S, freq_domain=True):
+    """
+    HRV theo cửa sổ trượt trên cả bản ghi.
+    beat_t_s: thời điểm kết thúc mỗi RR (s); rr_ms: khoảng RR (ms).
+    Trả về DataFrame, mỗi dòng 1 cửa sổ (t_end = thời điểm cuối cửa sổ).
+    """
+    import pandas as pd  # Chỉ cần cho batch; HRVTracker (live / headless) không tải pandas
+    t = np.asarray(beat_t_s, dtype=float)
+    rr = np.asarray(rr_ms, dtype=float)
+    if len(t) == 0:
+        return pd.DataFrame()
+    ok = clean_rr(rr)
+
+    t_end = np.arange(t[0] + window_s, t[-1] + step_s, step_s)
+    ends = np.searchsorted(t, t_end, side='right')
+    starts = np.searchsorted(t, t_end - window_s, side='right')
+    res = window_metrics(rr, ok, starts, ends)
+    res["t_end_s"] = t_end
+    res["window_s"] = np.full(len(t_end), window_s)
+
+    if freq_domain:
+        lf = np.full(len(t_end), np.nan)
+        hf = np.full(len(t_end), np.nan)
+        for i, (s, e) in enumerate(zip(starts, ends)):
+            m = ok[s:e]
+            lf[i], hf[i] = lomb_lf_hf(t[s:e][m], rr[s:e][m])
+        res["lf_ms2"], res["hf_ms2"] = lf, hf
+        with np.errstate(invalid='ignore', divide='ignore'):
+            res["lf_hf"] = lf / hf
+    return pd.DataFrame(res)
+
+
+class HRVTracker:
+    """
+    Bản incremental cho live monitor: nạp từng đỉnh R, giữ các beat trong cửa sổ dài nhất,
+    và tính lại bằng đúng window_metrics / lomb_lf_hf trên phần đuôi (chi phí giới hạn theo cửa sổ).
+    """
+    def __init__(self, fs=FS, windows_s=WINDOWS_S):
+        self.fs = fs
+        self.windows_s = windows_s
+        self.t = np.empty(0)
+        self.rr = np.empty(0)
+        self._last_r = None
+
+    def add_r_peaks(self, r_abs):
+        """Đỉnh R (chỉ số mẫu tuyệt đối, có thể lặp lại giữa các lần gọi). Trả về số beat mới."""
+        new_t, new_rr = [], []
+        for r in r_abs:
+            if self._last_r is not None and r <= self._last_r + 0.2 * self.fs:
+                continue
+            if self._last_r is not None:
+                new_t.append(r / self.fs)
+                new_rr.append((r - self._last_r) * 1000.0 / self.fs)
+            self._last_r = int(r)
+        if new_t:
+            self.t = np.concatenate((self.t, new_t))
+            self.rr = np.concatenate((self.rr, new_rr))
+            keep = self.t > self.t[-1] - max(self.windows_s)
+            self.t, self.rr = self.t[keep], self.rr[keep]
+        return len(new_t)
+
+    def metrics(self, window_s=None, freq_domain=False):
+        """Chỉ số HRV của cửa sổ window_s gần nhất (mặc định: cửa sổ ngắn nhất)"""
+        window_s = window_s or min(self.windows_s)
+        if len(self.t) < 3:
+            return {}
+        ok = clean_rr(self.rr)
+        end = len(self.t)
+        start = int(np.searchsorted(self.t, self.t[-1] - window_s, side='right'))
+        res = {k: float(v[0]) for k, v in window_metrics(self.rr, ok, [start], [end]).items()}
+        if freq_domain:
+            m = ok[start:end]
+            res["lf_ms2"], res["hf_ms2"] = lomb_lf_hf(self.t[start:end][m], self.rr[start:end][m])
+        return res
+
+
+def rr_from_recording(rec, fs=FS, detector=None):
+    """Phát hiện đỉnh R trên cả bản ghi -> (thời điểm beat s, RR ms), qua BeatTable như live monitor"""
+    from detectors import R_DETECTOR, process_ecg
+    from beat_table import BeatTable
+    _, r_peaks, _, _ = process_ecg(np.asarray(rec["ECG"], dtype=float), fs, detector=detector or R_DETECTOR)
+    table = BeatTable(fs, capacity=max(len(r_peaks), 1))
+    table.extend(r_peaks)
+    rr, _ = table.rr_ms()
+    return table.data["r"][1:] / fs, rr[1:]
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    from gap_resample import load_resampled
+    parser = argparse.ArgumentParser(description="HRV theo cửa sổ trượt (SDNN, RMSSD, pNN50, LF/HF)")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE, help="File CSV kết quả")
+    parser.add_argument("--qrs", choices=["fixed", "adaptive"], default=None,
+                        help="Bộ phát hiện đỉnh R (mặc định: detectors.R_DETECTOR)")
+    parser.add_argument("--benchmark-hours", type=float, default=0,
+                        help="Đo tốc độ trên chuỗi RR tổng hợp dài N giờ")
+    args = parser.parse_args()
+
+    if args.benchmark_hours:
+        from synthetic_signals import beat_schedule
+        beats, _ = beat_schedule(args.benchmark_hours * 3600, hr=60, hrv=0.08)
+        t0 = time.perf_counter()
+        tables = [rolling_hrv(beats[1:], np.diff(beats) * 1000, w) for w in WINDOWS_S]
+        dt = time.perf_counter() - t0
+        print(f"{len(beats)} beat, {sum(len(x) for x in tables)} cửa sổ: {dt:.2f}s")
+        raise SystemExit(0)
+
+    tables = []
+    for path in args.files or list_recordings():
+        rec, _ = load_resampled(path)
+        t, rr = rr_from_recording(rec, detector=args.qrs)
+        for w in WINDOWS_S:
+            df = rolling_hrv(t, rr, w)
+            if len(df):
+                df.insert(0, "recording", rec["name"])
+                tables.append(df)
+                print(f"{rec['name']} [{w}s]: {len(df)} cửa sổ | SDNN {df['sdnn_ms'].median():.1f} ms"
+                      f" | RMSSD {df['rmssd_ms'].median():.1f} ms | LF/HF {df['lf_hf'].median():.2f}")
+    if tables:
+        pd.concat(tables, ignore_index=True).to_csv(args.output, index=False)
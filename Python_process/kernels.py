@@ -0,0 +1,292 @@
+"""
+Các kernel tuần tự (khó vector hóa) với 2 backend, dùng bởi:
+- window_argmin: detectors (Q / S / chân sóng PPG), param_sweep
+- adaptive_qrs: detectors.process_ecg(detector="adaptive") (hrv.py --qrs adaptive)
+- zoh_runs: signal_quality (ZOH của PPG, live)
+- scan_gaps: store_data.py (đếm mất mẫu khi ghi), gap_resample (cột logger_lost của báo cáo)
+Backend:
+- "numba": vòng lặp biên dịch JIT (chỉ CPU), tự chọn khi đã cài numba
+- "numpy": bản NumPy thuần, cho kết quả GIỐNG HỆT (chạy file này để đối chiếu + đo tốc độ).
+  Riêng ngưỡng thích nghi QRS là đệ quy thật sự: bản numpy chỉ vector hóa phần tìm ứng viên,
+  phần cập nhật ngưỡng vẫn là CHÍNH vòng lặp Python đó (nhanh hơn vòng lặp tham chiếu không đáng kể).
+Chọn backend thủ công bằng biến môi trường BIOSIG_KERNELS=numpy|numba hoặc set_backend().
+numba tốn thêm ~100MB RSS khi đã nạp: tiến trình headless trên máy yếu nên chạy BIOSIG_KERNELS=numpy
+(block SQI 100 mẫu / cửa sổ 10s của live monitor: bản numpy chỉ chậm hơn vài chục micro giây).
+"""
+import os
+import time
+import argparse
+import importlib.util
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Chỉ kiểm tra có cài numba; import (nạp LLVM, ~100MB RSS) để tới lần JIT đầu tiên
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None
+
+# CẤU HÌNH
+QRS_REFRACTORY_S = 0.25      # Thời gian trơ sau 1 đỉnh R
+QRS_THRESHOLD_K = 0.25       # Ngưỡng = NPK + k * (SPK - NPK) (Pan-Tompkins)
+QRS_LEARN_S = 2.0            # Khởi tạo SPK / NPK từ 2 giây đầu
+GAP_TOLERANCE_US = 50        # Giống store_data.py: > 1050us coi là mất mẫu
+
+_backend = os.environ.get("BIOSIG_KERNELS", "numba" if HAVE_NUMBA else "numpy")
+
+
+def set_backend(name):
+    global _backend
+    if name == "numba" and not HAVE_NUMBA:
+        raise ImportError("numba chưa được cài đặt")
+    if name not in ("numba", "numpy"):
+        raise ValueError(f"Backend không hợp lệ: {name}")
+    _backend = name
+
+
+def get_backend():
+    return _backend
+
+
+# --- VÒNG LẶP THAM CHIẾU (được numba biên dịch nguyên văn) ---
+def _qrs_loop(idx, val, refractory, spk, npk, k):
+    out = np.empty(len(idx), dtype=np.int64)
+    best = np.empty(len(idx))
+    n = 0
+    for j in range(len(idx)):
+        i = idx[j]
+        v = val[j]
+        if v > npk + k * (spk - npk):
+            if n > 0 and i - out[n - 1] < refractory:
+                # Trong thời gian trơ: chỉ giữ đỉnh cao hơn
+                if v > best[n - 1]:
+                    out[n - 1] = i
+                    best[n - 1] = v
+            else:
+                out[n] = i
+                best[n] = v
+                n += 1
+            spk = 0.125 * v + 0.875 * spk
+        else:
+            npk = 0.125 * v + 0.875 * npk
+    return out[:n]
+
+
+def _argmin_loop(x, centers, before, after):
+    n = len(x)
+    out = np.empty(len(centers), dtype=np.int64)
+    for j in range(len(centers)):
+        c = centers[j]
+        best = c - before          # Cửa sổ nằm ngoài biên hoàn toàn: giống argmin trên toàn +inf
+        best_v = np.inf
+        for i in range(max(c - before, 0), min(c + after, n)):
+            if x[i] < best_v:      # '<': lấy vị trí đầu tiên khi bằng nhau, như np.argmin
+                best_v = x[i]
+                best = i
+        out[j] = best
+    return out
+
+
+def _zoh_loop(x):
+    n = len(x)
+    starts = np.empty(n, dtype=np.int64)
+    lengths = np.empty(n, dtype=np.int64)
+    m = 0
+    s = 0
+    for i in range(1, n):
+        if x[i] != x[i - 1]:
+            starts[m] = s
+            lengths[m] = i - s
+            m += 1
+            s = i
+    if n > 0:
+        starts[m] = s
+        lengths[m] = n - s
+        m += 1
+    return starts[:m], lengths[:m]
+
+
+def _gap_loop(ts, interval, tol):
+    idx = np.empty(len(ts), dtype=np.int64)
+    lost = np.empty(len(ts), dtype=np.int64)
+    m = 0
+    for i in range(1, len(ts)):
+        d = ts[i] - ts[i - 1]
+        if d > interval + tol:
+            idx[m] = i
+            lost[m] = (d - interval) // interval
+            m += 1
+    return idx[:m], lost[:m]
+
+
+_LOOPS = {"qrs": _qrs_loop, "argmin": _argmin_loop, "zoh": _zoh_loop, "gap": _gap_loop}
+_jit_cache = {}
+
+
+def _jit(name):
+    """Biên dịch lười: chỉ tốn thời gian JIT ở lần gọi đầu (cache=True lưu xuống đĩa)"""
+    if name not in _jit_cache:
+        import numba
+        _jit_cache[name] = numba.njit(cache=True)(_LOOPS[name])
+    return _jit_cache[name]
+
+
+def _use_numba(backend):
+    return (backend or _backend) == "numba" and HAVE_NUMBA
+
+
+# --- BẢN NUMPY THUẦN ---
+def _qrs_candidates(x):
+    """Cực đại địa phương dương (dùng chung cho cả 2 backend)"""
+    i = np.flatnonzero((x[1:-1] > x[:-2]) & (x[1:-1] >= x[2:]) & (x[1:-1] > 0)) + 1
+    return i.astype(np.int64), x[i]
+
+
+def _argmin_numpy(x, centers, before, after):
+    # 1 phép strided thay cho vòng lặp; phần ngoài biên được đệm +inf nên không bao giờ được chọn
+    padded = np.concatenate((np.full(before, np.inf, x.dtype), x, np.full(after, np.inf, x.dtype)))
+    windows = sliding_window_view(padded, before + after)[centers]
+    return centers - before + np.argmin(windows, axis=1)
+
+
+def _zoh_numpy(x):
+    if len(x) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(x[1:] != x[:-1]) + 1)).astype(np.int64)
+    return starts, np.diff(np.append(starts, len(x)))
+
+
+def _gap_numpy(ts, interval, tol):
+    d = np.diff(ts)
+    idx = np.flatnonzero(d > interval + tol)
+    return (idx + 1).astype(np.int64), ((d[idx] - interval) // interval).astype(np.int64)
+
+
+# --- API ---
+def adaptive_qrs(filtered, fs=1000, refractory_s=QRS_REFRACTORY_S, k=QRS_THRESHOLD_K, backend=None):
+    """
+    Phát hiện đỉnh R với ngưỡng thích nghi (mức tín hiệu SPK / mức nhiễu NPK cập nhật theo từng ứng viên),
+    chịu được biên độ R thay đổi tốt hơn ngưỡng cố định max * 0.6. Đầu vào: ECG đã lọc.
+    """
+    x = np.asarray(filtered, dtype=np.float64)
+    if len(x) < 3:
+        return np.empty(0, dtype=np.int64)
+    idx, val = _qrs_candidates(x)
+    learn = x[:int(QRS_LEARN_S * fs)]
+    spk, npk = 0.5 * learn.max(), 0.5 * np.abs(learn).mean()
+    fn = _jit("qrs") if _use_numba(backend) else _qrs_loop
+    return fn(idx, val, int(refractory_s * fs), spk, npk, k)
+
+
+def window_argmin(x, centers, before, after, backend=None):
+    """
+    argmin của x trong cửa sổ [c - before, c + after) cho mọi c (Q / S quanh đỉnh R, chân sóng PPG
+    trước đỉnh). Trả về chỉ số tuyệt đối; giữ kiểu float của x (float32 không bị đổi sang float64).
+    """
+    centers = np.asarray(centers, dtype=np.int64)
+    if len(centers) == 0 or before + after <= 0:
+        return np.empty(0, dtype=np.int64)
+    x = np.asarray(x)
+    x = x if np.issubdtype(x.dtype, np.floating) else x.astype(np.float64)
+    if _use_numba(backend):
+        return _jit("argmin")(np.ascontiguousarray(x), centers, before, after)
+    return _argmin_numpy(x, centers, before, after)
+
+
+def zoh_runs(x, backend=None):
+    """Các chuỗi giá trị lặp lại liên tiếp: (vị trí bắt đầu, độ dài)"""
+    x = np.asarray(x)
+    if _use_numba(backend):
+        return _jit("zoh")(x)
+    return _zoh_numpy(x)
+
+
+def scan_gaps(ts, interval=1000, tol=GAP_TOLERANCE_US, backend=None):
+    """Chỗ mất mẫu theo timestamp ESP32 (us): (chỉ số mẫu sau khoảng trống, số mẫu mất) - giống store_data.py"""
+    ts = np.asarray(ts, dtype=np.int64)
+    if _use_numba(backend):
+        return _jit("gap")(ts, interval, tol)
+    return _gap_numpy(ts, interval, tol)
+
+
+def _inputs(rec, fs):
+    from detectors import FOOT_WINDOW_S, butter_bandpass_filter, notch_filter, process_ppg
+    ecg = notch_filter(butter_bandpass_filter(rec["ECG"].astype(float), 0.5, 49, fs), 50, fs)
+    ppg_f, peaks, _ = process_ppg(-rec["IR"].astype(float), fs)
+    return ecg, ppg_f, peaks, int(FOOT_WINDOW_S * fs)
+
+
+def _loop_reference(name, rec, ecg, ppg_f, peaks, fs, back):
+    """Chạy vòng lặp tham chiếu KHÔNG biên dịch (đúng mã nguồn numba sẽ dịch) để đối chiếu"""
+    if name == "qrs":
+        idx, val = _qrs_candidates(ecg)
+        learn = ecg[:int(QRS_LEARN_S * fs)]
+        return _qrs_loop(idx, val, int(QRS_REFRACTORY_S * fs), 0.5 * learn.max(), 0.5 * np.abs(learn).mean(),
+                         QRS_THRESHOLD_K)
+    if name == "argmin":
+        return _argmin_loop(ppg_f, peaks.astype(np.int64), back, 0)
+    if name == "zoh":
+        return _zoh_loop(np.asarray(rec["IR"]))
+    return _gap_loop(rec["Timestamp"].astype(np.int64), 1000, GAP_TOLERANCE_US)
+
+
+def _same(a, b):
+    if isinstance(a, tuple):
+        return all(np.array_equal(x, y) for x, y in zip(a, b))
+    return np.array_equal(a, b)
+
+
+def _best_time(fn, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _runner(name, backend, rec, ecg, ppg_f, peaks, fs, back):
+    """Hàm không tham số chạy 1 kernel với 1 backend ("loop" = vòng lặp tham chiếu không biên dịch)"""
+    if backend == "loop":
+        return lambda: _loop_reference(name, rec, ecg, ppg_f, peaks, fs, back)
+    return {
+        "qrs": lambda: adaptive_qrs(ecg, fs, backend=backend),
+        "argmin": lambda: window_argmin(ppg_f, peaks, back, 0, backend=backend),
+        "zoh": lambda: zoh_runs(rec["IR"], backend=backend),
+        "gap": lambda: scan_gaps(rec["Timestamp"], backend=backend),
+    }[name]
+
+
+if __name__ == "__main__":
+    from recording_io import FS, list_recordings, load_recording
+    parser = argparse.ArgumentParser(description="Đối chiếu + đo tốc độ các backend kernel")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần đo (lấy nhanh nhất)")
+    args = parser.parse_args()
+
+    backends = ["loop", "numpy"] + (["numba"] if HAVE_NUMBA else [])
+    _jit_cache_timed = set()
+    print(f"numba: {'có' if HAVE_NUMBA else 'không'} | backend mặc định: {_backend}")
+    totals = {name: dict.fromkeys(backends, 0.0) for name in _LOOPS}
+    first_call = dict.fromkeys(_LOOPS, 0.0)   # Lần gọi numba đầu tiên: JIT (hoặc nạp cache từ đĩa)
+    for path in args.files or list_recordings():
+        rec = load_recording(path)
+        ecg, ppg_f, peaks, back = _inputs(rec, FS)
+        for name in _LOOPS:
+            ref = _loop_reference(name, rec, ecg, ppg_f, peaks, FS, back)
+            for b in backends:
+                run = _runner(name, b, rec, ecg, ppg_f, peaks, FS, back)
+                t0 = time.perf_counter()
+                out = run()                 # Lần gọi đầu cũng khởi động JIT, không tính vào thời gian chạy
+                if b == "numba" and name not in _jit_cache_timed:
+                    first_call[name] = time.perf_counter() - t0
+                    _jit_cache_timed.add(name)
+                if not _same(out, ref):
+                    raise SystemExit(f"{rec['name']}/{name}: backend {b} KHÁC kết quả tham chiếu")
+                totals[name][b] += _best_time(run, args.repeat)
+
+    print("Tất cả backend cho kết quả giống hệt vòng lặp tham chiếu.")
+    for name, t in totals.items():
+        cols = " | ".join(f"{b}: {t[b] * 1000:8.2f} ms" + ("" if b == "loop" else f" ({t['loop'] / max(t[b], 1e-9):.1f}x)")
+                          for b in backends)
+        jit = f" | JIT lần đầu {first_call[name] * 1000:.0f} ms" if HAVE_NUMBA else ""
+        print(f"{name:6s} {cols}{jit}")
+    if not HAVE_NUMBA:
+        print("Chưa cài numba: chỉ đo được backend numpy.")
@@ -0,0 +1,209 @@
+import os
+import itertools
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import scipy.signal as signal
+
+from recording_io import FS, list_recordings
+from gap_resample import load_resampled
+from detectors import butter_bandpass_filter, notch_filter, window_argmin
+
+# CẤU HÌNH SWEEP
+# Lưới tham số: gom các giá trị mà các script đang dùng khác nhau
+# (Filter_signal.py / ECG_PPG_plot.py / real_time.py / ecg_ppg.py)
+GRID = {
+    "ecg_order":     [1, 2],             # Bậc bộ lọc bandpass ECG
+    "ecg_low":       [0.5],              # Tần số cắt thấp ECG (Hz)
+    "ppg_order":     [2],                # Bậc bộ lọc bandpass PPG
+    "ppg_low":       [0.1, 0.5],         # Tần số cắt thấp PPG (Hz)
+    "r_height":      [0.5, 0.6],         # Ngưỡng đỉnh R = max * hệ số
+    "peak_distance": [0.4, 0.5],         # Khoảng cách tối thiểu giữa 2 đỉnh (s)
+    "spo2_cal":      [(110, 25), (104, 17)],  # SpO2 = a - b*R
+}
+
+WINDOW_S = 10             # Độ dài cửa sổ đánh giá (giây)
+BPM_RANGE = (30, 220)     # Khoảng BPM hợp lệ sinh lý
+OUTPUT_FILE = "sweep_results.csv"
+
+
+# CHIA CỬA SỔ
+def window_bounds(n_samples, fs=FS, window_s=WINDOW_S):
+    """Chia tín hiệu thành các cửa sổ không chồng lấn, trả về mảng (start, end)"""
+    step = int(window_s * fs)
+    starts = np.arange(0, n_samples - step + 1, step)
+    return np.column_stack((starts, starts + step))
+
+
+@lru_cache(maxsize=4)
+def _load(path):
+    # Mỗi process con giữ cache riêng: nhiều task cùng file chỉ đọc 1 lần
+    # Dùng bản đã đưa về lưới đều để RR/BPM không bị lệch ở chỗ mất mẫu
+    rec, _ = load_resampled(path)
+    return rec
+
+
+# NHÁNH ECG: lọc 1 lần cho mỗi (order, low), dùng chung cho mọi (height, distance)
+def _ecg_branch(path, order, low, heights, distances):
+    rec = _load(path)
+    filtered = notch_filter(butter_bandpass_filter(rec["ECG"].astype(float), low, 49, FS, order))
+    bounds = window_bounds(len(filtered))
+
+    out = {}
+    for h, d in itertools.product(heights, distances):
+        bpm = np.full(len(bounds), np.nan)
+        sdnn = np.full(len(bounds), np.nan)
+        for i, (s, e) in enumerate(bounds):
+            seg = filtered[s:e]
+            peaks, _ = signal.find_peaks(seg, distance=FS * d, height=np.max(seg) * h)
+            if len(peaks) > 2:
+                rr = np.diff(peaks) / FS
+                bpm[i] = 60 / np.mean(rr)
+                sdnn[i] = np.std(rr) * 1000
+        out[(h, d)] = {"bpm": bpm, "sdnn": sdnn}
+    return ("ecg", path, order, low), out
+
+
+# NHÁNH PPG: lọc 1 lần cho mỗi (order, low), dùng chung cho mọi distance
+def _ppg_branch(path, order, low, distances):
+    rec = _load(path)
+    # Đảo ngược tín hiệu để đỉnh hướng lên (giống Filter_signal.py)
+    filtered = butter_bandpass_filter(-rec["IR"].astype(float), low, 5, FS, order)
+    bounds = window_bounds(len(filtered))
+    search = int(0.3 * FS)
+
+    out = {}
+    for d in distances:
+        rate = np.full(len(bounds), np.nan)
+        crest = np.full(len(bounds), np.nan)
+        for i, (s, e) in enumerate(bounds):
+            seg = filtered[s:e]
+            peaks, _ = signal.find_peaks(seg, distance=FS * d, height=np.mean(seg))
+            if len(peaks) > 2:
+                rate[i] = 60 / np.mean(np.diff(peaks) / FS)
+                feet = window_argmin(seg, peaks, search, 0)
+                ct = (peaks - feet) / FS
+                ct = ct[ct > 0]
+                if len(ct) > 0:
+                    crest[i] = np.mean(ct) * 1000
+        out[d] = {"ppg_rate": rate, "crest": crest}
+    return ("ppg", path, order, low), out
+
+
+# NHÁNH SpO2: tỷ số R chỉ phụ thuộc tín hiệu thô, tính 1 lần cho mọi hiệu chuẩn
+def _ratio_branch(path):
+    rec = _load(path)
+    red = -rec["RED"].astype(float)
+    ir = -rec["IR"].astype(float)
+    bounds = window_bounds(len(red))
+
+    ratio = np.full(len(bounds), np.nan)
+    for i, (s, e) in enumerate(bounds):
+        r, x = red[s:e], ir[s:e]
+        ac_red = np.percentile(r, 95) - np.percentile(r, 5)
+        ac_ir = np.percentile(x, 95) - np.percentile(x, 5)
+        dc_red = np.mean(np.abs(r))
+        dc_ir = np.mean(np.abs(x))
+        if dc_red > 0 and dc_ir > 0 and ac_red > 0 and ac_ir > 0:
+            ratio[i] = (ac_red / dc_red) / (ac_ir / dc_ir)
+    return ("ratio", path), ratio
+
+
+# ĐÁNH GIÁ ĐỘ ỔN ĐỊNH
+def _cv(x):
+    """Hệ số biến thiên (std/mean) trên các cửa sổ hợp lệ"""
+    x = x[np.isfinite(x)]
+    if len(x) < 2 or np.mean(x) == 0:
+        return np.nan
+    return np.std(x) / abs(np.mean(x))
+
+
+def _median(x):
+    x = x[np.isfinite(x)]
+    return np.median(x) if len(x) > 0 else np.nan
+
+
+def stability_row(ecg, ppg, ratio, cal):
+    """Tóm tắt độ ổn định các chỉ số của 1 cấu hình trên 1 file ghi"""
+    a, b = cal
+    spo2 = np.clip(a - b * ratio, 0, 100)
+    bpm = ecg["bpm"]
+    valid = (bpm >= BPM_RANGE[0]) & (bpm <= BPM_RANGE[1])
+    n = min(len(bpm), len(ppg["ppg_rate"]))
+
+    return {
+        "bpm_median": _median(bpm),
+        "bpm_cv": _cv(bpm),
+        "bpm_valid_frac": np.mean(valid) if len(bpm) > 0 else np.nan,
+        "sdnn_median": _median(ecg["sdnn"]),
+        "ecg_ppg_hr_diff": _median(np.abs(bpm[:n] - ppg["ppg_rate"][:n])),
+        "crest_median": _median(ppg["crest"]),
+        "crest_cv": _cv(ppg["crest"]),
+        "spo2_median": _median(spo2),
+        "spo2_std": np.nanstd(spo2) if np.any(np.isfinite(spo2)) else np.nan,
+    }
+
+
+def run_sweep(paths, grid=GRID, workers=None):
+    """
+    Chạy sweep trên tất cả file ghi bằng process pool.
+    Các điểm lưới có chung tham số lọc dùng chung kết quả lọc (mỗi nhánh = 1 task).
+    Trả về (bảng chi tiết theo file, bảng so sánh theo cấu hình).
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for path in paths:
+            for order, low in itertools.product(grid["ecg_order"], grid["ecg_low"]):
+                futures.append(pool.submit(_ecg_branch, path, order, low,
+                                           grid["r_height"], grid["peak_distance"]))
+            for order, low in itertools.product(grid["ppg_order"], grid["ppg_low"]):
+                futures.append(pool.submit(_ppg_branch, path, order, low,
+                                           grid["peak_distance"]))
+            futures.append(pool.submit(_ratio_branch, path))
+        for fut in futures:
+            key, value = fut.result()
+            results[key] = value
+
+    keys = list(grid.keys())
+    rows = []
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        ratio = results[("ratio", path)]
+        for combo in itertools.product(*(grid[k] for k in keys)):
+            cfg = dict(zip(keys, combo))
+            ecg = results[("ecg", path, cfg["ecg_order"], cfg["ecg_low"])][(cfg["r_height"], cfg["peak_distance"])]
+            ppg = results[("ppg", path, cfg["ppg_order"], cfg["ppg_low"])][cfg["peak_distance"]]
+            row = {"recording": name, **cfg}
+            row.update(stability_row(ecg, ppg, ratio, cfg["spo2_cal"]))
+            rows.append(row)
+
+    detail = pd.DataFrame(rows)
+    detail["spo2_cal"] = detail["spo2_cal"].map(lambda c: f"{c[0]}-{c[1]}R")
+
+    metric_cols = [c for c in detail.columns if c not in keys and c != "recording"]
+    summary = (detail.groupby(keys)[metric_cols].mean()
+               .sort_values(["bpm_valid_frac", "bpm_cv"], ascending=[False, True])
+               .reset_index())
+    return detail, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep tham số lọc / ngưỡng trên các file ghi")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Số process")
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE, help="File CSV kết quả")
+    args = parser.parse_args()
+
+    paths = args.files or list_recordings()
+    print(f"Sweep {len(paths)} file ghi...")
+    detail, summary = run_sweep(paths, workers=args.workers)
+
+    pd.set_option("display.width", 200)
+    print("=== SO SÁNH CẤU HÌNH (trung bình trên các file ghi) ===")
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    detail.to_csv(args.output, index=False)
+    print(f"Chi tiết theo file: {args.output}")
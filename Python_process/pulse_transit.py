@@ -0,0 +1,155 @@
+import argparse
+import numpy as np
+
+from recording_io import FS, list_recordings
+from detectors import process_ecg, process_ppg
+
+# CẤU HÌNH
+PAT_RANGE_MS = (80, 600)   # Khoảng PAT sinh lý (R -> chân sóng / đỉnh PPG ở ngón tay)
+MAD_K = 3.5                # Loại ngoại lai: |x - median| > k * 1.4826 * MAD
+OUTPUT_FILE = "ptt_beats.csv"
+
+
+def pair_beats(r_peaks, feet, peaks, fs=FS):
+    """
+    Ghép mỗi đỉnh R với chân sóng PPG và đỉnh tâm thu NGAY SAU nó (np.searchsorted, không vòng lặp).
+    Chân sóng / đỉnh phải nằm trước đỉnh R kế tiếp, nếu không beat bị đánh dấu không hợp lệ.
+    Trả về dict các mảng cùng độ dài len(r_peaks).
+    """
+    r = np.asarray(r_peaks, dtype=np.int64)
+    feet = np.sort(np.asarray(feet, dtype=np.int64))
+    peaks = np.sort(np.asarray(peaks, dtype=np.int64))
+    next_r = np.append(r[1:], np.iinfo(np.int64).max)
+
+    def _next_after(events):
+        i = np.searchsorted(events, r, side='right')
+        has = i < len(events)
+        idx = np.where(has, events[np.minimum(i, len(events) - 1)] if len(events) else -1, -1)
+        ok = has & (idx < next_r)
+        return np.where(ok, idx, -1), ok
+
+    foot_idx, foot_ok = _next_after(feet)
+    peak_idx, peak_ok = _next_after(peaks)
+    # Đỉnh tâm thu phải đến sau chân sóng của cùng beat
+    peak_ok &= ~foot_ok | (peak_idx > foot_idx)
+
+    pat_foot = np.where(foot_ok, (foot_idx - r) * 1000.0 / fs, np.nan)
+    pat_peak = np.where(peak_ok, (peak_idx - r) * 1000.0 / fs, np.nan)
+    return {
+        "r": r,
+        "foot": foot_idx,
+        "peak": peak_idx,
+        "pat_foot_ms": pat_foot,
+        "pat_peak_ms": pat_peak,
+    }
+
+
+def reject_outliers(values, k=MAD_K, valid_range=PAT_RANGE_MS):
+    """Mặt nạ giá trị hợp lệ: trong khoảng sinh lý và không lệch quá k*MAD so với trung vị"""
+    v = np.asarray(values, dtype=float)
+    ok = np.isfinite(v) & (v >= valid_range[0]) & (v <= valid_range[1])
+    if np.count_nonzero(ok) < 3:
+        return ok
+    med = np.median(v[ok])
+    mad = 1.4826 * np.median(np.abs(v[ok] - med))
+    if mad > 0:
+        ok &= np.abs(v - med) <= k * mad
+    return ok
+
+
+def beat_table(r_peaks, feet, peaks, fs=FS):
+    """Chuỗi PAT/PTT theo từng beat, kèm cờ hợp lệ sau khi loại ngoại lai"""
+    beats = pair_beats(r_peaks, feet, peaks, fs)
+    beats["foot_valid"] = reject_outliers(beats["pat_foot_ms"])
+    beats["peak_valid"] = reject_outliers(beats["pat_peak_ms"])
+    beats["t_s"] = beats["r"] / fs
+    return beats
+
+
+def compute_ptt(ecg_raw, ir_raw, fs=FS):
+    """Batch trên cả file ghi: phát hiện R / chân sóng / đỉnh PPG rồi ghép beat"""
+    _, r_peaks, _, _ = process_ecg(ecg_raw, fs)
+    # Đảo ngược tín hiệu để đỉnh hướng lên (giống Filter_signal.py)
+    _, ppg_peaks, ppg_feet = process_ppg(-np.asarray(ir_raw, dtype=float), fs)
+    return beat_table(r_peaks, ppg_feet, ppg_peaks, fs)
+
+
+class PTTTracker:
+    """
+    Bản incremental cho live monitor: nạp đỉnh R / chân sóng / đỉnh PPG (chỉ số mẫu tuyệt đối)
+    từ các cửa sổ chồng lấn, chỉ phát ra beat mới khi đã có chân sóng + đỉnh của nó
+    (hoặc đỉnh R kế tiếp đã tới). Bộ nhớ giới hạn bởi history.
+    """
+    def __init__(self, fs=FS, history=64, dedup_s=0.2):
+        self.fs = fs
+        self.history = history
+        self.dedup = int(dedup_s * fs)
+        self.r = np.empty(0, dtype=np.int64)
+        self.feet = np.empty(0, dtype=np.int64)
+        self.peaks = np.empty(0, dtype=np.int64)
+        self.last_emitted = -1
+        self.recent = np.empty(0)   # PAT hợp lệ gần đây (cho loại ngoại lai online)
+
+    def _merge(self, old, new):
+        """Gộp sự kiện mới, bỏ các sự kiện trùng (cùng đỉnh thấy lại ở cửa sổ sau)"""
+        new = np.asarray(new, dtype=np.int64)
+        if len(old):
+            new = new[new > old[-1] + self.dedup]
+        return np.concatenate((old, new))[-self.history:]
+
+    def add(self, r_peaks, feet, peaks):
+        """Trả về list các beat mới: (r, pat_foot_ms, pat_peak_ms, valid)"""
+        self.r = self._merge(self.r, r_peaks)
+        self.feet = self._merge(self.feet, feet)
+        self.peaks = self._merge(self.peaks, peaks)
+        if len(self.r) == 0:
+            return []
+
+        beats = pair_beats(self.r, self.feet, self.peaks, self.fs)
+        # Beat đã đầy đủ: có đỉnh PPG, hoặc đỉnh R kế tiếp đã tới (không còn gì để chờ)
+        complete = (beats["peak"] >= 0) | (np.arange(len(self.r)) < len(self.r) - 1)
+        new = complete & (beats["r"] > self.last_emitted)
+        if not np.any(new):
+            return []
+
+        out = []
+        for i in np.flatnonzero(new):
+            pat = beats["pat_foot_ms"][i]
+            valid = bool(reject_outliers(np.append(self.recent, pat))[-1])
+            if valid:
+                self.recent = np.append(self.recent, pat)[-self.history:]
+            out.append((int(beats["r"][i]), pat, beats["pat_peak_ms"][i], valid))
+        self.last_emitted = int(beats["r"][np.flatnonzero(new)[-1]])
+        return out
+
+    @property
+    def current_pat_ms(self):
+        """PAT trung vị của các beat hợp lệ gần đây"""
+        return float(np.median(self.recent[-10:])) if len(self.recent) else 0.0
+
+
+if __name__ == "__main__":
+    import pandas as pd
+    from gap_resample import load_resampled
+    parser = argparse.ArgumentParser(description="Chuỗi PAT/PTT theo từng beat (ECG R -> PPG)")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("-o", "--output", default=OUTPUT_FILE, help="File CSV kết quả")
+    args = parser.parse_args()
+
+    tables = []
+    for path in args.files or list_recordings():
+        rec, _ = load_resampled(path)
+        beats = compute_ptt(rec["ECG"].astype(float), rec["IR"], FS)
+        df = pd.DataFrame(beats)
+        df.insert(0, "recording", rec["name"])
+        tables.append(df)
+
+        ok = beats["foot_valid"]
+        if np.any(ok):
+            v = beats["pat_foot_ms"][ok]
+            print(f"{rec['name']}: {len(beats['r'])} beat, {np.count_nonzero(ok)} hợp lệ | "
+                  f"PAT foot = {np.median(v):.1f} ms (IQR {np.percentile(v, 75) - np.percentile(v, 25):.1f})")
+        else:
+            print(f"{rec['name']}: {len(beats['r'])} beat, không có PAT hợp lệ")
+
+    pd.concat(tables, ignore_index=True).to_csv(args.output, index=False)
@@ -0,0 +1,113 @@
+import os
+import glob
+import numpy as np
+
+# CẤU HÌNH HỆ THỐNG
+FS = 1000  # Tần số lấy mẫu (Hz)
+TARGET_INTERVAL_US = 1000  # 1000Hz => 1000us giữa các mẫu
+
+# Thư mục chứa các file ghi (test*.csv)
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+# Định dạng hiện tại (khớp với printf trong logger_task):
+# printf("%lld,%d,%lu,%lu,%d\n", timestamp, pcg, red, ir, ecg);
+COLUMNS = ["Timestamp", "PCG", "RED", "IR", "ECG"]
+
+# Định dạng cũ (test1-4.csv): 4 cột, không header, không Timestamp
+LEGACY_COLUMNS = ["ECG", "RED", "IR", "PCG"]
+
+# Kiểu dữ liệu gọn theo độ rộng thực của ADC (thay vì int64 mặc định của pandas):
+# ECG 12-bit, PCG 16-bit có dấu, RED / IR 18-bit (int32 có dấu để -IR không bị tràn)
+DTYPES = {"Timestamp": np.int64, "PCG": np.int16, "RED": np.int32, "IR": np.int32, "ECG": np.int16}
+# 1 mẫu = 20 byte (so với 40 byte khi cả 5 cột là int64); dùng chung cho buffer live, recorder và file .npy
+SAMPLE_DTYPE = np.dtype([(name, DTYPES[name]) for name in COLUMNS])
+CHUNK_ROWS = 1_000_000     # iter_recording: ~17 phút / khối (vài chục MB khi parse)
+
+
+def list_recordings(data_dir=DATA_DIR, pattern="test*.csv"):
+    """Danh sách các file ghi trong thư mục data"""
+    return sorted(glob.glob(os.path.join(data_dir, pattern)))
+
+
+def _csv_layout(path):
+    """(có header, có cột Timestamp, tên cột) của 1 file CSV, đoán từ dòng đầu"""
+    with open(path, 'r') as f:
+        first = f.readline().strip()
+    header = first.startswith("Timestamp")
+    has_timestamp = header or first.count(",") == len(COLUMNS) - 1
+    return header, has_timestamp, COLUMNS if has_timestamp else LEGACY_COLUMNS
+
+
+def load_recording(path, compact=True):
+    """
+    Đọc 1 file ghi (.csv, .npy nhị phân hoặc .npz sự kiện của event_capture), trả về dict {tên cột: np.ndarray}.
+    compact=True: mỗi kênh mang kiểu DTYPES; False: int64 như pandas mặc định (để đối chiếu).
+    File cũ không có Timestamp sẽ được gán lưới thời gian đều 1000us.
+    """
+    if path.endswith((".npy", ".npz")):
+        if path.endswith(".npz"):
+            with np.load(path) as z:
+                data = z["samples"]
+        else:
+            data = np.load(path, mmap_mode="r")
+        rec = {name: (data[name] if compact else data[name].astype(np.int64)) for name in COLUMNS}
+        has_timestamp = True
+    else:
+        import pandas as pd  # Import muộn: module này còn được dùng bởi tiến trình headless
+        header, has_timestamp, names = _csv_layout(path)
+        dtype = {name: DTYPES[name] if compact else np.int64 for name in names}
+        try:
+            df = pd.read_csv(path, header=0 if header else None, names=names, dtype=dtype)
+        except ValueError:
+            # Dòng cuối ghi dở (crash / rút điện giữa lúc ghi) -> ô trống (NA) không ép được sang kiểu nguyên:
+            # đọc lại không ép kiểu, bỏ các dòng thiếu cột rồi mới đổi kiểu
+            df = pd.read_csv(path, header=0 if header else None, names=names)
+            df = df.dropna().astype(dtype)
+        rec = {name: df[name].values for name in df.columns}
+    if not has_timestamp:
+        rec["Timestamp"] = np.arange(len(rec["ECG"]), dtype=np.int64) * TARGET_INTERVAL_US
+
+    rec["name"] = os.path.splitext(os.path.basename(path))[0]
+    rec["has_timestamp"] = has_timestamp
+    return rec
+
+
+def iter_recording(path, columns=COLUMNS, chunk_rows=CHUNK_ROWS):
+    """
+    Đọc 1 file ghi theo từng khối chunk_rows mẫu: yield dict {cột: mảng kiểu DTYPES}.
+    RAM giới hạn bởi 1 khối (file CSV cả ngày ~2GB không phải nằm trọn trong bộ nhớ);
+    .npy được cắt lát từ memmap. Timestamp của file cũ được gán lưới đều như load_recording.
+    """
+    if path.endswith(".npy"):
+        data = np.load(path, mmap_mode="r")
+        for s in range(0, len(data), chunk_rows):
+            block = data[s:s + chunk_rows]
+            yield {name: np.asarray(block[name]) for name in columns}
+        return
+
+    import pandas as pd
+    header, has_timestamp, names = _csv_layout(path)
+    usecols = [c for c in columns if c in names]
+    pos = 0
+    for df in pd.read_csv(path, header=0 if header else None, names=names, usecols=usecols, chunksize=chunk_rows):
+        df = df.dropna()   # Dòng cuối ghi dở (xem load_recording)
+        block = {name: df[name].values.astype(DTYPES[name]) for name in usecols}
+        n = len(df)
+        if "Timestamp" in columns and not has_timestamp:
+            block["Timestamp"] = np.arange(pos, pos + n, dtype=np.int64) * TARGET_INTERVAL_US
+        pos += n
+        yield block
+
+
+def save_compact(rec, path):
+    """Ghi file ghi dạng nhị phân .npy (mảng có cấu trúc SAMPLE_DTYPE) - đọc lại bằng load_recording"""
+    out = np.empty(len(rec["ECG"]), dtype=SAMPLE_DTYPE)
+    for name in COLUMNS:
+        out[name] = rec[name]
+    np.save(path, out)
+    return path
+
+
+def recording_nbytes(rec):
+    """Tổng số byte các kênh của 1 file ghi đã đọc"""
+    return sum(rec[name].nbytes for name in COLUMNS if name in rec)
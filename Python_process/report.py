@@ -0,0 +1,225 @@
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from recording_io import FS, list_recordings
+
+# CẤU HÌNH
+REPORT_VERSION = 2            # Tăng khi đổi nội dung báo cáo -> buộc tạo lại
+OUT_DIR = "reports"
+FORMATS = ("pdf", "png")
+PLOT_POINTS = 2000            # Số cột min/max tối đa cho mỗi đường vẽ (sau khi giảm mẫu)
+SEGMENT_S = 5                 # Độ dài mỗi đoạn ECG / PPG có chú thích
+SPO2_CAL = (110, 25)          # SpO2 = a - b*R (giống Filter_signal.py)
+WINDOW_S = 10                 # Cửa sổ tính vitals cho biểu đồ xu hướng
+MIN_WINDOW_S = 3              # Phần cuối (hoặc cả bản ghi ngắn) >= 3s vẫn thành 1 cửa sổ riêng
+
+
+def minmax_decimate(x, n_out=PLOT_POINTS):
+    """
+    Giảm mẫu giữ đường bao: chia x thành <= n_out nhóm k = ceil(n / n_out) mẫu, lấy min và max mỗi nhóm.
+    Trả về (chỉ số, giá trị) dài <= 2*n_out - gai nhọn (đỉnh R, click PCG) không bị mất.
+    Nhóm cuối được đệm bằng mẫu cuối cùng nên phần đuôi (n % k mẫu) vẫn được vẽ.
+    """
+    x = np.asarray(x)
+    n = len(x)
+    if n <= 2 * n_out:
+        return np.arange(n), x
+    k = -(-n // n_out)
+    nb = -(-n // k)
+    blocks = np.pad(x, (0, nb * k - n), mode='edge').reshape(nb, k)
+    start = np.arange(nb) * k
+    lo = np.minimum(start + np.argmin(blocks, axis=1), n - 1)
+    hi = np.minimum(start + np.argmax(blocks, axis=1), n - 1)
+    order = np.sort(np.column_stack((lo, hi)), axis=1).ravel()
+    return order, x[order]
+
+
+def input_key(path):
+    """Khóa đầu vào: nội dung file + phiên bản báo cáo (file không đổi -> bỏ qua)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(f"v{REPORT_VERSION}".encode())
+    return h.hexdigest()
+
+
+def _up_to_date(path, out_dir, formats):
+    name = os.path.splitext(os.path.basename(path))[0]
+    meta = os.path.join(out_dir, f"{name}.json")
+    if not os.path.exists(meta) or not all(os.path.exists(os.path.join(out_dir, f"{name}.{f}")) for f in formats):
+        return False
+    with open(meta) as f:
+        return json.load(f).get("input_key") == input_key(path)
+
+
+def window_vitals(rec, table, fs=FS, window_s=WINDOW_S):
+    """HR / SpO2 / PAT theo từng cửa sổ window_s (cho biểu đồ xu hướng)"""
+    from param_sweep import window_bounds
+    n = len(rec["ECG"])
+    bounds = window_bounds(n, fs, window_s)
+    end = int(bounds[-1, 1]) if len(bounds) else 0
+    if n - end >= MIN_WINDOW_S * fs:
+        bounds = np.vstack((bounds, [[end, n]]))   # Phần đuôi / bản ghi ngắn hơn window_s
+    red = rec["RED"].astype(float)
+    ir = rec["IR"].astype(float)
+    rr, rr_ok = table.rr_ms()
+    pat, pat_ok = table.pat_ms()
+    r = table.data["r"]
+
+    out = {k: np.full(len(bounds), np.nan) for k in ("hr", "spo2", "pat")}
+    lo = np.searchsorted(r, bounds[:, 0])
+    hi = np.searchsorted(r, bounds[:, 1])
+    for i, (s, e) in enumerate(bounds):
+        m = rr_ok[lo[i]:hi[i]]
+        if np.count_nonzero(m) >= 2:
+            out["hr"][i] = 60000.0 / np.median(rr[lo[i]:hi[i]][m])
+        m = pat_ok[lo[i]:hi[i]]
+        if np.any(m):
+            out["pat"][i] = np.median(pat[lo[i]:hi[i]][m])
+        rs, xs = red[s:e], ir[s:e]
+        ac_r, ac_x = np.percentile(rs, 95) - np.percentile(rs, 5), np.percentile(xs, 95) - np.percentile(xs, 5)
+        if ac_r > 0 and ac_x > 0:
+            ratio = (ac_r / np.mean(rs)) / (ac_x / np.mean(xs))
+            out["spo2"][i] = np.clip(SPO2_CAL[0] - SPO2_CAL[1] * ratio, 0, 100)
+    out["t_min"] = bounds.mean(axis=1) / fs / 60
+    return out
+
+
+def _fmt(v, unit=""):
+    return f"{v:.1f}{unit}" if np.isfinite(v) else "--"
+
+
+def render_report(path, out_dir=OUT_DIR, formats=FORMATS, force=False):
+    """Tạo báo cáo 1 file ghi (chạy trong process con, backend Agg). Trả về (tên, trạng thái)."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not force and _up_to_date(path, out_dir, formats):
+        return name, "skipped"
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from gap_resample import load_resampled
+    from beat_table import BeatTable
+    from detectors import process_ecg, process_ppg
+
+    rec, gap = load_resampled(path)
+    n = len(rec["ECG"])
+    t = np.arange(n) / FS
+    ecg_f, r_peaks, q_pts, s_pts = process_ecg(rec["ECG"].astype(float), FS)
+    ppg_f, ppg_peaks, ppg_feet = process_ppg(-rec["IR"].astype(float), FS)
+    table = BeatTable(FS, capacity=max(len(r_peaks), 1))
+    table.extend(r_peaks, q_pts, s_pts)
+    table.attach_ppg(ppg_feet, ppg_peaks, lookback=len(r_peaks))
+    vit = window_vitals(rec, table)
+
+    fig = plt.figure(figsize=(12, 17))
+    gs = fig.add_gridspec(9, 1, height_ratios=[1, 1, 1, 1, 1.6, 1.6, 1.6, 0.2, 1.6], hspace=0.6)
+    fig.suptitle(f"Recording report: {name}", fontsize=15, fontweight='bold')
+
+    # 1. Tổng quan 4 kênh (giảm mẫu min/max)
+    for i, (ch, color) in enumerate((("ECG", 'darkgreen'), ("RED", 'red'), ("IR", 'darkblue'), ("PCG", 'purple'))):
+        ax = fig.add_subplot(gs[i])
+        idx, v = minmax_decimate(rec[ch])
+        ax.plot(t[idx], v, color=color, lw=0.5)
+        ax.set_ylabel(ch)
+        ax.set_xlim(0, t[-1] if n else 1)
+        ax.grid(True, alpha=0.3)
+        if i == 0:
+            ax.set_title("1. Overview (raw, min/max decimated)", loc='left', fontweight='bold')
+
+    # 2. Đoạn có chú thích: ở giữa bản ghi (thường ổn định hơn phần đầu)
+    seg = int(SEGMENT_S * FS)
+    s0 = max(0, n // 2 - seg // 2)
+    s1 = min(n, s0 + seg)
+    ax = fig.add_subplot(gs[4])
+    ax.plot(t[s0:s1], ecg_f[s0:s1], 'g-', lw=0.8)
+    for pts, style, label in ((r_peaks, 'ro', 'R'), (q_pts, 'b^', 'Q'), (s_pts, 'kv', 'S')):
+        p = pts[(pts >= s0) & (pts < s1)]
+        ax.plot(t[p], ecg_f[p], style, ms=4, label=label)
+    ax.set_title(f"2. ECG segment {t[s0]:.0f}-{t[s1 - 1]:.0f}s (0.5-49Hz + notch)", loc='left', fontweight='bold')
+    ax.legend(loc='upper right', fontsize=8)
+    ax.grid(True, alpha=0.3)
+
+    ax = fig.add_subplot(gs[5], sharex=ax)
+    ax.plot(t[s0:s1], ppg_f[s0:s1], color='purple', lw=0.8)
+    for pts, style, label in ((ppg_peaks, 'ro', 'Systolic peak'), (ppg_feet, 'yo', 'Foot')):
+        p = pts[(pts >= s0) & (pts < s1)]
+        ax.plot(t[p], ppg_f[p], style, ms=4, markeredgecolor='k', label=label)
+    ax.set_title("3. PPG IR segment (0.1-5Hz)", loc='left', fontweight='bold')
+    ax.set_xlabel("Time (s)")
+    ax.legend(loc='upper right', fontsize=8)
+    ax.grid(True, alpha=0.3)
+
+    # 3. Xu hướng theo cửa sổ
+    ax = fig.add_subplot(gs[6])
+    ax.plot(vit["t_min"], vit["hr"], 'g.-', label="HR (bpm)")
+    ax.plot(vit["t_min"], vit["spo2"], 'r.-', label="SpO2 (%)")
+    ax2 = ax.twinx()
+    ax2.plot(vit["t_min"], vit["pat"], 'b.--', label="PAT (ms)")
+    ax2.set_ylabel("PAT (ms)")
+    ax.set_title(f"4. Trend ({WINDOW_S}s windows)", loc='left', fontweight='bold')
+    ax.set_xlabel("Time (min)")
+    ax.set_xlim(0, max(n / FS / 60, 1e-3))
+    h1, l1 = ax.get_legend_handles_labels()
+    h2, l2 = ax2.get_legend_handles_labels()
+    ax.legend(h1 + h2, l1 + l2, loc='upper left', fontsize=8)   # Gộp cả đường PAT của trục phụ
+    ax.grid(True, alpha=0.3)
+
+    # 4. Bảng tổng hợp
+    rr, rr_ok = table.rr_ms()
+    pat, pat_ok = table.pat_ms()
+    rows = [
+        ["Duration", f"{n / FS:.1f} s"],
+        ["Samples lost", f"{gap['lost']} ({gap['loss_pct']:.2f}%), max gap {gap['max_gap_ms']:.0f} ms"],
+        ["Beats (valid RR)", f"{len(table)} ({np.count_nonzero(rr_ok)})"],
+        ["HR median", _fmt(60000.0 / np.median(rr[rr_ok]) if np.any(rr_ok) else np.nan, " bpm")],
+        ["SDNN", _fmt(np.std(rr[rr_ok]) if np.count_nonzero(rr_ok) > 1 else np.nan, " ms")],
+        ["SpO2 median", _fmt(np.nanmedian(vit["spo2"]) if np.any(np.isfinite(vit["spo2"])) else np.nan, " %")],
+        ["PAT median", _fmt(np.median(pat[pat_ok]) if np.any(pat_ok) else np.nan, " ms")],
+    ]
+    ax = fig.add_subplot(gs[8])
+    ax.axis('off')
+    ax.set_title("5. Vitals summary", loc='left', fontweight='bold')
+    # bbox chừa ~15% phía trên cho tiêu đề (loc='center' + scale làm header đè lên tiêu đề)
+    ax.table(cellText=rows, colLabels=["Metric", "Value"], cellLoc='left', colWidths=[0.3, 0.6],
+             bbox=[0, 0, 0.9, 0.85])
+
+    os.makedirs(out_dir, exist_ok=True)
+    for fmt in formats:
+        fig.savefig(os.path.join(out_dir, f"{name}.{fmt}"), dpi=110)
+    plt.close(fig)
+    with open(os.path.join(out_dir, f"{name}.json"), "w") as f:
+        json.dump({"input_key": input_key(path), "source": os.path.abspath(path)}, f, indent=2)
+    return name, "rendered"
+
+
+def build_reports(paths, out_dir=OUT_DIR, formats=FORMATS, workers=None, force=False):
+    """Tạo báo cáo cho mọi file ghi song song (mỗi file = 1 task trong process pool)"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(render_report, p, out_dir, formats, force) for p in paths]
+        return [f.result() for f in futures]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tạo báo cáo PDF/PNG cho các file ghi (không GUI, song song)")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Số process")
+    parser.add_argument("-o", "--out-dir", default=OUT_DIR, help="Thư mục báo cáo")
+    parser.add_argument("--format", nargs="+", default=list(FORMATS), choices=["pdf", "png", "svg"])
+    parser.add_argument("--force", action="store_true", help="Tạo lại cả khi đầu vào không đổi")
+    args = parser.parse_args()
+
+    import time
+    t0 = time.perf_counter()
+    results = build_reports(args.files or list_recordings(), args.out_dir, tuple(args.format),
+                            args.workers, args.force)
+    for name, state in results:
+        print(f"{name}: {state}")
+    print(f"{sum(s == 'rendered' for _, s in results)} tạo mới, {sum(s == 'skipped' for _, s in results)} bỏ qua"
+          f" - {time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,237 @@
+import argparse
+from collections import deque
+
+import numpy as np
+import scipy.fft
+import scipy.signal as signal
+
+from recording_io import FS, list_recordings
+
+# CẤU HÌNH
+RESP_BAND_HZ = (0.1, 0.7)    # 6 - 42 nhịp thở/phút
+RESP_FS = 4.0                # Tần số nội suy các chuỗi theo beat (RR, biên độ PPG)
+RESP_WINDOW_S = 60           # Cửa sổ ước lượng nhịp thở
+BASELINE_FS = 10             # PPG baseline sau khi hạ tần số
+MIN_QUALITY = 0.25           # Độ tập trung phổ tối thiểu để 1 nguồn được tham gia hợp nhất
+
+
+class StreamingDecimator:
+    """Hạ tần số lấy mẫu liên tục theo block: lọc thông thấp IIR (giữ trạng thái zi) + lấy 1/q mẫu"""
+    def __init__(self, q, fs=FS, order=6):
+        self.q = q
+        self.fs_out = fs / q
+        self.sos = signal.butter(order, 0.8 * self.fs_out / 2, btype='low', fs=fs, output='sos')
+        self.zi = None
+        self.phase = 0  # Vị trí mẫu được giữ trong block kế tiếp
+
+    def process(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        if len(x) == 0:
+            return x
+        if self.zi is None:
+            self.zi = signal.sosfilt_zi(self.sos) * x[0]
+        y, self.zi = signal.sosfilt(self.sos, x, zi=self.zi)
+        out = y[self.phase::self.q]
+        self.phase = (self.phase - len(x)) % self.q
+        return out
+
+
+class StreamingSTFT:
+    """
+    STFT tăng dần với cửa sổ chồng lấn. Cửa sổ Hann và trục tần số tính sẵn;
+    scipy.fft giữ cache plan nên mỗi frame cùng kích thước dùng lại plan.
+    Spectrogram lưu trong mảng vòng cố định (n_frames x n_bins) -> bộ nhớ không tăng.
+    Chi phí mỗi lần update bị chặn bởi max_frames_per_update.
+    """
+    def __init__(self, fs, nperseg=256, overlap=0.5, n_frames=120, max_frames_per_update=8):
+        self.fs = fs
+        self.nperseg = nperseg
+        self.hop = max(1, int(nperseg * (1 - overlap)))
+        self.window = signal.get_window('hann', nperseg)
+        self.scale = 1.0 / (fs * np.sum(self.window ** 2))
+        self.freqs = scipy.fft.rfftfreq(nperseg, 1 / fs)
+        self.max_frames = max_frames_per_update
+
+        self.spec = np.full((n_frames, len(self.freqs)), np.nan)  # dB
+        self.head = 0           # Vị trí frame kế tiếp trong mảng vòng
+        self.count = 0
+        self._buf = np.empty(0)
+        # Welch chạy: trung bình công suất của tất cả frame trong mảng vòng
+        self._psd_sum = np.zeros(len(self.freqs))
+        self._psd_ring = np.zeros((n_frames, len(self.freqs)))
+
+    def push(self, x):
+        """Nạp mẫu mới; trả về số frame đã tính"""
+        self._buf = np.concatenate((self._buf, np.asarray(x, dtype=np.float64)))
+        n_ready = (len(self._buf) - self.nperseg) // self.hop + 1 if len(self._buf) >= self.nperseg else 0
+        if n_ready <= 0:
+            return 0
+        # Quá tải: bỏ các frame cũ nhất thay vì tăng chi phí
+        skip = max(0, n_ready - self.max_frames)
+        start = skip * self.hop
+        n = n_ready - skip
+
+        idx = start + np.arange(n)[:, None] * self.hop + np.arange(self.nperseg)
+        frames = self._buf[idx]
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        power = np.abs(scipy.fft.rfft(frames * self.window, axis=1)) ** 2 * self.scale
+        power[:, 1:-1] *= 2
+
+        rows = (self.head + np.arange(n)) % len(self.spec)
+        self._psd_sum += power.sum(axis=0) - self._psd_ring[rows].sum(axis=0)
+        self._psd_ring[rows] = power
+        self.spec[rows] = 10 * np.log10(power + 1e-12)
+        self.head = (self.head + n) % len(self.spec)
+        self.count = min(self.count + n, len(self.spec))
+
+        self._buf = self._buf[start + n * self.hop:]
+        return n
+
+    def spectrogram(self):
+        """Spectrogram theo thứ tự thời gian (frame cũ -> mới), shape (n_bins, n_frames)"""
+        return np.roll(self.spec, -self.head, axis=0).T
+
+    def welch(self):
+        """PSD trung bình (Welch) trên các frame trong mảng vòng"""
+        return self.freqs, self._psd_sum / max(self.count, 1)
+
+    def band_ratio(self, f_lo, f_hi):
+        """Tỷ lệ công suất trong dải [f_lo, f_hi] so với tổng (vd: nhiễu nguồn 50Hz)"""
+        f, p = self.welch()
+        total = p.sum()
+        if total <= 0:
+            return 0.0
+        return float(p[(f >= f_lo) & (f <= f_hi)].sum() / total)
+
+
+def dominant_frequency(t, v, band=RESP_BAND_HZ, fs=RESP_FS):
+    """
+    Nội suy chuỗi sự kiện (t, v) lên lưới đều fs, tính PSD (Welch) và lấy đỉnh trong dải band.
+    Trả về (tần số Hz, chất lượng = công suất quanh đỉnh / công suất cả dải).
+    """
+    t = np.asarray(t, dtype=float)
+    v = np.asarray(v, dtype=float)
+    if len(t) < 8 or t[-1] - t[0] < 3 / band[0]:
+        return 0.0, 0.0
+    grid = np.arange(t[0], t[-1], 1 / fs)
+    x = signal.detrend(np.interp(grid, t, v))
+    f, p = signal.welch(x, fs=fs, nperseg=min(len(x), int(32 * fs)))
+    m = (f >= band[0]) & (f <= band[1])
+    if not np.any(m) or p[m].sum() <= 0:
+        return 0.0, 0.0
+    fb, pb = f[m], p[m]
+    k = np.argmax(pb)
+    peak = pb[max(0, k - 1):k + 2].sum()
+    return float(fb[k]), float(peak / pb.sum())
+
+
+class RespirationEstimator:
+    """
+    Ước lượng nhịp thở từ 3 nguồn, hợp nhất theo chất lượng phổ:
+    - RSA: điều biến khoảng RR của ECG
+    - RIAV: điều biến biên độ PPG theo beat
+    - RIIV: đường nền PPG (hạ tần số xuống BASELINE_FS)
+    Dữ liệu lưu trong deque giới hạn RESP_WINDOW_S -> chi phí mỗi lần ước lượng cố định.
+    """
+    def __init__(self, fs=FS, window_s=RESP_WINDOW_S):
+        self.fs = fs
+        self.window_s = window_s
+        self.rr = deque()        # (t, RR s)
+        self.amp = deque()       # (t, biên độ PPG)
+        self.baseline = deque(maxlen=int(window_s * BASELINE_FS))
+        self._decim = StreamingDecimator(int(fs / BASELINE_FS), fs)
+        self._last_r = None
+        self._last_amp_t = -np.inf
+        self.t_now = 0.0
+
+    def _trim(self, d):
+        while d and self.t_now - d[0][0] > self.window_s:
+            d.popleft()
+
+    def add_r_peaks(self, r_abs):
+        """Đỉnh R (chỉ số mẫu tuyệt đối, có thể trùng với lần trước)"""
+        for r in r_abs:
+            if self._last_r is not None and r <= self._last_r + 0.2 * self.fs:
+                continue
+            if self._last_r is not None and r - self._last_r < 2 * self.fs:
+                self.rr.append((r / self.fs, (r - self._last_r) / self.fs))
+            self._last_r = int(r)
+            self.t_now = max(self.t_now, r / self.fs)
+        self._trim(self.rr)
+
+    def add_ppg_beats(self, peaks_abs, amplitudes):
+        """Đỉnh PPG (chỉ số tuyệt đối) và biên độ đỉnh - chân sóng tương ứng"""
+        for p, a in zip(peaks_abs, amplitudes):
+            t = p / self.fs
+            if t <= self._last_amp_t + 0.2:
+                continue
+            self.amp.append((t, a))
+            self._last_amp_t = t
+            self.t_now = max(self.t_now, t)
+        self._trim(self.amp)
+
+    def add_ppg_samples(self, x):
+        """Mẫu PPG thô (đã đảo ngược) ở fs gốc -> đường nền 10Hz"""
+        self.baseline.extend(self._decim.process(x))
+
+    def estimate(self):
+        """Trả về (nhịp thở/phút, dict chi tiết theo nguồn)"""
+        sources = {}
+        if len(self.rr) > 8:
+            t, v = zip(*self.rr)
+            sources["rsa"] = dominant_frequency(t, v)
+        if len(self.amp) > 8:
+            t, v = zip(*self.amp)
+            sources["riav"] = dominant_frequency(t, v)
+        if len(self.baseline) > 4 * BASELINE_FS / RESP_BAND_HZ[0]:
+            b = np.asarray(self.baseline)
+            sources["riiv"] = dominant_frequency(np.arange(len(b)) / BASELINE_FS, b, fs=BASELINE_FS)
+
+        good = {k: (f, q) for k, (f, q) in sources.items() if f > 0 and q >= MIN_QUALITY}
+        if not good:
+            return 0.0, sources
+        f = np.array([v[0] for v in good.values()])
+        w = np.array([v[1] for v in good.values()])
+        # Trung bình có trọng số, loại nguồn lệch xa trung vị (> 0.1 Hz)
+        keep = np.abs(f - np.median(f)) <= 0.1
+        return float(np.sum(f[keep] * w[keep]) / np.sum(w[keep]) * 60), sources
+
+
+def respiration_from_recording(rec, fs=FS, window_s=RESP_WINDOW_S, step_s=30):
+    """Batch: ước lượng nhịp thở theo từng cửa sổ trên cả file ghi (dùng chung lớp streaming)"""
+    from detectors import process_ecg, process_ppg
+    _, r_peaks, _, _ = process_ecg(np.asarray(rec["ECG"], dtype=float), fs)
+    ppg = -np.asarray(rec["IR"], dtype=float)
+    ppg_f, ppg_peaks, ppg_feet = process_ppg(ppg, fs)
+    amps = ppg_f[ppg_peaks] - ppg_f[ppg_feet]
+
+    out = []
+    est = RespirationEstimator(fs, window_s)
+    step = int(step_s * fs)
+    for s in range(0, len(ppg), step):
+        e = s + step
+        est.add_r_peaks(r_peaks[(r_peaks >= s) & (r_peaks < e)])
+        m = (ppg_peaks >= s) & (ppg_peaks < e)
+        est.add_ppg_beats(ppg_peaks[m], amps[m])
+        est.add_ppg_samples(ppg[s:e])
+        est.t_now = e / fs
+        if e >= window_s * fs:
+            rate, src = est.estimate()
+            out.append((e / fs, rate, src))
+    return out
+
+
+if __name__ == "__main__":
+    from gap_resample import load_resampled
+    parser = argparse.ArgumentParser(description="Ước lượng nhịp thở (RSA + PPG) trên các file ghi")
+    parser.add_argument("files", nargs="*", help="File CSV (mặc định: data/test*.csv)")
+    args = parser.parse_args()
+
+    for path in args.files or list_recordings():
+        rec, _ = load_resampled(path)
+        rows = respiration_from_recording(rec)
+        rates = [r for _, r, _ in rows if r > 0]
+        if rates:
+            print(f"{rec['name']}: nhịp thở trung vị {np.median(rates):.1f} /phút ({len(rates)}/{len(rows)} cửa sổ hợp lệ)")
+        else:
+            print(f"{rec['name']}: không ước lượng được nhịp thở")
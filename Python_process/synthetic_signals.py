@@ -0,0 +1,368 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+from recording_io import FS, COLUMNS
+
+# CẤU HÌNH MẶC ĐỊNH
+CHUNK_S = 60               # Sinh dữ liệu theo từng đoạn 60s -> bộ nhớ cố định với bản ghi dài
+ECG_MID = 2048             # Mức giữa ADC 12-bit
+ECG_GAIN = 900             # Biên độ đỉnh R (đơn vị ADC)
+PPG_RATE = 100             # Tốc độ lấy mẫu MAX30102 (Hz), được ZOH lên FS như processing_task
+IR_DC, RED_DC = 120000, 90000
+PERFUSION = 0.02           # AC/DC của kênh IR
+PAT_S = 0.22               # Thời gian R -> chân sóng PPG
+SYSTOLIC_S = 0.15          # Đỉnh tâm thu sau lúc bắt đầu xung (tâm Gaussian tâm thu của _pulse_shape)
+RESP_DEPTH, RESP_HZ = 0.01, 0.25   # Điều biến DC của PPG theo hô hấp
+SPO2_CAL = (110, 25)       # SpO2 = a - b*R (khớp real_time.py / Filter_signal.py)
+
+# Sóng ECG: tổng các Gaussian (P, Q, R, S, T): (thời điểm so với R (s), độ rộng (s), biên độ)
+ECG_WAVES = [(-0.20, 0.025, 0.12), (-0.03, 0.010, -0.15), (0.0, 0.012, 1.0),
+             (0.03, 0.010, -0.25), (0.28, 0.050, 0.30)]
+
+# Gói nhị phân: giống sensor_packet_t (packed, little-endian)
+PACKET_DTYPE = [("timestamp", "<i8"), ("pcg", "<i2"), ("red", "<u4"), ("ir", "<u4"), ("ecg", "<i4")]
+
+
+def packet_dtype(extra_channels=0):
+    """dtype của 1 gói nhị phân; kênh phụ (ECG2, ECG3...) là int32"""
+    return np.dtype(PACKET_DTYPE + [(f"ecg{i + 2}", "<i4") for i in range(extra_channels)])
+
+
+# 1. LỊCH NHỊP TIM
+def beat_schedule(duration_s, hr=70.0, hrv=0.05, arrhythmia=None, ectopic_rate=0.05, seed=0):
+    """
+    Thời điểm các đỉnh R (s) và nhãn từng beat.
+    - hrv: biên độ dao động RR tương đối (LF 0.1Hz + HF/hô hấp 0.25Hz + nhiễu)
+    - arrhythmia: None | "ectopic" (ngoại tâm thu + nghỉ bù) | "af" (RR ngẫu nhiên không đều)
+    Nhãn: 0 = bình thường, 1 = ngoại tâm thu, 2 = AF
+    """
+    rng = np.random.default_rng(seed)
+    mean_rr = 60.0 / hr
+    n = int(duration_s / mean_rr * 1.3) + 4
+
+    k = np.arange(n) * mean_rr
+    rel = (hrv * (0.6 * np.sin(2 * np.pi * 0.1 * k) + 0.4 * np.sin(2 * np.pi * 0.25 * k))
+           + 0.3 * hrv * rng.standard_normal(n))
+    rr = mean_rr * (1 + rel)
+    labels = np.zeros(n, dtype=np.int8)
+
+    if arrhythmia == "af":
+        rr = mean_rr * rng.uniform(0.6, 1.4, n)
+        labels[:] = 2
+    elif arrhythmia == "ectopic":
+        ect = np.flatnonzero(rng.random(n - 1) < ectopic_rate)
+        rr[ect] *= 0.65          # Beat đến sớm
+        rr[ect + 1] *= 1.35      # Nghỉ bù
+        labels[ect + 1] = 1
+
+    t = 0.5 + np.concatenate(([0.0], np.cumsum(rr[:-1])))
+    keep = t < duration_s
+    return t[keep], labels[keep]
+
+
+# 2. SINH TÍN HIỆU (vector hóa)
+def _nearest_beat(t, beats):
+    """Với mỗi mẫu: chỉ số beat gần nhất và độ lệch thời gian (s) tới nó"""
+    i = np.clip(np.searchsorted(beats, t), 1, len(beats) - 1)
+    prev_closer = (t - beats[i - 1]) < (beats[i] - t)
+    idx = np.where(prev_closer, i - 1, i)
+    return idx, t - beats[idx]
+
+
+def ecg_wave(t, beats, rr):
+    """ECG tổng Gaussian; đoạn QT co giãn theo sqrt(RR) (Bazett)"""
+    idx, phase = _nearest_beat(t, beats)
+    scale = np.sqrt(rr[idx])
+    y = np.zeros_like(t)
+    for center, width, amp in ECG_WAVES:
+        c = center * scale if center > 0.1 else center
+        y += amp * np.exp(-0.5 * ((phase - c) / width) ** 2)
+    return y
+
+
+def _pulse_shape(ph):
+    """1 xung PPG chuẩn hóa theo thời gian kể từ lúc bắt đầu: tâm thu + sóng dội + phần thoát tâm trương"""
+    ph = np.asarray(ph, dtype=float)
+    systolic = np.exp(-0.5 * ((ph - SYSTOLIC_S) / 0.06) ** 2)
+    dicrotic = 0.35 * np.exp(-0.5 * ((ph - 0.38) / 0.07) ** 2)
+    runoff = 0.3 / (1 + np.exp(-(ph - 0.12) / 0.02)) * np.exp(-np.maximum(ph - 0.12, 0) / 0.5)
+    return np.where(ph >= 0, systolic + dicrotic + runoff, 0.0)
+
+
+def ppg_pulse(t, beats, pat_s=PAT_S):
+    """Xung PPG bắt đầu sau R một khoảng PAT; cộng phần đuôi của xung trước để chân sóng rõ ràng"""
+    onsets = beats + pat_s
+    i = np.clip(np.searchsorted(onsets, t, side='right') - 1, 0, len(onsets) - 1)
+    y = _pulse_shape(t - onsets[i])
+    y += np.where(i > 0, _pulse_shape(t - onsets[np.maximum(i - 1, 0)]), 0.0)
+    return y
+
+
+def ppg_clean(t_ppg, beats, ac, dc):
+    """PPG không nhiễu đã đảo ngược (-IR bỏ DC): xung * ac trừ điều biến hô hấp của DC"""
+    return ac * ppg_pulse(t_ppg, beats) - dc * RESP_DEPTH * np.sin(2 * np.pi * RESP_HZ * t_ppg)
+
+
+def ppg_feet(beats, ac, dc, fs=FS, pat_s=PAT_S, batch=1000):
+    """
+    Ground-truth chân sóng (s) từng beat: cực tiểu của chính ppg_clean (RR thật, điều biến hô hấp,
+    lưới ZOH PPG_RATE như generate) giữa đỉnh tâm thu beat trước và đỉnh tâm thu beat hiện tại.
+    Tính theo lô beat trên lưới fs -> bộ nhớ không phụ thuộc độ dài bản ghi.
+    """
+    peaks = beats + pat_s + SYSTOLIC_S
+    prev = np.concatenate(([peaks[0] - (peaks[1] - peaks[0] if len(peaks) > 1 else 1.0)], peaks[:-1]))
+    width = int(np.ceil(np.max(peaks - prev) * fs)) + 1 if len(peaks) else 0
+    feet = np.empty(len(peaks))
+    for s in range(0, len(peaks), batch):
+        lo, hi = prev[s:s + batch], peaks[s:s + batch]
+        t = np.ceil(lo * fs)[:, None] / fs + np.arange(width) / fs
+        t_ppg = np.floor(t * PPG_RATE) / PPG_RATE
+        y = np.where(t <= hi[:, None], ppg_clean(t_ppg, beats, ac, dc), np.inf)
+        feet[s:s + batch] = t[np.arange(len(t)), np.argmin(y, axis=1)]
+    return feet
+
+
+def pcg_wave(t, beats, rr, rng):
+    """PCG: S1 (sau R ~50ms) và S2 (cuối tâm thu) là các burst sin có bao Gaussian"""
+    idx, phase = _nearest_beat(t, beats)
+    s2_at = 0.30 * np.sqrt(rr[idx])
+    s1 = np.exp(-0.5 * ((phase - 0.05) / 0.015) ** 2) * np.sin(2 * np.pi * 60 * t)
+    s2 = 0.6 * np.exp(-0.5 * ((phase - s2_at) / 0.012) ** 2) * np.sin(2 * np.pi * 90 * t)
+    return s1 + s2 + 0.02 * rng.standard_normal(len(t))
+
+
+def generate(duration_s, fs=FS, hr=70.0, hrv=0.05, arrhythmia=None, spo2=97.0,
+             noise=0.02, mains=0.05, mains_hz=50.0, dropout_rate=0.0, zoh_stall_rate=0.0,
+             jitter_us=700, extra_channels=0, chunk_s=CHUNK_S, seed=0):
+    """
+    Generator sinh các block dữ liệu tổng hợp (mỗi block <= chunk_s giây).
+    Mỗi block: dict {"Timestamp", "PCG", "RED", "IR", "ECG", ("ECG2"...)} dạng số nguyên như firmware.
+    Cuối cùng trả về (qua StopIteration.value / generate_all) chú thích ground-truth.
+    - noise, mains: biên độ nhiễu trắng / nhiễu 50Hz (tương đối biên độ R)
+    - dropout_rate: xác suất mỗi giây có 1 đoạn gói bị DROP (xQueueSend timeout 0)
+    - zoh_stall_rate: xác suất mỗi giây MAX30102 ngừng cập nhật (ZOH kéo dài 0.3-1s)
+    """
+    rng = np.random.default_rng(seed)
+    beats, labels = beat_schedule(duration_s, hr, hrv, arrhythmia, seed=seed)
+    rr = np.diff(beats, append=beats[-1] + 60.0 / hr)
+
+    # SpO2 -> tỷ số R -> biên độ AC kênh RED
+    ratio = (SPO2_CAL[0] - spo2) / SPO2_CAL[1]
+    ac_ir = PERFUSION * IR_DC
+    ac_red = ratio * PERFUSION * RED_DC
+
+    # Sự kiện lỗi (tính trước cho cả bản ghi)
+    n_sec = int(np.ceil(duration_s))
+    drop_sec = np.flatnonzero(rng.random(n_sec) < dropout_rate)
+    drops = [(s + rng.random(), rng.uniform(0.005, 0.08)) for s in drop_sec]
+    stall_sec = np.flatnonzero(rng.random(n_sec) < zoh_stall_rate)
+    stalls = [(s + rng.random(), rng.uniform(0.3, 1.0)) for s in stall_sec]
+
+    n_total = int(duration_s * fs)
+    step = int(chunk_s * fs)
+    dropped = 0
+    for s in range(0, n_total, step):
+        n = min(step, n_total - s)
+        t = (s + np.arange(n)) / fs
+
+        ecg = ecg_wave(t, beats, rr)
+        ecg += noise * rng.standard_normal(n) + mains * np.sin(2 * np.pi * mains_hz * t + 0.3)
+        ecg += 0.1 * np.sin(2 * np.pi * 0.2 * t)  # Trôi đường nền (hô hấp)
+
+        # PPG: lấy mẫu ở PPG_RATE rồi giữ (ZOH) như processing_task
+        t_ppg = np.floor(t * PPG_RATE) / PPG_RATE
+        for st, dur in stalls:
+            held = (t_ppg >= st) & (t_ppg < st + dur)
+            t_ppg[held] = np.floor(st * PPG_RATE) / PPG_RATE
+        pulse = ppg_pulse(t_ppg, beats)
+        resp = RESP_DEPTH * np.sin(2 * np.pi * RESP_HZ * t_ppg)
+        ir = IR_DC * (1 + resp) - ac_ir * pulse + 20 * rng.standard_normal(n)
+        red = RED_DC * (1 + resp) - ac_red * pulse + 20 * rng.standard_normal(n)
+
+        pcg = pcg_wave(t, beats, rr, rng)
+
+        # Timestamp ESP32: processing_task chỉ thức dậy trễ so với tick 1ms
+        esp_us = (t * 1e6).astype(np.int64)
+        if jitter_us:
+            esp_us += rng.integers(0, jitter_us + 1, n)
+        block = {
+            "Timestamp": esp_us,
+            "PCG": np.clip(pcg * 8000, -32768, 32767).astype(np.int16),
+            "RED": np.clip(red, 0, 262143).astype(np.uint32),
+            "IR": np.clip(ir, 0, 262143).astype(np.uint32),
+            "ECG": np.clip(ECG_MID + ECG_GAIN * ecg, 0, 4095).astype(np.int32),
+        }
+        for c in range(extra_channels):
+            lead = 0.7 * 0.8 ** c * ecg + noise * rng.standard_normal(n)   # Biên độ giảm dần, luôn dương
+            block[f"ECG{c + 2}"] = np.clip(ECG_MID + ECG_GAIN * lead, 0, 4095).astype(np.int32)
+
+        # Gói bị DROP: bỏ mẫu, timestamp giữ nguyên để có thể phát hiện khoảng trống
+        keep = np.ones(n, dtype=bool)
+        for st, dur in drops:
+            keep &= ~((t >= st) & (t < st + dur))
+        if not np.all(keep):
+            dropped += int(n - np.count_nonzero(keep))
+            block = {k: v[keep] for k, v in block.items()}
+        yield block
+
+    return {
+        "fs": fs,
+        "duration_s": duration_s,
+        "r_peaks_s": beats.tolist(),
+        "beat_labels": labels.tolist(),
+        "ppg_feet_s": ppg_feet(beats, ac_ir, IR_DC, fs).tolist(),
+        "pat_s": PAT_S,
+        "spo2": spo2,
+        "ratio_r": ratio,
+        "hr": hr,
+        "dropouts": drops,
+        "zoh_stalls": stalls,
+        "dropped_samples": dropped,
+    }
+
+
+def generate_all(duration_s, **kwargs):
+    """Sinh toàn bộ bản ghi vào bộ nhớ: (dict mảng, chú thích)"""
+    gen = generate(duration_s, **kwargs)
+    blocks = []
+    while True:
+        try:
+            blocks.append(next(gen))
+        except StopIteration as stop:
+            truth = stop.value
+            break
+    rec = {k: np.concatenate([b[k] for b in blocks]) for k in blocks[0]}
+    return rec, truth
+
+
+# 3. ĐỊNH DẠNG ĐẦU RA
+def _extra_leads(block):
+    """Tên các kênh ECG phụ theo thứ tự số (ECG2, ..., ECG9, ECG10 - không phải thứ tự chữ cái)"""
+    return sorted((k for k in block if k.startswith("ECG") and k != "ECG"), key=lambda k: int(k[3:]))
+
+
+def format_lines(block):
+    """Block -> bytes theo đúng định dạng printf của logger_task ("%lld,%d,%lu,%lu,%d\\n")"""
+    cols = [block["Timestamp"], block["PCG"], block["RED"], block["IR"], block["ECG"]]
+    cols += [block[k] for k in _extra_leads(block)]
+    table = np.column_stack([c.astype(np.int64) for c in cols])
+    fmt = ",".join(["%d"] * table.shape[1])
+    return ("\n".join(fmt % tuple(row) for row in table.tolist()) + "\n").encode()
+
+
+def format_binary(block):
+    """Block -> bytes các gói nhị phân packed (xem PACKET_DTYPE)"""
+    extra = _extra_leads(block)
+    out = np.empty(len(block["Timestamp"]), dtype=packet_dtype(len(extra)))
+    out["timestamp"], out["pcg"], out["red"] = block["Timestamp"], block["PCG"], block["RED"]
+    out["ir"], out["ecg"] = block["IR"], block["ECG"]
+    for i, k in enumerate(extra):
+        out[f"ecg{i + 2}"] = block[k]
+    return out.tobytes()
+
+
+def score_peaks(detected_idx, truth_s, fs=FS, tol_s=0.05):
+    """Độ nhạy / PPV của bộ phát hiện đỉnh so với ground-truth (ghép gần nhất bằng searchsorted)"""
+    det = np.sort(np.asarray(detected_idx)) / fs
+    truth = np.asarray(truth_s)
+    if len(det) == 0 or len(truth) == 0:
+        return 0.0, 0.0
+    i = np.clip(np.searchsorted(det, truth), 1, len(det) - 1)
+    nearest = np.minimum(np.abs(det[i] - truth), np.abs(det[i - 1] - truth))
+    tp = int(np.count_nonzero(nearest <= tol_s))
+    return tp / len(truth), min(tp / len(det), 1.0)
+
+
+def _open_sink(args):
+    """Đích ghi: file, stdout, hoặc pseudo-terminal (SerialReader mở được như 1 cổng COM)"""
+    if args.pty:
+        master, slave = os.openpty()
+        print(f"PTY: {os.ttyname(slave)}  (đặt SERIAL_PORT = cổng này)", file=sys.stderr)
+        return os.fdopen(master, "wb", buffering=0)
+    if args.output == "-":
+        return sys.stdout.buffer
+    return open(args.output, "wb")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu ECG/PPG/PCG tổng hợp để stress-test phía host")
+    parser.add_argument("-d", "--duration", type=float, default=60, help="Thời lượng (s)")
+    parser.add_argument("--fs", type=int, default=FS, help="Tần số lấy mẫu (Hz)")
+    parser.add_argument("--hr", type=float, default=70, help="Nhịp tim trung bình (BPM)")
+    parser.add_argument("--hrv", type=float, default=0.05, help="Biến thiên RR tương đối")
+    parser.add_argument("--arrhythmia", choices=["ectopic", "af"], default=None)
+    parser.add_argument("--spo2", type=float, default=97, help="SpO2 thật (%%)")
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--mains", type=float, default=0.05, help="Biên độ nhiễu 50Hz")
+    parser.add_argument("--dropout", type=float, default=0.0, help="Xác suất DROP gói mỗi giây")
+    parser.add_argument("--zoh-stall", type=float, default=0.0, help="Xác suất PPG bị treo mỗi giây")
+    parser.add_argument("--channels", type=int, default=0, help="Số kênh ECG phụ")
+    parser.add_argument("--binary", action="store_true", help="Ghi gói nhị phân thay vì dòng text")
+    parser.add_argument("--rate", type=float, default=0, help="Phát theo thời gian thực x rate (0 = nhanh nhất)")
+    parser.add_argument("--pty", action="store_true", help="Phát ra pseudo-terminal")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--benchmark", action="store_true", help="Đo tốc độ / độ chính xác bộ phát hiện")
+    parser.add_argument("-o", "--output", default="synthetic.csv", help="File đầu ra ('-' = stdout)")
+    args = parser.parse_args()
+
+    opts = dict(fs=args.fs, hr=args.hr, hrv=args.hrv, arrhythmia=args.arrhythmia, spo2=args.spo2,
+                noise=args.noise, mains=args.mains, dropout_rate=args.dropout,
+                zoh_stall_rate=args.zoh_stall, extra_channels=args.channels, seed=args.seed)
+
+    if args.benchmark:
+        from detectors import FOOT_WINDOW_S, process_ecg, process_ppg
+        t0 = time.perf_counter()
+        rec, truth = generate_all(args.duration, **opts)
+        t_gen = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        _, r_peaks, _, _ = process_ecg(rec["ECG"].astype(float), args.fs)
+        _, ppg_peaks, feet = process_ppg(-rec["IR"].astype(float), args.fs)
+        t_det = time.perf_counter() - t0
+        n = len(rec["ECG"])
+        se, ppv = score_peaks(r_peaks, truth["r_peaks_s"], args.fs)
+        se_f, ppv_f = score_peaks(feet, truth["ppg_feet_s"], args.fs, tol_s=0.08)
+        # Chân sóng thật = cực tiểu giữa 2 đỉnh tâm thu; điều biến hô hấp kéo nó sớm hơn cửa sổ tìm
+        # FOOT_WINDOW_S của process_ppg ở ~1/3 số beat -> giới hạn của bộ phát hiện, không phải lỗi nhãn.
+        # Kỳ vọng (mặc định, -d 60): foot Se/PPV ~0.60, trong tầm cửa sổ Se ~0.98, ~30% chạm biên cửa sổ.
+        feet_s = np.asarray(truth["ppg_feet_s"])
+        reach = (np.asarray(truth["r_peaks_s"]) + PAT_S + SYSTOLIC_S - feet_s) <= FOOT_WINDOW_S
+        se_in, _ = score_peaks(feet, feet_s[reach], args.fs, tol_s=0.08)
+        edge = np.mean(ppg_peaks - feet == int(FOOT_WINDOW_S * args.fs)) if len(feet) else 0.0
+        print(f"Sinh {n} mẫu: {t_gen:.2f}s ({n / t_gen / 1e6:.1f} M mẫu/s)")
+        print(f"Phát hiện: {t_det:.2f}s ({n / t_det / 1e6:.2f} M mẫu/s)")
+        print(f"R-peak  Se={se:.3f} PPV={ppv:.3f} | PPG foot Se={se_f:.3f} PPV={ppv_f:.3f}")
+        print(f"PPG foot trong tầm cửa sổ {FOOT_WINDOW_S * 1000:.0f}ms: {100 * reach.mean():.0f}% beat, Se={se_in:.3f}"
+              f" | chân sóng phát hiện chạm biên cửa sổ: {100 * edge:.0f}%")
+        sys.exit(0)
+
+    sink = _open_sink(args)
+    if not args.binary and args.output != "-" and not args.pty:
+        sink.write((",".join(COLUMNS + [f"ECG{i + 2}" for i in range(args.channels)]) + "\n").encode())
+
+    # Phát theo block nhỏ khi cần giữ nhịp thời gian thực
+    gen = generate(args.duration, chunk_s=0.1 if args.rate else CHUNK_S, **opts)
+    start = time.monotonic()
+    sent = 0
+    try:
+        while True:
+            block = next(gen)
+            sink.write(format_binary(block) if args.binary else format_lines(block))
+            sent += len(block["Timestamp"])
+            if args.rate:
+                ahead = sent / (args.fs * args.rate) - (time.monotonic() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+    except StopIteration as stop:
+        truth = stop.value
+    finally:
+        if sink is not sys.stdout.buffer:
+            sink.close()
+
+    if args.output != "-" and not args.pty:
+        with open(os.path.splitext(args.output)[0] + "_truth.json", "w") as f:
+            json.dump(truth, f)
+        print(f"Đã ghi {sent} mẫu vào {args.output}", file=sys.stderr)
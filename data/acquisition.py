@@ -0,0 +1,236 @@
+import os
+import sys
+import time
+import threading
+import numpy as np
+from scipy.signal import iirnotch, butter, tf2sos, sosfiltfilt, find_peaks
+from clock_sync import ClockSync, uart_line_time_us
+from signal_quality import SignalQuality, SQI_BLOCK, GOOD, POOR, BAD
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Python_process"))
+from recording_io import SAMPLE_DTYPE
+
+# Phần thu nhận + xử lý dùng chung cho real_time.py (GUI) và headless.py (không GUI).
+# Không import matplotlib / pandas ở đây để tiến trình headless khởi động nhanh.
+
+# CẤU HÌNH HỆ THỐNG
+SERIAL_PORT = 'COM5'       # Đổi cổng COM của bạn
+BAUD_RATE = 921600         # Đảm bảo ESP32 cũng set mức này
+SAMPLE_RATE = 1000         # Hz
+WINDOW_SIZE = 1000 * 10    # Giữ 10 giây dữ liệu
+DSP_DTYPE = np.float32     # Lọc hiển thị / vitals (mọi tần số cắt >= 0.5Hz, xem detectors.FLOAT32_MIN_LOWCUT_HZ)
+
+
+class SampleRing:
+    """
+    Bộ đệm vòng các mẫu SAMPLE_DTYPE (20 byte / mẫu) thay cho 5 deque số nguyên Python.
+    Mỗi mẫu được ghi 2 lần (slot i và i + size) nên N mẫu cuối luôn là 1 lát cắt liên tục:
+    chụp dữ liệu = 1 lần copy bộ nhớ, không phải chuyển đổi từng phần tử.
+    """
+    def __init__(self, size, dtype=SAMPLE_DTYPE):
+        self.size = size
+        self._a = np.zeros(2 * size, dtype=dtype)
+        self._i = 0
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def append(self, row):
+        i = self._i
+        self._a[i] = row
+        self._a[i + self.size] = row
+        self._i = i + 1 if i + 1 < self.size else 0
+        if self._n < self.size:
+            self._n += 1
+
+    def last(self, n=None):
+        """View n mẫu mới nhất theo thứ tự thời gian (copy nếu cần giữ lâu)"""
+        n = self._n if n is None else min(n, self._n)
+        end = self._i + self.size
+        return self._a[end - n:end]
+
+
+# XỬ LÝ TÍN HIỆU (Signal Processing)
+class SignalProcessor:
+    def __init__(self, fs=1000):
+        self.fs = fs
+        self.last_r_peaks = np.empty(0, dtype=int)  # Đỉnh R của lần tính vitals gần nhất
+        
+        # Hệ số dạng SOS, tính bằng DSP_DTYPE (float32: nửa băng thông bộ nhớ so với float64)
+        # 1. ECG Filters (Bandpass 0.5-49 Hz + Notch 50 Hz)
+        self.sos_ecg = butter(2, [0.5, 49], btype='band', fs=fs, output='sos').astype(DSP_DTYPE)
+        self.sos_notch = tf2sos(*iirnotch(50.0, 30, fs)).astype(DSP_DTYPE)
+
+        # 2. PCG Filters (Bandpass 20-400 Hz + Notch 50 Hz)
+        self.sos_pcg = butter(2, [20, 400], btype='band', fs=fs, output='sos').astype(DSP_DTYPE)
+
+        # 3. PPG Filters (Bandpass 0.5-5 Hz cho hiển thị đẹp)
+        self.sos_ppg = butter(2, [0.5, 5], btype='band', fs=fs, output='sos').astype(DSP_DTYPE)
+
+    @staticmethod
+    def _centered(signal):
+        # Bỏ DC trước khi đổi sang float32 (DC của RED / IR ~30000 làm mất độ chính xác)
+        x = np.asarray(signal)
+        return (x - x.mean()).astype(DSP_DTYPE)
+
+    def process_ecg(self, signal):
+        if len(signal) < 100: return signal
+        sig_notch = sosfiltfilt(self.sos_notch, self._centered(signal))
+        return sosfiltfilt(self.sos_ecg, sig_notch)
+
+    def process_pcg(self, signal):
+        if len(signal) < 100: return signal
+        sig_notch = sosfiltfilt(self.sos_notch, self._centered(signal))
+        return sosfiltfilt(self.sos_pcg, sig_notch)
+
+    def process_ppg(self, signal):
+        if len(signal) < 100: return signal
+        return sosfiltfilt(self.sos_ppg, self._centered(signal))
+
+    def calculate_vitals(self, ecg_buffer, red_buffer, ir_buffer, quality=None):
+        hr = 0
+        spo2 = 0
+        self.last_r_peaks = np.empty(0, dtype=int)
+        ecg_level = quality.level("ECG") if quality else GOOD
+        ppg_level = quality.ppg_level if quality else GOOD
+        
+        # --- TÍNH NHỊP TIM TỪ ECG ---
+        # Bỏ qua khi tuột điện cực / bão hòa (BAD): không tốn filtfilt + find_peaks
+        if ecg_level != BAD and len(ecg_buffer) > self.fs * 2:
+            clean_ecg = self.process_ecg(np.asarray(ecg_buffer))
+            # Tìm đỉnh R
+            peaks, _ = find_peaks(clean_ecg, distance=self.fs*0.5, height=np.max(clean_ecg)*0.6)
+            self.last_r_peaks = peaks
+            if len(peaks) > 1:
+                rr_intervals = np.diff(peaks) / self.fs
+                # Chất lượng kém (POOR): dùng trung vị để bền với đỉnh giả
+                avg_rr = np.median(rr_intervals) if ecg_level == POOR else np.mean(rr_intervals)
+                if avg_rr > 0: hr = 60 / avg_rr
+            if quality is not None:
+                quality.channels["ECG"].update_template(clean_ecg, peaks, int(0.1 * self.fs))
+
+        # --- TÍNH SpO2 TỪ PPG (Dùng tín hiệu thô có thành phần DC) ---
+        if ppg_level != BAD and len(red_buffer) > self.fs * 2:
+            red_arr = np.asarray(red_buffer[-self.fs*2:])
+            ir_arr = np.asarray(ir_buffer[-self.fs*2:])
+            
+            ac_red = np.max(red_arr) - np.min(red_arr)
+            dc_red = np.mean(red_arr)
+            ac_ir = np.max(ir_arr) - np.min(ir_arr)
+            dc_ir = np.mean(ir_arr)
+
+            if dc_red != 0 and dc_ir != 0:
+                R = (ac_red / dc_red) / (ac_ir / dc_ir)
+                spo2 = 110 - 25 * R
+                spo2 = np.clip(spo2, 80, 100)
+
+        return int(hr), int(spo2)
+
+# SERIAL READER (THREAD)
+class SerialReader:
+    def __init__(self, port=SERIAL_PORT, baud=BAUD_RATE, window_size=WINDOW_SIZE, on_sample=None):
+        self.port = port
+        self.baud = baud
+        self.running = False
+        self.ser = None
+        # Callback mỗi mẫu (vd: DoubleBufferedRecorder.append, EventCapture.append) - phải nhanh, không làm I/O
+        # Nhận 1 hàm hoặc list/tuple nhiều hàm
+        if on_sample is None:
+            on_sample = ()
+        elif callable(on_sample):
+            on_sample = (on_sample,)
+        self.on_sample = tuple(on_sample)
+        self.processor = SignalProcessor(fs=SAMPLE_RATE)
+        # Đồng bộ đồng hồ ESP32 -> host (độ trôi, jitter, độ trễ)
+        self.clock = ClockSync(base_latency_us=uart_line_time_us(baud))
+        # Chỉ số chất lượng tín hiệu, cập nhật mỗi SQI_BLOCK mẫu
+        self.quality = SignalQuality(fs=SAMPLE_RATE)
+        self._sqi_blk = {"ECG": [], "PCG": [], "RED": [], "IR": []}
+        
+        # Buffer (lock giữ các kênh đồng bộ khi thread vẽ chụp dữ liệu)
+        self.lock = threading.Lock()
+        self.n_samples = 0  # Tổng số mẫu đã nhận -> chỉ số mẫu tuyệt đối
+        self.buf = SampleRing(window_size)
+
+    def start(self):
+        import serial  # pyserial chỉ cần khi mở cổng thật (replay / import không cần)
+        try:
+            self.ser = serial.Serial(self.port, self.baud, timeout=1)
+            self.running = True
+            self.thread = threading.Thread(target=self.update, daemon=True)
+            self.thread.start()
+            print(f"Connected to {self.port} @ {self.baud}")
+        except Exception as e:
+            print(f"Serial Error: {e}")
+
+    def update(self):
+        while self.running:
+            try:
+                line = self.ser.readline().decode('utf-8').strip()
+                host_t = time.monotonic()
+                if not line: continue
+                parts = line.split(',')
+                if len(parts) == 5:
+                    timestamp = int(parts[0])
+                    pcg = int(parts[1])
+                    red = int(parts[2])
+                    ir  = int(parts[3])
+                    ecg = int(parts[4])
+                    
+                    self.ingest(timestamp, pcg, red, ir, ecg, host_t)
+            except ValueError: pass
+            except Exception: pass
+
+    def ingest(self, timestamp, pcg, red, ir, ecg, host_t=None):
+        """Nạp 1 mẫu (từ serial, hoặc từ file ghi khi replay)"""
+        self.clock.update(timestamp, time.monotonic() if host_t is None else host_t)
+        with self.lock:
+            self.buf.append((timestamp, pcg, red, ir, ecg))
+            self.n_samples += 1
+        self._update_quality(ecg, pcg, red, ir)
+        for cb in self.on_sample:
+            cb(timestamp, pcg, red, ir, ecg)
+    
+    def snapshot(self):
+        """Chụp buffer cùng 1 thời điểm: (tổng số mẫu, ecg int16, pcg int16, red int32, ir int32)"""
+        with self.lock:
+            rows = self.buf.last().copy()
+            n = self.n_samples
+        return n, rows["ECG"], rows["PCG"], rows["RED"], rows["IR"]
+
+    def wall_time(self, idx, t0):
+        """
+        Thời gian thực (giây, gốc time.time()) của mẫu có chỉ số tuyệt đối idx (scalar / mảng; idx = n_samples
+        tính như mẫu mới nhất): timestamp ESP32 của mẫu qua ClockSync.to_host, nên không lệch theo mất mẫu,
+        độ trôi đồng hồ hay độ trễ hàng đợi. Đồng hồ chưa khớp / mẫu đã rời buffer / mẫu thuộc phiên ESP32
+        trước lần khởi động lại -> t0 + idx / fs (t0: thời điểm thực của mẫu 0).
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        ts = None
+        with self.lock:
+            n = self.n_samples
+            pos = np.minimum(idx, n - 1) - (n - len(self.buf))
+            if self.clock.ready and idx.size and pos.min() >= 0:
+                ts = self.buf.last()["Timestamp"][pos]
+        if ts is None or np.max(ts) > self.clock.last_esp:
+            return t0 + idx / SAMPLE_RATE
+        return self.clock.to_host(ts) + (time.time() - time.monotonic())
+
+    def last_timestamp(self):
+        with self.lock:
+            return int(self.buf.last(1)["Timestamp"][0]) if len(self.buf) else None
+
+    def _update_quality(self, ecg, pcg, red, ir):
+        blk = self._sqi_blk
+        blk["ECG"].append(ecg)
+        blk["PCG"].append(pcg)
+        blk["RED"].append(red)
+        blk["IR"].append(ir)
+        if len(blk["ECG"]) >= SQI_BLOCK:
+            self.quality.update_block(**blk)
+            self._sqi_blk = {"ECG": [], "PCG": [], "RED": [], "IR": []}
+
+    def close(self):
+        self.running = False
+        if self.ser is not None and self.ser.is_open: self.ser.close()
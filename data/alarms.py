@@ -0,0 +1,187 @@
+import json
+import time
+import queue
+import socket
+import threading
+from collections import deque
+
+# CẤU HÌNH
+ALARM_LOG = "alarms.log"
+PAUSE_S = 3.0              # Không có beat >= 3s (ngưng xoang / vô tâm thu) -> cảnh báo PAUSE
+
+
+class AlarmRule:
+    """
+    1 luật cảnh báo trên 1 chỉ số ("hr", "spo2" hoặc "rr": giây kể từ beat trước).
+    - op "<" / ">": so với ngưỡng, phải kéo dài duration_s mới bật; tắt khi vượt ngưỡng ± hysteresis
+    - op "rate<" / "rate>": tốc độ thay đổi (đơn vị/phút) trên cửa sổ rate_window_s so với ngưỡng
+    """
+    def __init__(self, name, metric, op, threshold, duration_s=0.0, hysteresis=0.0, rate_window_s=30.0):
+        self.name = name
+        self.metric = metric
+        self.op = op
+        self.threshold = threshold
+        self.duration_s = duration_s
+        self.hysteresis = hysteresis
+        self.rate_window_s = rate_window_s
+
+        self.active = False
+        self._since = None                  # Thời điểm điều kiện bắt đầu đúng
+        self._history = deque()             # (t, value) cho luật tốc độ thay đổi
+
+    def _value(self, t, v):
+        """Giá trị đem so: chính chỉ số, hoặc tốc độ thay đổi (đơn vị/phút)"""
+        if not self.op.startswith("rate"):
+            return v
+        h = self._history
+        h.append((t, v))
+        while h and t - h[0][0] > self.rate_window_s:
+            h.popleft()
+        if len(h) < 2 or t - h[0][0] < self.rate_window_s / 2:
+            return None
+        return (v - h[0][1]) / (t - h[0][0]) * 60
+
+    def evaluate(self, t, v):
+        """Đánh giá tăng dần; trả về "ON" / "OFF" khi trạng thái đổi, ngược lại None"""
+        x = self._value(t, v)
+        if x is None:
+            return None
+        below = self.op.endswith("<")
+        if self.active:
+            # Hysteresis: chỉ tắt khi đã ra khỏi ngưỡng một khoảng
+            clear = x > self.threshold + self.hysteresis if below else x < self.threshold - self.hysteresis
+            if clear:
+                self.active = False
+                self._since = None
+                return "OFF"
+            return None
+
+        violated = x < self.threshold if below else x > self.threshold
+        if not violated:
+            self._since = None
+            return None
+        if self._since is None:
+            self._since = t
+        if t - self._since >= self.duration_s:
+            self.active = True
+            return "ON"
+        return None
+
+
+def default_rules():
+    """Bộ luật mặc định (tạo mới mỗi lần vì mỗi luật giữ trạng thái riêng)"""
+    return [
+        AlarmRule("BRADYCARDIA", "hr", "<", 50, duration_s=5, hysteresis=3),
+        AlarmRule("TACHYCARDIA", "hr", ">", 120, duration_s=5, hysteresis=5),
+        AlarmRule("DESATURATION", "spo2", "<", 90, duration_s=10, hysteresis=2),
+        AlarmRule("HR_RISE", "hr", "rate>", 30, hysteresis=10),
+        AlarmRule("SPO2_DROP", "spo2", "rate<", -6, hysteresis=2),
+        AlarmRule("PAUSE", "rr", ">", PAUSE_S, hysteresis=1.0),
+    ]
+
+
+# ĐÍCH NHẬN SỰ KIỆN
+class LogSink:
+    """Ghi mỗi sự kiện thành 1 dòng JSON"""
+    def __init__(self, path=ALARM_LOG):
+        self.f = open(path, "a")
+
+    def __call__(self, event):
+        self.f.write(json.dumps(event) + "\n")
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class SocketSink:
+    """Gửi sự kiện dạng JSON qua UDP (vd: tới máy trạm giám sát)"""
+    def __init__(self, host="127.0.0.1", port=5005):
+        self.addr = (host, port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, event):
+        self.sock.sendto(json.dumps(event).encode(), self.addr)
+
+    def close(self):
+        self.sock.close()
+
+
+def print_sink(event):
+    print(f"[ALARM] {event['rule']} {event['state']} value={event['value']:.1f} t={event['t']:.1f}s")
+
+
+class AlarmEngine:
+    """
+    Đánh giá luật tăng dần theo từng beat / mỗi lần cập nhật SpO2 (O(số luật) mỗi lần).
+    Sự kiện được đẩy qua queue cho 1 thread riêng gọi các sink, nên việc ghi log / gửi
+    socket không chặn luồng xử lý và không chạm vào vòng đọc serial.
+    """
+    def __init__(self, rules=None, sinks=None, wall_clock=None):
+        self.rules = rules if rules is not None else default_rules()
+        self.sinks = list(sinks) if sinks else [print_sink]
+        # t (giây theo chỉ số mẫu) -> thời gian thực của mẫu đó (SerialReader.wall_time); None: lúc đánh giá
+        self.wall_clock = wall_clock
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+        self.last_r = None
+
+    def _dispatch(self):
+        while True:
+            event = self._queue.get()
+            if event is None:
+                break
+            for sink in self.sinks:
+                try:
+                    sink(event)
+                except Exception as e:
+                    print(f"Alarm sink error: {e}")
+
+    def update(self, metric, t, value):
+        """Nạp 1 giá trị mới của chỉ số metric tại thời điểm t (s)"""
+        for rule in self.rules:
+            if rule.metric != metric:
+                continue
+            state = rule.evaluate(t, value)
+            if state is not None:
+                self._queue.put({"rule": rule.name, "state": state, "metric": metric,
+                                 "value": float(value), "t": float(t),
+                                 "wall_time": float(self.wall_clock(t)) if self.wall_clock else time.time()})
+
+    def on_beats(self, r_abs, fs, now=None):
+        """
+        Nạp các đỉnh R (chỉ số mẫu tuyệt đối); chỉ các beat mới được đánh giá, HR = 60/RR.
+        Chỉ gọi khi ECG không BAD (khoảng BAD: gọi on_ecg_lost) nên khoảng trống giữa 2 beat là thật.
+        now: chỉ số mẫu mới nhất -> luật "rr" thấy cả khoảng nghỉ đang diễn ra (vô tâm thu không có beat kết thúc).
+        """
+        for r in r_abs:
+            if self.last_r is not None and r <= self.last_r + 0.2 * fs:
+                continue  # Beat đã thấy ở cửa sổ trước
+            if self.last_r is not None:
+                rr = r - self.last_r
+                self.update("rr", r / fs, rr / fs)
+                # RR >= PAUSE_S thuộc luật PAUSE, không đưa vào HR (tránh báo nhịp chậm kèm theo)
+                if rr < PAUSE_S * fs:
+                    self.update("hr", r / fs, 60.0 * fs / rr)
+            self.last_r = int(r)
+        if now is not None and self.last_r is not None:
+            self.update("rr", now / fs, (now - self.last_r) / fs)
+
+    def on_ecg_lost(self):
+        """ECG BAD (tuột điện cực / bão hòa): quên beat trước để khoảng mất tín hiệu không thành PAUSE / nhịp chậm giả"""
+        self.last_r = None
+
+    def on_spo2(self, t, spo2):
+        self.update("spo2", t, spo2)
+
+    @property
+    def active(self):
+        return [r.name for r in self.rules if r.active]
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=1)
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
@@ -0,0 +1,139 @@
+import numpy as np
+from collections import deque
+
+# CẤU HÌNH
+BLOCK_SIZE = 100        # Số mẫu gộp thành 1 điểm hồi quy (100ms @ 1000Hz)
+WINDOW_BLOCKS = 60      # Cửa sổ trượt: 60 block = 6 giây
+LINE_BYTES = 32         # Độ dài trung bình 1 dòng "ts,pcg,red,ir,ecg\n"
+
+
+def uart_line_time_us(baud, line_bytes=LINE_BYTES):
+    """Thời gian truyền 1 dòng qua UART (8N1 = 10 bit/byte), dùng làm độ trễ tối thiểu"""
+    return line_bytes * 10 * 1e6 / baud
+
+
+def theil_sen(x, y):
+    """Hồi quy Theil-Sen (trung vị độ dốc từng cặp điểm), bền với ngoại lai"""
+    dx = np.subtract.outer(x, x)
+    dy = np.subtract.outer(y, y)
+    iu = np.triu_indices(len(x), k=1)
+    dx, dy = dx[iu], dy[iu]
+    ok = dx != 0
+    if not np.any(ok):
+        return 0.0, float(np.median(y))
+    slope = float(np.median(dy[ok] / dx[ok]))
+    intercept = float(np.median(y - slope * x))
+    return slope, intercept
+
+
+class ClockSync:
+    """
+    Ước lượng online ánh xạ thời gian ESP32 (esp_timer_get_time, us) -> thời gian host (monotonic).
+
+    Mô hình: offset d = host_us - esp_us = intercept + slope * esp_us.
+    Độ trễ truyền/đệm luôn dương nên với mỗi block ta chỉ lấy offset nhỏ nhất
+    (đường bao dưới = đường đi nhanh nhất), sau đó hồi quy Theil-Sen trên cửa sổ trượt.
+    - slope * 1e6      -> độ trôi đồng hồ (ppm)
+    - d - fit(esp)     -> độ trễ vượt mức tối thiểu (hàng đợi logger_task, buffer USB, ...)
+    """
+    def __init__(self, block_size=BLOCK_SIZE, window_blocks=WINDOW_BLOCKS, base_latency_us=0.0):
+        self.block_size = block_size
+        self.base_latency_us = base_latency_us
+        self.blocks = deque(maxlen=window_blocks)  # (esp_us, d_min, d_mean, d_std, d_max)
+        self.slope = 0.0
+        self.intercept = None
+        self.last_esp = None
+        self.resets = 0
+        self._stats = None
+        self._reset_block()
+
+    def _reset_block(self):
+        self._n = 0
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._min_d = np.inf
+        self._max_d = -np.inf
+        self._min_esp = 0
+
+    def reset(self):
+        """Gọi khi ESP32 khởi động lại (timestamp chạy lùi)"""
+        self.blocks.clear()
+        self.slope = 0.0
+        self.intercept = None
+        self.last_esp = None
+        self._stats = None
+        self.resets += 1
+        self._reset_block()
+
+    def update(self, esp_us, host_s):
+        """Nạp 1 cặp (timestamp ESP32, thời điểm host nhận dòng). Chi phí O(1) trung bình."""
+        if self.last_esp is not None and esp_us < self.last_esp:
+            self.reset()
+        self.last_esp = esp_us
+
+        d = host_s * 1e6 - esp_us
+        self._n += 1
+        self._sum += d
+        self._sumsq += d * d
+        if d < self._min_d:
+            self._min_d = d
+            self._min_esp = esp_us
+        if d > self._max_d:
+            self._max_d = d
+
+        if self._n >= self.block_size:
+            mean = self._sum / self._n
+            std = np.sqrt(max(self._sumsq / self._n - mean * mean, 0.0))
+            self.blocks.append((self._min_esp, self._min_d, mean, std, self._max_d))
+            self._reset_block()
+            self._refit()
+
+    def _refit(self):
+        arr = np.array(self.blocks)
+        if len(arr) < 3:
+            # Chưa đủ điểm: chỉ ước lượng offset
+            self.intercept = float(np.min(arr[:, 1]))
+        else:
+            # Trừ gốc để tránh mất độ chính xác khi esp_us lớn
+            x0 = arr[0, 0]
+            slope, intercept = theil_sen(arr[:, 0] - x0, arr[:, 1])
+            self.slope = slope
+            self.intercept = intercept - slope * x0
+
+        # Tính sẵn thống kê tại đây (thread đọc serial) để thread vẽ chỉ đọc dict
+        fit = self.min_offset_us(arr[:, 0])
+        self._stats = {
+            "drift_ppm": self.slope * 1e6,
+            "jitter_us": float(np.median(arr[:, 3])),
+            "latency_mean_us": float(np.mean(arr[:, 2] - fit)) + self.base_latency_us,
+            "latency_max_us": float(np.max(arr[:, 4] - fit)) + self.base_latency_us,
+            "blocks": len(arr),
+        }
+
+    @property
+    def ready(self):
+        return self.intercept is not None
+
+    def min_offset_us(self, esp_us):
+        """Offset tối thiểu (đường bao dưới) tại thời điểm esp_us"""
+        return self.intercept + self.slope * np.asarray(esp_us, dtype=float)
+
+    def to_host(self, esp_us):
+        """
+        Đặt mẫu lên trục thời gian chung (giây, cùng gốc time.monotonic()).
+        Nhận scalar hoặc mảng timestamp ESP32.
+        """
+        esp = np.asarray(esp_us, dtype=float)
+        return (esp + self.min_offset_us(esp) - self.base_latency_us) / 1e6
+
+    def latency_us(self, esp_us, host_s):
+        """Độ trễ thực từ lúc lấy mẫu trên ESP32 đến thời điểm host_s (vd: lúc vẽ lên màn hình)"""
+        esp = np.asarray(esp_us, dtype=float)
+        return np.asarray(host_s) * 1e6 - esp - self.min_offset_us(esp) + self.base_latency_us
+
+    def stats(self):
+        """Tóm tắt: độ trôi (ppm), jitter (us), độ trễ trung bình / lớn nhất (us)"""
+        if self._stats is None:
+            return {"drift_ppm": 0.0, "jitter_us": 0.0, "latency_mean_us": 0.0,
+                    "latency_max_us": 0.0, "blocks": 0}
+        return self._stats
@@ -1,11 +1,9 @@
-import serial
 import time
 import threading
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
 from collections import deque
 from scipy.signal import iirnotch, butter, filtfilt, find_peaks
+from signal_quality import SignalQuality, SQI_BLOCK, GOOD, POOR, BAD, format_vital
 
 # CẤU HÌNH HỆ THỐNG
 SERIAL_PORT = 'COM5'       # Đổi cổng COM của bạn
@@ -58,18 +56,21 @@ class SignalProcessor:
         except:
             return raw_ppg
 
-    def calculate_vitals(self, ecg_buffer, red_buffer, ir_buffer):
+    def calculate_vitals(self, ecg_buffer, red_buffer, ir_buffer, quality=None):
         """
         Tính BPM và SpO2
+        quality (SignalQuality): BAD -> bỏ qua stage tương ứng, POOR -> dùng ước lượng bền hơn
         """
         bpm = 0.0
         spo2 = 0.0
+        ecg_level = quality.level("ECG") if quality else GOOD
+        ppg_level = quality.ppg_level if quality else GOOD
         
         # Lấy dữ liệu 3 giây gần nhất để tính toán
         calc_window = self.fs * 3
         
         # --- 1. TÍNH BPM TỪ ECG ---
-        if len(ecg_buffer) > calc_window:
+        if ecg_level != BAD and len(ecg_buffer) > calc_window:
             raw_ecg_segment = np.array(list(ecg_buffer)[-calc_window:])
             clean_ecg = self.process_ecg(raw_ecg_segment)
             
@@ -78,14 +79,16 @@ class SignalProcessor:
             
             if len(peaks) > 1:
                 rr_intervals = np.diff(peaks) / self.fs
-                avg_rr = np.mean(rr_intervals)
+                avg_rr = np.median(rr_intervals) if ecg_level == POOR else np.mean(rr_intervals)
                 if avg_rr > 0: 
                     bpm = 60 / avg_rr
+            if quality is not None:
+                quality.channels["ECG"].update_template(clean_ecg, peaks, int(0.1 * self.fs))
 
         # --- 2. TÍNH SpO2 TỪ PPG ---
         # Lưu ý: Tính SpO2 cần dùng tín hiệu thô (hoặc đảo ngược) nhưng KHÔNG dùng bộ lọc High-pass mạnh
         # vì sẽ mất thành phần DC. Ta dùng tín hiệu thô đảo ngược.
-        if len(red_buffer) > calc_window:
+        if ppg_level != BAD and len(red_buffer) > calc_window:
             # Lấy dữ liệu và đảo ngược để đỉnh hướng lên
             red_arr = -1 * np.array(list(red_buffer)[-calc_window:]) 
             ir_arr  = -1 * np.array(list(ir_buffer)[-calc_window:])
@@ -115,6 +118,9 @@ class SerialReader:
         self.baud = baud
         self.running = False
         self.processor = SignalProcessor(fs=SAMPLE_RATE)
+        # Chỉ số chất lượng tín hiệu, cập nhật mỗi SQI_BLOCK mẫu
+        self.quality = SignalQuality(fs=SAMPLE_RATE)
+        self._sqi_blk = {"ECG": [], "RED": [], "IR": []}
         
         # Buffers
         self.ecg_buf = deque(maxlen=WINDOW_SIZE)
@@ -122,6 +128,7 @@ class SerialReader:
         self.ir_buf = deque(maxlen=WINDOW_SIZE)
 
     def start(self):
+        import serial  # Import muộn: module import được khi không có pyserial
         try:
             self.ser = serial.Serial(self.port, self.baud, timeout=1)
             self.running = True
@@ -147,108 +154,127 @@ class SerialReader:
                     self.ecg_buf.append(ecg)
                     self.red_buf.append(red)
                     self.ir_buf.append(ir)
+                    self._update_quality(ecg, red, ir)
             except: pass
     
+    def _update_quality(self, ecg, red, ir):
+        blk = self._sqi_blk
+        blk["ECG"].append(ecg)
+        blk["RED"].append(red)
+        blk["IR"].append(ir)
+        if len(blk["ECG"]) >= SQI_BLOCK:
+            self.quality.update_block(**blk)
+            self._sqi_blk = {"ECG": [], "RED": [], "IR": []}
+
     def close(self):
         self.running = False
         if self.ser.is_open: self.ser.close()
 
 # VISUALIZATION
-reader = SerialReader(SERIAL_PORT, BAUD_RATE)
-reader.start()
-
-plt.style.use('default') 
-fig, (ax_ecg, ax_red, ax_ir) = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
-fig.suptitle('REAL-TIME SIGNAL PROCESSING', fontsize=16, fontweight='bold')
-
-# --- 1. ECG ---
-line_ecg, = ax_ecg.plot([], [], 'g-', lw=1.2)
-ax_ecg.set_title("1. ECG (Filtered: 0.5-49Hz + Notch)", loc='left', color='darkgreen', fontweight='bold')
-ax_ecg.set_ylabel("Amplitude")
-ax_ecg.grid(True, linestyle='--', alpha=0.5)
-text_bpm = ax_ecg.text(0.98, 0.85, 'BPM: --', transform=ax_ecg.transAxes, 
-                      color='darkgreen', fontsize=14, fontweight='bold', ha='right')
-
-# --- 2. PPG RED ---
-line_red, = ax_red.plot([], [], 'r-', lw=1.5)
-ax_red.set_title("2. PPG RED (Filtered: 0.1-5Hz)", loc='left', color='red', fontweight='bold')
-ax_red.set_ylabel("Intensity")
-ax_red.grid(True, linestyle='--', alpha=0.5)
-
-# --- 3. PPG IR ---
-line_ir, = ax_ir.plot([], [], color='darkblue', lw=1.5)
-ax_ir.set_title("3. PPG IR (Filtered: 0.1-5Hz)", loc='left', color='darkblue', fontweight='bold')
-ax_ir.set_xlabel("Time (samples)")
-ax_ir.set_ylabel("Intensity")
-ax_ir.grid(True, linestyle='--', alpha=0.5)
-text_spo2 = ax_ir.text(0.98, 0.85, 'SpO2: --%', transform=ax_ir.transAxes, 
-                        color='darkblue', fontsize=14, fontweight='bold', ha='right')
-
-frame_count = 0 
-
-def animate(i):
-    global frame_count
-    frame_count += 1
-    
-    if len(reader.ecg_buf) < SAMPLE_RATE: return tuple()
-    
-    # Chỉ lấy dữ liệu trong cửa sổ hiển thị để xử lý (tối ưu tốc độ)
-    display_len = SAMPLE_RATE * DISPLAY_SECONDS 
-    current_len = len(reader.ecg_buf)
-    if display_len > current_len: display_len = current_len
-    
-    # Lấy dữ liệu thô từ buffer
-    raw_ecg = np.array(list(reader.ecg_buf)[-display_len:])
-    raw_red = np.array(list(reader.red_buf)[-display_len:])
-    raw_ir  = np.array(list(reader.ir_buf)[-display_len:])
-    
-    # --- XỬ LÝ TÍN HIỆU ---
-    clean_ecg = reader.processor.process_ecg(raw_ecg)
-    vis_red   = reader.processor.process_ppg(raw_red)
-    vis_ir    = reader.processor.process_ppg(raw_ir)
-
-    # --- VẼ ĐỒ THỊ ---
-    # Down-sample nếu dữ liệu quá nhiều (vẽ mỗi điểm thứ 2)
-    step = 2 if len(clean_ecg) > 2000 else 1
-    x_axis = np.arange(len(clean_ecg))[::step]
-    
-    line_ecg.set_data(x_axis, clean_ecg[::step])
-    line_red.set_data(x_axis, vis_red[::step])
-    line_ir.set_data(x_axis, vis_ir[::step])
+def main(port=SERIAL_PORT, baud=BAUD_RATE):
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
 
-    ax_ecg.set_xlim(0, len(clean_ecg))
-    
-    # --- AUTO SCALE TRỤC Y (Chạy mỗi 10 frame) ---
-    if frame_count % 10 == 0:
-        # Scale ECG
-        if len(clean_ecg) > 0:
-            mn, mx = np.min(clean_ecg), np.max(clean_ecg)
-            margin = (mx - mn) * 0.1
-            ax_ecg.set_ylim(mn - margin, mx + margin)
-        
-        # Scale PPG (dùng vis_red đã đảo ngược)
-        if len(vis_red) > 0:
-            mn, mx = np.min(vis_red), np.max(vis_red)
-            margin = (mx - mn) * 0.1
-            ax_red.set_ylim(mn - margin, mx + margin)
-            
-        if len(vis_ir) > 0:
-            mn, mx = np.min(vis_ir), np.max(vis_ir)
-            margin = (mx - mn) * 0.1
-            ax_ir.set_ylim(mn - margin, mx + margin)
-
-    # --- TÍNH TOÁN BPM & SpO2 (Chạy mỗi 30 frame ~ 1 giây) ---
-    if frame_count % 30 == 0:
-        bpm_val, spo2_val = reader.processor.calculate_vitals(
-            reader.ecg_buf, reader.red_buf, reader.ir_buf
-        )
-        text_bpm.set_text(f"BPM: {bpm_val}")
-        text_spo2.set_text(f"SpO2: {spo2_val}%")
-
-    return line_ecg, line_red, line_ir, text_bpm, text_spo2
-
-ani = FuncAnimation(fig, animate, interval=30, blit=True)
-plt.tight_layout()
-plt.show()
-
-reader.close()
\ No newline at end of file
+    reader = SerialReader(port, baud)
+    reader.start()
+
+    plt.style.use('default') 
+    fig, (ax_ecg, ax_red, ax_ir) = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
+    fig.suptitle('REAL-TIME SIGNAL PROCESSING', fontsize=16, fontweight='bold')
+
+    # --- 1. ECG ---
+    line_ecg, = ax_ecg.plot([], [], 'g-', lw=1.2)
+    ax_ecg.set_title("1. ECG (Filtered: 0.5-49Hz + Notch)", loc='left', color='darkgreen', fontweight='bold')
+    ax_ecg.set_ylabel("Amplitude")
+    ax_ecg.grid(True, linestyle='--', alpha=0.5)
+    text_bpm = ax_ecg.text(0.98, 0.85, 'BPM: --', transform=ax_ecg.transAxes, 
+                          color='darkgreen', fontsize=14, fontweight='bold', ha='right')
+
+    # --- 2. PPG RED ---
+    line_red, = ax_red.plot([], [], 'r-', lw=1.5)
+    ax_red.set_title("2. PPG RED (Filtered: 0.1-5Hz)", loc='left', color='red', fontweight='bold')
+    ax_red.set_ylabel("Intensity")
+    ax_red.grid(True, linestyle='--', alpha=0.5)
+
+    # --- 3. PPG IR ---
+    line_ir, = ax_ir.plot([], [], color='darkblue', lw=1.5)
+    ax_ir.set_title("3. PPG IR (Filtered: 0.1-5Hz)", loc='left', color='darkblue', fontweight='bold')
+    ax_ir.set_xlabel("Time (samples)")
+    ax_ir.set_ylabel("Intensity")
+    ax_ir.grid(True, linestyle='--', alpha=0.5)
+    text_spo2 = ax_ir.text(0.98, 0.85, 'SpO2: --%', transform=ax_ir.transAxes, 
+                            color='darkblue', fontsize=14, fontweight='bold', ha='right')
+
+    frame_count = 0 
+
+    def animate(i):
+        nonlocal frame_count
+        frame_count += 1
+
+        if len(reader.ecg_buf) < SAMPLE_RATE: return tuple()
+
+        # Chỉ lấy dữ liệu trong cửa sổ hiển thị để xử lý (tối ưu tốc độ)
+        display_len = SAMPLE_RATE * DISPLAY_SECONDS 
+        current_len = len(reader.ecg_buf)
+        if display_len > current_len: display_len = current_len
+
+        # Lấy dữ liệu thô từ buffer
+        raw_ecg = np.array(list(reader.ecg_buf)[-display_len:])
+        raw_red = np.array(list(reader.red_buf)[-display_len:])
+        raw_ir  = np.array(list(reader.ir_buf)[-display_len:])
+
+        # --- XỬ LÝ TÍN HIỆU ---
+        clean_ecg = reader.processor.process_ecg(raw_ecg)
+        vis_red   = reader.processor.process_ppg(raw_red)
+        vis_ir    = reader.processor.process_ppg(raw_ir)
+
+        # --- VẼ ĐỒ THỊ ---
+        # Down-sample nếu dữ liệu quá nhiều (vẽ mỗi điểm thứ 2)
+        step = 2 if len(clean_ecg) > 2000 else 1
+        x_axis = np.arange(len(clean_ecg))[::step]
+
+        line_ecg.set_data(x_axis, clean_ecg[::step])
+        line_red.set_data(x_axis, vis_red[::step])
+        line_ir.set_data(x_axis, vis_ir[::step])
+
+        ax_ecg.set_xlim(0, len(clean_ecg))
+
+        # --- AUTO SCALE TRỤC Y (Chạy mỗi 10 frame) ---
+        if frame_count % 10 == 0:
+            # Scale ECG
+            if len(clean_ecg) > 0:
+                mn, mx = np.min(clean_ecg), np.max(clean_ecg)
+                margin = (mx - mn) * 0.1
+                ax_ecg.set_ylim(mn - margin, mx + margin)
+
+            # Scale PPG (dùng vis_red đã đảo ngược)
+            if len(vis_red) > 0:
+                mn, mx = np.min(vis_red), np.max(vis_red)
+                margin = (mx - mn) * 0.1
+                ax_red.set_ylim(mn - margin, mx + margin)
+
+            if len(vis_ir) > 0:
+                mn, mx = np.min(vis_ir), np.max(vis_ir)
+                margin = (mx - mn) * 0.1
+                ax_ir.set_ylim(mn - margin, mx + margin)
+
+        # --- TÍNH TOÁN BPM & SpO2 (Chạy mỗi 30 frame ~ 1 giây) ---
+        if frame_count % 30 == 0:
+            q = reader.quality
+            bpm_val, spo2_val = reader.processor.calculate_vitals(
+                reader.ecg_buf, reader.red_buf, reader.ir_buf, quality=q
+            )
+            text_bpm.set_text(format_vital("BPM", bpm_val, q.level("ECG")))
+            text_spo2.set_text(format_vital("SpO2", spo2_val, q.ppg_level, "%"))
+
+        return line_ecg, line_red, line_ir, text_bpm, text_spo2
+
+    ani = FuncAnimation(fig, animate, interval=30, blit=True)
+    plt.tight_layout()
+    plt.show()
+
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import queue
+import threading
+import numpy as np
+from signal_quality import BAD
+from acquisition import SampleRing, SAMPLE_RATE
+
+# CẤU HÌNH
+EVENT_DIR = "events"
+PRE_S = 20                 # Giữ 20 giây TRƯỚC sự kiện ...
+POST_S = 10                # ... và ghi thêm 10 giây SAU sự kiện
+COOLDOWN_S = 30            # Cùng 1 loại + nhãn (trừ marker bấm tay) không bắt lại trong 30s
+
+
+class EventCapture:
+    """
+    Bắt sự kiện có phần trước-kích-hoạt từ luồng mẫu live (không cần store_data.py ghi cả phiên):
+    - append(): gọi cho từng mẫu từ luồng đọc serial (cùng chữ ký DoubleBufferedRecorder.append),
+      giữ (pre + post) giây gần nhất trong SampleRing cỡ cố định.
+    - trigger(): cảnh báo / marker bấm phím / chất lượng tín hiệu tụt -> hẹn cắt đoạn khi đủ post_s.
+    - Đoạn đủ hạn được copy ra (1 lát cắt liên tục, ~0.6MB) và trao qua queue cho thread ghi
+      -> luồng đọc / vẽ không bao giờ chờ đĩa. Mỗi sự kiện = 1 file .npz nén (mẫu SAMPLE_DTYPE +
+      meta JSON), đọc lại được bằng recording_io.load_recording; events.jsonl là mục lục.
+    """
+    def __init__(self, out_dir=EVENT_DIR, pre_s=PRE_S, post_s=POST_S, fs=SAMPLE_RATE, cooldown_s=COOLDOWN_S):
+        self.out_dir = out_dir
+        self.fs = fs
+        self.pre = int(pre_s * fs)
+        self.post = int(post_s * fs)
+        self.cooldown = int(cooldown_s * fs)
+        self.session = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.ring = SampleRing(self.pre + self.post + fs)
+        self.n = 0                 # Tổng số mẫu đã nhận (chỉ số tuyệt đối, giống SerialReader.n_samples)
+        self._pending = []         # (hạn cắt, chỉ số kích hoạt, meta)
+        self._due = None           # Hạn sớm nhất: luồng đọc chỉ so sánh 1 số nguyên mỗi mẫu
+        self._last = {}            # (loại, nhãn) -> chỉ số kích hoạt gần nhất (cooldown)
+        self._levels = {}          # Mức chất lượng lần trước của từng kênh
+        self._lock = threading.Lock()
+
+        self._queue = queue.SimpleQueue()
+        self.saved = []            # Đường dẫn các file đã ghi
+        self.error = None
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    # --- PHÍA LUỒNG ĐỌC SERIAL ---
+    def append(self, ts, pcg, red, ir, ecg):
+        self.ring.append((ts, pcg, red, ir, ecg))
+        self.n += 1
+        if self._due is not None and self.n >= self._due:
+            self._collect()
+
+    def _collect(self, final=False):
+        with self._lock:
+            n = self.n
+            ready = [p for p in self._pending if final or p[0] <= n]
+            self._pending = [p for p in self._pending if not (final or p[0] <= n)]
+            self._due = min(p[0] for p in self._pending) if self._pending else None
+        for _, idx, meta in ready:
+            start = max(idx - self.pre, n - len(self.ring))
+            rows = self.ring.last(n - start).copy()
+            # Kích hoạt trễ (at cũ hơn ring) / đầu phiên: phần trước sự kiện ngắn hơn pre_s.
+            # Nếu chính mẫu kích hoạt đã bị ghi đè -> trigger_offset = None (không đoán mốc thời gian).
+            meta.update(first_index=start, samples=len(rows),
+                        trigger_offset=idx - start if start <= idx < n else None,
+                        pre_truncated=start > idx - self.pre)
+            self._queue.put((rows, meta))
+
+    # --- KÍCH HOẠT (thread GUI / thread cảnh báo) ---
+    def trigger(self, kind, marker="", at=None):
+        """
+        Hẹn lưu 1 sự kiện. at: chỉ số mẫu tuyệt đối (từ 0) của sự kiện (mặc định: mẫu mới nhất đã nhận).
+        Trả về False nếu bị bỏ qua do cooldown.
+        """
+        with self._lock:
+            last = max(self.n - 1, 0)
+            idx = last if at is None else min(int(at), last)
+            key = (kind, marker)
+            if kind != "marker" and key in self._last and idx - self._last[key] < self.cooldown:
+                return False
+            self._last[key] = idx
+            meta = {"kind": kind, "marker": marker, "trigger_index": idx, "wall_time": time.time(),
+                    "fs": self.fs, "pre_s": self.pre / self.fs, "post_s": self.post / self.fs}
+            self._pending.append((idx + 1 + self.post, idx, meta))
+            self._due = min(p[0] for p in self._pending)
+        return True
+
+    def on_alarm(self, event):
+        """Sink cho AlarmEngine: mỗi cảnh báo chuyển sang ON -> lưu đoạn quanh beat gây cảnh báo"""
+        if event["state"] == "ON":
+            self.trigger("alarm", event["rule"], at=int(event["t"] * self.fs))
+
+    def check_quality(self, quality):
+        """Gọi định kỳ với SignalQuality: kênh chuyển sang BAD (tuột điện cực, bão hòa...) -> kích hoạt"""
+        for name, ch in quality.channels.items():
+            level = ch.level
+            prev = self._levels.get(name)
+            if level == BAD and prev is not None and prev != BAD:
+                self.trigger("quality", f"{name} {prev}->{BAD}")
+            self._levels[name] = level
+
+    # --- THREAD GHI ---
+    def _writer(self):
+        index = os.path.join(self.out_dir, "events.jsonl")
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            rows, meta = item
+            name = f"event_{self.session}_{len(self.saved):03d}_{meta['kind']}.npz"
+            path = os.path.join(self.out_dir, name)
+            off = meta["trigger_offset"]
+            if off is not None and off < len(rows):
+                meta["trigger_esp_ts"] = int(rows["Timestamp"][off])
+            try:
+                np.savez_compressed(path, samples=rows, meta=json.dumps(meta))
+                with open(index, "a") as f:
+                    f.write(json.dumps(dict(meta, file=name)) + "\n")
+                self.saved.append(path)
+            except OSError as e:
+                self.error = e
+
+    def close(self):
+        """Lưu các sự kiện còn chờ (phần sau sự kiện có thể ngắn hơn post_s) và chờ thread ghi"""
+        self._collect(final=True)
+        self._queue.put(None)
+        self._thread.join()
+        if self.error:
+            print(f"Event capture error: {self.error}")
+
+
+def load_event(path):
+    """Đọc 1 file sự kiện: (mảng mẫu SAMPLE_DTYPE, meta dict)"""
+    with np.load(path) as z:
+        return z["samples"], json.loads(str(z["meta"]))
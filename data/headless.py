@@ -0,0 +1,175 @@
+import time
+_T_START = time.perf_counter()   # Đo thời gian khởi động tính cả phần import
+
+import os
+import sys
+import json
+import argparse
+import threading
+import numpy as np
+from acquisition import SerialReader, SERIAL_PORT, BAUD_RATE, SAMPLE_RATE
+from signal_quality import BAD
+from alarms import AlarmEngine, LogSink, print_sink
+from recorder import DoubleBufferedRecorder
+from trend_store import TrendStore
+from event_capture import EventCapture
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Python_process"))
+from hrv import HRVTracker
+from beat_table import BeatTable
+
+# Tiến trình xử lý KHÔNG GUI: đọc serial -> (ghi file) -> vitals / cảnh báo / HRV mỗi giây.
+# Không tải matplotlib / pandas (trừ chế độ --replay cần đọc CSV).
+
+# CẤU HÌNH
+STATUS_INTERVAL_S = 1.0
+STATUS_FILE = "headless_status.jsonl"
+
+
+def rss_mb():
+    """Bộ nhớ thường trú hiện tại (MB); None nếu hệ điều hành không hỗ trợ cách đo này"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # Đỉnh RSS (Linux: kB)
+    except ImportError:
+        return None
+
+
+def replay(reader, path, speed=1.0, stop=None):
+    """Phát lại 1 file ghi qua đúng đường nạp mẫu của serial (speed = 0: nhanh nhất có thể)"""
+    from recording_io import load_recording
+    rec = load_recording(path)
+    cols = np.column_stack([rec["Timestamp"], rec["PCG"], rec["RED"], rec["IR"], rec["ECG"]]).tolist()
+    t0 = time.monotonic()
+    block = 100
+    for s in range(0, len(cols), block):
+        if stop is not None and stop.is_set():
+            break
+        for row in cols[s:s + block]:
+            reader.ingest(*row)
+        if speed > 0:
+            wait = t0 + (s + block) / SAMPLE_RATE / speed - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+    reader.running = False
+
+
+def run(args):
+    recorder = DoubleBufferedRecorder(args.record) if args.record else None
+    capture = EventCapture(args.events, fs=SAMPLE_RATE) if args.events else None
+    reader = SerialReader(args.port, args.baud,
+                          on_sample=[obj.append for obj in (recorder, capture) if obj is not None])
+    sinks = [print_sink, LogSink()]
+    if capture:
+        sinks.append(capture.on_alarm)
+    # Thời gian thực của cảnh báo = thời điểm mẫu gây cảnh báo (session_t0 gán bên dưới, trước beat đầu tiên)
+    alarm_engine = AlarmEngine(sinks=sinks, wall_clock=lambda t: reader.wall_time(round(t * SAMPLE_RATE), session_t0))
+    hrv_tracker = HRVTracker(fs=SAMPLE_RATE)
+    beat_table = BeatTable(fs=SAMPLE_RATE)
+    trend = TrendStore(args.trend) if args.trend else None
+    status = open(args.status, "a") if args.status else None
+
+    stop = threading.Event()
+    if args.replay:
+        reader.running = True
+        feeder = threading.Thread(target=replay, args=(reader, args.replay, args.speed, stop), daemon=True)
+        feeder.start()
+    else:
+        reader.start()
+        if not reader.running:
+            return 1
+
+    session_t0 = time.time()
+    ready_ms = (time.perf_counter() - _T_START) * 1000
+    rss = rss_mb()
+    print(f"Headless ready: startup {ready_ms:.0f} ms | RSS {rss:.1f} MB" if rss else
+          f"Headless ready: startup {ready_ms:.0f} ms")
+
+    t_end = time.monotonic() + args.duration if args.duration else None
+    try:
+        while reader.running and (t_end is None or time.monotonic() < t_end):
+            time.sleep(args.interval)
+            n_total, raw_ecg, _, raw_red, raw_ir = reader.snapshot()
+            if len(raw_ecg) < SAMPLE_RATE * 2:
+                continue
+            q = reader.quality
+            hr, spo2 = reader.processor.calculate_vitals(raw_ecg, raw_red, raw_ir, quality=q)
+            t = n_total / SAMPLE_RATE
+            if capture:
+                capture.check_quality(q)
+
+            start = n_total - len(raw_ecg)
+            if q.level("ECG") != BAD:
+                r_abs = start + reader.processor.last_r_peaks
+                alarm_engine.on_beats(r_abs, SAMPLE_RATE, now=n_total)
+                hrv_tracker.add_r_peaks(r_abs)
+                n_new = beat_table.extend(r_abs)
+                if trend and n_new:
+                    rows = beat_table.data[-n_new:]
+                    rr, ok = beat_table.rr_ms(rows)
+                    trend.update_many("hr", reader.wall_time(rows["r"][ok], session_t0), 60000.0 / rr[ok])
+            else:
+                alarm_engine.on_ecg_lost()
+            if q.ppg_level != BAD and spo2 > 0:
+                alarm_engine.on_spo2(t, spo2)
+                if trend:
+                    trend.update("spo2", reader.wall_time(n_total, session_t0), spo2)
+
+            h = hrv_tracker.metrics()
+            if trend and h:
+                trend.update("rmssd", reader.wall_time(n_total, session_t0), h["rmssd_ms"])
+                trend.flush()
+            row = {"t": round(t, 3), "hr": hr, "spo2": spo2, "quality": q.summary(),
+                   "rmssd_ms": round(h["rmssd_ms"], 1) if h and np.isfinite(h["rmssd_ms"]) else None,
+                   "alarms": alarm_engine.active}
+            if status:
+                status.write(json.dumps(row) + "\n")
+                status.flush()
+            if not args.quiet:
+                print(row)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        reader.close()
+        alarm_engine.close()
+        if recorder:
+            recorder.close()
+        if capture:
+            capture.close()
+            print(f"Đã lưu {len(capture.saved)} sự kiện vào {args.events}")
+        if status:
+            status.close()
+        if args.beats:
+            beat_table.save(args.beats)
+        if trend:
+            trend.flush()
+    rss = rss_mb()
+    if rss:
+        print(f"RSS khi kết thúc: {rss:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Thu nhận + xử lý không GUI (vitals, cảnh báo, HRV, ghi file)")
+    parser.add_argument("--port", default=SERIAL_PORT)
+    parser.add_argument("--baud", type=int, default=BAUD_RATE)
+    parser.add_argument("--record", metavar="DIR", help="Ghi dữ liệu thô (tách file + manifest) vào DIR")
+    parser.add_argument("--replay", metavar="CSV", help="Phát lại file ghi thay cho cổng serial")
+    parser.add_argument("--speed", type=float, default=1.0, help="Tốc độ phát lại (0 = nhanh nhất)")
+    parser.add_argument("--duration", type=float, default=0, help="Dừng sau N giây (0 = chạy mãi)")
+    parser.add_argument("--interval", type=float, default=STATUS_INTERVAL_S, help="Chu kỳ tính vitals (s)")
+    parser.add_argument("--status", default=STATUS_FILE, help="File JSON lines trạng thái ('' = tắt)")
+    parser.add_argument("--beats", default="", metavar="NPZ", help="Lưu bảng beat của phiên khi kết thúc")
+    parser.add_argument("--events", default="", metavar="DIR",
+                        help="Lưu đoạn trước/sau mỗi cảnh báo / tín hiệu tụt chất lượng (.npz) vào DIR")
+    parser.add_argument("--trend", default="", metavar="DIR", help="Archive xu hướng vitals (1s / 1 phút / 10 phút)")
+    parser.add_argument("--quiet", action="store_true", help="Không in trạng thái ra màn hình")
+    sys.exit(run(parser.parse_args()))
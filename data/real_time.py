@@ -1,239 +1,294 @@
-import serial
+import os
+import sys
 import time
-import threading
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from collections import deque
-from scipy.signal import iirnotch, butter, filtfilt, find_peaks
-
-# CẤU HÌNH HỆ THỐNG
-SERIAL_PORT = 'COM5'       # Đổi cổng COM của bạn
-BAUD_RATE = 921600         # Đảm bảo ESP32 cũng set mức này
-SAMPLE_RATE = 1000         # Hz
-WINDOW_SIZE = 1000 * 10    # Hiển thị 10 giây dữ liệu
-
-# XỬ LÝ TÍN HIỆU (Signal Processing)
-class SignalProcessor:
-    def __init__(self, fs=1000):
-        self.fs = fs
-        
-        # 1. ECG Filters (Bandpass 0.5-49 Hz + Notch 50 Hz)
-        self.b_ecg, self.a_ecg = butter(2, [0.5, 49], btype='band', fs=fs)
-        self.b_notch, self.a_notch = iirnotch(50.0, 30, fs)
-
-        # 2. PCG Filters (Bandpass 20-400 Hz + Notch 50 Hz)
-        self.b_pcg, self.a_pcg = butter(2, [20, 400], btype='band', fs=fs)
-
-        # 3. PPG Filters (Bandpass 0.5-5 Hz cho hiển thị đẹp)
-        self.b_ppg, self.a_ppg = butter(2, [0.5, 5], btype='band', fs=fs)
-
-    def process_ecg(self, signal):
-        if len(signal) < 100: return signal
-        sig_notch = filtfilt(self.b_notch, self.a_notch, signal)
-        return filtfilt(self.b_ecg, self.a_ecg, sig_notch)
-
-    def process_pcg(self, signal):
-        if len(signal) < 100: return signal
-        sig_notch = filtfilt(self.b_notch, self.a_notch, signal)
-        return filtfilt(self.b_pcg, self.a_pcg, sig_notch)
-
-    def process_ppg(self, signal):
-        if len(signal) < 100: return signal
-        return filtfilt(self.b_ppg, self.a_ppg, signal)
-
-    def calculate_vitals(self, ecg_buffer, red_buffer, ir_buffer):
-        hr = 0
-        spo2 = 0
-        
-        # --- TÍNH NHỊP TIM TỪ ECG ---
-        if len(ecg_buffer) > self.fs * 2:
-            clean_ecg = self.process_ecg(np.array(ecg_buffer))
-            # Tìm đỉnh R
-            peaks, _ = find_peaks(clean_ecg, distance=self.fs*0.5, height=np.max(clean_ecg)*0.6)
-            if len(peaks) > 1:
-                rr_intervals = np.diff(peaks) / self.fs
-                avg_rr = np.mean(rr_intervals)
-                if avg_rr > 0: hr = 60 / avg_rr
-
-        # --- TÍNH SpO2 TỪ PPG (Dùng tín hiệu thô có thành phần DC) ---
-        if len(red_buffer) > self.fs * 2:
-            red_arr = np.array(list(red_buffer)[-self.fs*2:]) 
-            ir_arr = np.array(list(ir_buffer)[-self.fs*2:])
-            
-            ac_red = np.max(red_arr) - np.min(red_arr)
-            dc_red = np.mean(red_arr)
-            ac_ir = np.max(ir_arr) - np.min(ir_arr)
-            dc_ir = np.mean(ir_arr)
-
-            if dc_red != 0 and dc_ir != 0:
-                R = (ac_red / dc_red) / (ac_ir / dc_ir)
-                spo2 = 110 - 25 * R
-                spo2 = np.clip(spo2, 80, 100)
-
-        return int(hr), int(spo2)
-
-# SERIAL READER (THREAD)
-class SerialReader:
-    def __init__(self, port, baud):
-        self.port = port
-        self.baud = baud
-        self.running = False
-        self.processor = SignalProcessor(fs=SAMPLE_RATE)
-        
-        # Buffers
-        self.ecg_buf = deque(maxlen=WINDOW_SIZE)
-        self.pcg_buf = deque(maxlen=WINDOW_SIZE)
-        self.red_buf = deque(maxlen=WINDOW_SIZE)
-        self.ir_buf = deque(maxlen=WINDOW_SIZE)
-
-    def start(self):
-        try:
-            self.ser = serial.Serial(self.port, self.baud, timeout=1)
-            self.running = True
-            self.thread = threading.Thread(target=self.update, daemon=True)
-            self.thread.start()
-            print(f"Connected to {self.port} @ {self.baud}")
-        except Exception as e:
-            print(f"Serial Error: {e}")
-
-    def update(self):
-        while self.running:
-            try:
-                line = self.ser.readline().decode('utf-8').strip()
-                if not line: continue
-                parts = line.split(',')
-                if len(parts) == 5:
-                    # timestamp = int(parts[0]) 
-                    pcg = int(parts[1])
-                    red = int(parts[2])
-                    ir  = int(parts[3])
-                    ecg = int(parts[4])
-                    
-                    self.ecg_buf.append(ecg)
-                    self.pcg_buf.append(pcg)
-                    self.red_buf.append(red)
-                    self.ir_buf.append(ir)
-            except ValueError: pass
-            except Exception: pass
-    
-    def close(self):
-        self.running = False
-        if self.ser.is_open: self.ser.close()
+from signal_quality import BAD, format_vital
+from alarms import AlarmEngine, LogSink, print_sink
+from trend_store import TrendStore
+from event_capture import EventCapture
+from acquisition import SerialReader, SERIAL_PORT, BAUD_RATE, SAMPLE_RATE
+
+# Dùng chung bộ phát hiện / PTT với phần xử lý offline (Python_process)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Python_process"))
+from detectors import process_ppg as detect_ppg_fiducials
+from pulse_transit import PTTTracker
+from spectral import StreamingDecimator, StreamingSTFT, RespirationEstimator
+from hrv import HRVTracker
+from beat_table import BeatTable
+
+TREND_DIR = "trend_data"      # Archive xu hướng (memmap, tiếp tục qua các phiên)
+EVENT_DIR = "events"          # Đoạn trước/sau sự kiện (cảnh báo, marker, tín hiệu tụt chất lượng)
 
 # VISUALIZATION (MAIN)
-reader = SerialReader(SERIAL_PORT, BAUD_RATE)
-reader.start()
-
-# 1. CẤU HÌNH NỀN TRẮNG
-plt.style.use('default') 
-
-# 2. TẠO 4 HÀNG ĐỒ THỊ (ECG, PPG RED, PPG IR, PCG)
-# sharex=True để đồng bộ trục thời gian
-fig, (ax_ecg, ax_red, ax_ir, ax_pcg) = plt.subplots(4, 1, figsize=(12, 12), sharex=True)
-
-# --- Đồ thị 1: ECG ---
-line_ecg, = ax_ecg.plot([], [], 'g-', lw=1.2) # Màu xanh lá đậm
-ax_ecg.set_title("1. Electrocardiogram (ECG)", loc='left', color='darkgreen', fontweight='bold')
-ax_ecg.set_ylabel("Amplitude")
-ax_ecg.grid(True, linestyle='--', alpha=0.5)
-text_hr = ax_ecg.text(0.98, 0.85, 'BPM: --', transform=ax_ecg.transAxes, 
-                      color='darkgreen', fontsize=14, fontweight='bold', ha='right')
-
-# --- Đồ thị 2: PPG RED ---
-line_red, = ax_red.plot([], [], 'r-', lw=1.5) # Màu đỏ
-ax_red.set_title("2. PPG - RED Channel", loc='left', color='red', fontweight='bold')
-ax_red.set_ylabel("Intensity")
-ax_red.grid(True, linestyle='--', alpha=0.5)
-text_spo2 = ax_red.text(0.98, 0.85, 'SpO2: --%', transform=ax_red.transAxes, 
-                        color='red', fontsize=14, fontweight='bold', ha='right')
-
-# --- Đồ thị 3: PPG IR (Tách riêng) ---
-line_ir, = ax_ir.plot([], [], color='darkblue', lw=1.5) # Màu xanh dương đậm cho IR
-ax_ir.set_title("3. PPG - IR Channel", loc='left', color='darkblue', fontweight='bold')
-ax_ir.set_ylabel("Intensity")
-ax_ir.grid(True, linestyle='--', alpha=0.5)
-
-# --- Đồ thị 4: PCG ---
-line_pcg, = ax_pcg.plot([], [], color='purple', lw=0.8) # Màu tím
-ax_pcg.set_title("4. Phonocardiogram (PCG)", loc='left', color='purple', fontweight='bold')
-ax_pcg.set_ylabel("Amplitude")
-ax_pcg.set_xlabel("Time (samples)")
-ax_pcg.grid(True, linestyle='--', alpha=0.5)
-
-# Biến đếm frame
-frame_count = 0 
-
-def animate(i):
-    global frame_count
-    frame_count += 1
-    
-    # Chờ buffer có dữ liệu
-    if len(reader.ecg_buf) < SAMPLE_RATE: return tuple()
-    
-    # Chuyển buffer sang numpy array để xử lý
-    raw_ecg = np.array(reader.ecg_buf)
-    raw_pcg = np.array(reader.pcg_buf)
-    raw_red = np.array(reader.red_buf)
-    raw_ir  = np.array(reader.ir_buf)
-    
-    # --- LỌC TÍN HIỆU ---
-    clean_ecg = reader.processor.process_ecg(raw_ecg)
-    clean_pcg = reader.processor.process_pcg(raw_pcg)
-    # Lọc PPG chỉ để vẽ cho đẹp
-    vis_red = reader.processor.process_ppg(raw_red)
-    vis_ir  = reader.processor.process_ppg(raw_ir)
-
-    # --- CẬP NHẬT ĐỒ THỊ ---
-    x_axis = np.arange(len(clean_ecg))
-    window_view = 8000 # Xem 5 giây cuối
-
-    # Update Data
-    line_ecg.set_data(x_axis, clean_ecg)
-    line_red.set_data(x_axis, vis_red)
-    line_ir.set_data(x_axis, vis_ir)
-    line_pcg.set_data(x_axis, clean_pcg)
-
-    # Xử lý trôi trục X (Hiệu ứng cuộn)
-    current_len = len(x_axis)
-    ax_ecg.set_xlim(max(0, current_len - window_view), current_len)
-    
-    # Auto Scale trục Y mỗi 10 frame 
-    if frame_count % 10 == 0:
-        # Scale ECG
-        view_ecg = clean_ecg[-window_view:]
-        if len(view_ecg) > 0:
-            mn, mx = np.min(view_ecg), np.max(view_ecg)
-            ax_ecg.set_ylim(mn - (mx-mn)*0.1, mx + (mx-mn)*0.1)
-        
-        # Scale PPG RED
-        view_red = vis_red[-window_view:]
-        if len(view_red) > 0:
-            mn, mx = np.min(view_red), np.max(view_red)
-            ax_red.set_ylim(mn - 500, mx + 500)
-
-        # Scale PPG IR
-        view_ir = vis_ir[-window_view:]
-        if len(view_ir) > 0:
-            mn, mx = np.min(view_ir), np.max(view_ir)
-            ax_ir.set_ylim(mn - 500, mx + 500)
-            
-        # Scale PCG (Giữ cố định hoặc auto)
-        ax_pcg.set_ylim(-30000, 30000) # PCG thường cố định biên độ
-
-    # --- TÍNH TOÁN BPM / SPO2 (Mỗi 1 giây = 30 frames) ---
-    if frame_count % 30 == 0:
-        hr, spo2 = reader.processor.calculate_vitals(raw_ecg, raw_red, raw_ir)
-        text_hr.set_text(f"BPM: {hr}")
-        text_spo2.set_text(f"SpO2: {spo2}%")
-
-    return line_ecg, line_red, line_ir, line_pcg, text_hr, text_spo2
-
-# Chạy animation
-ani = FuncAnimation(fig, animate, interval=30, blit=True)
-
-plt.tight_layout()
-plt.show()
-
-# Đóng thread khi tắt cửa sổ
-reader.close()
\ No newline at end of file
+def main(port=SERIAL_PORT, baud=BAUD_RATE):
+    # matplotlib chỉ được tải khi mở GUI (import module này không tốn chi phí đó)
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+
+    # Bắt sự kiện nhận từng mẫu ngay trong thread đọc serial (chỉ ghi vào ring, file ghi ở thread riêng)
+    capture = EventCapture(EVENT_DIR, fs=SAMPLE_RATE)
+    reader = SerialReader(port, baud, on_sample=capture.append)
+    reader.start()
+    session_t0 = time.time()   # Mốc thời gian thực của mẫu 0 (dự phòng khi ClockSync chưa khớp, xem wall_time)
+
+    # 1. CẤU HÌNH NỀN TRẮNG
+    plt.style.use('default') 
+
+    # 2. TẠO 4 HÀNG ĐỒ THỊ (ECG, PPG RED, PPG IR, PCG)
+    # sharex=True để đồng bộ trục thời gian
+    fig, (ax_ecg, ax_red, ax_ir, ax_pcg) = plt.subplots(4, 1, figsize=(12, 12), sharex=True)
+
+    # --- Đồ thị 1: ECG ---
+    line_ecg, = ax_ecg.plot([], [], 'g-', lw=1.2) # Màu xanh lá đậm
+    ax_ecg.set_title("1. Electrocardiogram (ECG)", loc='left', color='darkgreen', fontweight='bold')
+    ax_ecg.set_ylabel("Amplitude")
+    ax_ecg.grid(True, linestyle='--', alpha=0.5)
+    text_hr = ax_ecg.text(0.98, 0.85, 'BPM: --', transform=ax_ecg.transAxes, 
+                          color='darkgreen', fontsize=14, fontweight='bold', ha='right')
+    text_hrv = ax_ecg.text(0.98, 0.70, 'SDNN: --', transform=ax_ecg.transAxes,
+                           color='darkgreen', fontsize=10, ha='right')
+
+    # --- Đồ thị 2: PPG RED ---
+    line_red, = ax_red.plot([], [], 'r-', lw=1.5) # Màu đỏ
+    ax_red.set_title("2. PPG - RED Channel", loc='left', color='red', fontweight='bold')
+    ax_red.set_ylabel("Intensity")
+    ax_red.grid(True, linestyle='--', alpha=0.5)
+    text_spo2 = ax_red.text(0.98, 0.85, 'SpO2: --%', transform=ax_red.transAxes, 
+                            color='red', fontsize=14, fontweight='bold', ha='right')
+
+    # --- Đồ thị 3: PPG IR (Tách riêng) ---
+    line_ir, = ax_ir.plot([], [], color='darkblue', lw=1.5) # Màu xanh dương đậm cho IR
+    ax_ir.set_title("3. PPG - IR Channel", loc='left', color='darkblue', fontweight='bold')
+    ax_ir.set_ylabel("Intensity")
+    ax_ir.grid(True, linestyle='--', alpha=0.5)
+
+    # --- Đồ thị 4: PCG ---
+    line_pcg, = ax_pcg.plot([], [], color='purple', lw=0.8) # Màu tím
+    ax_pcg.set_title("4. Phonocardiogram (PCG)", loc='left', color='purple', fontweight='bold')
+    ax_pcg.set_ylabel("Amplitude")
+    ax_pcg.set_xlabel("Time (samples)")
+    ax_pcg.grid(True, linestyle='--', alpha=0.5)
+    text_pat = ax_ir.text(0.98, 0.85, 'PAT: --', transform=ax_ir.transAxes,
+                           color='darkblue', fontsize=12, fontweight='bold', ha='right')
+    text_sync = ax_pcg.text(0.98, 0.85, 'Latency: --', transform=ax_pcg.transAxes,
+                            color='purple', fontsize=10, ha='right')
+
+    # Biến đếm frame
+    frame_count = 0 
+    ptt_tracker = PTTTracker(fs=SAMPLE_RATE)
+    hrv_tracker = HRVTracker(fs=SAMPLE_RATE)
+    beat_table = BeatTable(fs=SAMPLE_RATE)  # Bảng beat của cả phiên (~21 byte / beat)
+    trend = TrendStore(TREND_DIR)
+    alarm_engine = AlarmEngine(sinks=[print_sink, LogSink(), capture.on_alarm],
+                               wall_clock=lambda t: reader.wall_time(round(t * SAMPLE_RATE), session_t0))
+    # Text nằm trong axes: artist của blit phải thuộc 1 axes (fig.text có .axes = None -> lỗi _blit_draw)
+    text_alarm = ax_ecg.text(0.5, 0.95, '', transform=ax_ecg.transAxes,
+                             color='red', fontsize=12, fontweight='bold', ha='center', va='top')
+    text_events = ax_ecg.text(0.02, 0.95, 'Events: 0', transform=ax_ecg.transAxes, fontsize=9, ha='left', va='top')
+
+    # Marker bấm tay: phím 'm' hoặc số 0-9 (nhãn = phím) -> lưu đoạn quanh thời điểm bấm
+    def on_key(event):
+        if event.key == 'm' or (event.key is not None and event.key.isdigit()):
+            capture.trigger("marker", event.key)
+            print(f"Marker '{event.key}' @ sample {capture.n}")
+    fig.canvas.mpl_connect('key_press_event', on_key)
+
+    def animate(i):
+        nonlocal frame_count
+        frame_count += 1
+
+        # Chờ buffer có dữ liệu
+        if len(reader.buf) < SAMPLE_RATE: return tuple()
+
+        # Chuyển buffer sang numpy array để xử lý
+        n_total, raw_ecg, raw_pcg, raw_red, raw_ir = reader.snapshot()
+
+        # --- LỌC TÍN HIỆU ---
+        clean_ecg = reader.processor.process_ecg(raw_ecg)
+        clean_pcg = reader.processor.process_pcg(raw_pcg)
+        # Lọc PPG chỉ để vẽ cho đẹp
+        vis_red = reader.processor.process_ppg(raw_red)
+        vis_ir  = reader.processor.process_ppg(raw_ir)
+
+        # --- CẬP NHẬT ĐỒ THỊ ---
+        x_axis = np.arange(len(clean_ecg))
+        window_view = 8000 # Xem 5 giây cuối
+
+        # Update Data
+        line_ecg.set_data(x_axis, clean_ecg)
+        line_red.set_data(x_axis, vis_red)
+        line_ir.set_data(x_axis, vis_ir)
+        line_pcg.set_data(x_axis, clean_pcg)
+
+        # Xử lý trôi trục X (Hiệu ứng cuộn)
+        current_len = len(x_axis)
+        ax_ecg.set_xlim(max(0, current_len - window_view), current_len)
+
+        # Auto Scale trục Y mỗi 10 frame 
+        if frame_count % 10 == 0:
+            # Scale ECG
+            view_ecg = clean_ecg[-window_view:]
+            if len(view_ecg) > 0:
+                mn, mx = np.min(view_ecg), np.max(view_ecg)
+                ax_ecg.set_ylim(mn - (mx-mn)*0.1, mx + (mx-mn)*0.1)
+
+            # Scale PPG RED
+            view_red = vis_red[-window_view:]
+            if len(view_red) > 0:
+                mn, mx = np.min(view_red), np.max(view_red)
+                ax_red.set_ylim(mn - 500, mx + 500)
+
+            # Scale PPG IR
+            view_ir = vis_ir[-window_view:]
+            if len(view_ir) > 0:
+                mn, mx = np.min(view_ir), np.max(view_ir)
+                ax_ir.set_ylim(mn - 500, mx + 500)
+
+            # Scale PCG (Giữ cố định hoặc auto)
+            ax_pcg.set_ylim(-30000, 30000) # PCG thường cố định biên độ
+
+        # --- TÍNH TOÁN BPM / SPO2 (Mỗi 1 giây = 30 frames) ---
+        if frame_count % 30 == 0:
+            q = reader.quality
+            hr, spo2 = reader.processor.calculate_vitals(raw_ecg, raw_red, raw_ir, quality=q)
+            text_hr.set_text(format_vital("BPM", hr, q.level("ECG")))
+            text_spo2.set_text(format_vital("SpO2", spo2, q.ppg_level, "%"))
+
+            # --- CẢNH BÁO: đánh giá theo từng beat mới + mỗi lần cập nhật SpO2 ---
+            start = n_total - len(raw_ecg)
+            if q.level("ECG") != BAD:
+                alarm_engine.on_beats(start + reader.processor.last_r_peaks, SAMPLE_RATE, now=n_total)
+                resp_est.add_r_peaks(start + reader.processor.last_r_peaks)
+                n_new = beat_table.extend(start + reader.processor.last_r_peaks)
+                if n_new:
+                    rows = beat_table.data[-n_new:]
+                    rr, ok = beat_table.rr_ms(rows)
+                    trend.update_many("hr", reader.wall_time(rows["r"][ok], session_t0), 60000.0 / rr[ok])
+                if hrv_tracker.add_r_peaks(start + reader.processor.last_r_peaks):
+                    h = hrv_tracker.metrics()
+                    if h and np.isfinite(h["rmssd_ms"]):
+                        text_hrv.set_text(f"SDNN: {h['sdnn_ms']:.0f} ms | RMSSD: {h['rmssd_ms']:.0f} ms"
+                                          f" | pNN50: {h['pnn50']:.0f}%")
+                        trend.update("rmssd", reader.wall_time(n_total, session_t0), h["rmssd_ms"])
+            else:
+                alarm_engine.on_ecg_lost()
+            if q.ppg_level != BAD and spo2 > 0:
+                alarm_engine.on_spo2(n_total / SAMPLE_RATE, spo2)
+                trend.update("spo2", reader.wall_time(n_total, session_t0), spo2)
+            text_alarm.set_text("  ".join(alarm_engine.active))
+            capture.check_quality(q)
+            text_events.set_text(f"Events: {len(capture.saved)}")
+
+            # --- PAT (ECG R -> chân sóng PPG) theo từng beat ---
+            if q.level("ECG") != BAD and q.ppg_level != BAD:
+                ppg_f, ppg_peaks, ppg_feet = detect_ppg_fiducials(-raw_ir.astype(float), SAMPLE_RATE)
+                ptt_tracker.add(start + reader.processor.last_r_peaks, start + ppg_feet, start + ppg_peaks)
+                resp_est.add_ppg_beats(start + ppg_peaks, ppg_f[ppg_peaks] - ppg_f[ppg_feet])
+                beat_table.attach_ppg(start + ppg_feet, start + ppg_peaks)
+                if ptt_tracker.current_pat_ms > 0:
+                    text_pat.set_text(f"PAT: {ptt_tracker.current_pat_ms:.0f} ms")
+                    trend.update("pat", reader.wall_time(n_total, session_t0), ptt_tracker.current_pat_ms)
+
+            # --- ĐỘ TRỄ ĐẾN MÀN HÌNH / ĐỘ TRÔI ĐỒNG HỒ ---
+            last_ts = reader.last_timestamp()
+            if reader.clock.ready and last_ts is not None:
+                latency_ms = reader.clock.latency_us(last_ts, time.monotonic()) / 1000
+                st = reader.clock.stats()
+                text_sync.set_text(f"Latency: {latency_ms:.1f} ms | Drift: {st['drift_ppm']:.0f} ppm"
+                                   f" | Jitter: {st['jitter_us'] / 1000:.2f} ms")
+
+        return (line_ecg, line_red, line_ir, line_pcg, text_hr, text_spo2, text_pat, text_sync, text_alarm, text_hrv,
+                text_events)
+
+    # CỬA SỔ PHỔ: Spectrogram PCG / ECG (nhiễu nguồn) + nhịp thở
+    # Kênh được hạ tần số trước khi tính STFT để giới hạn chi phí mỗi lần cập nhật
+    pcg_decim, pcg_stft = StreamingDecimator(2, SAMPLE_RATE), StreamingSTFT(SAMPLE_RATE / 2, nperseg=256)
+    ecg_decim, ecg_stft = StreamingDecimator(4, SAMPLE_RATE), StreamingSTFT(SAMPLE_RATE / 4, nperseg=256)
+    resp_est = RespirationEstimator(SAMPLE_RATE)
+    spec_last_n = 0
+
+    fig_spec, (ax_spec_pcg, ax_spec_ecg) = plt.subplots(2, 1, figsize=(8, 8))
+    img_pcg = ax_spec_pcg.imshow(pcg_stft.spectrogram(), aspect='auto', origin='lower', cmap='magma',
+                                 extent=[0, pcg_stft.spec.shape[0], 0, pcg_stft.freqs[-1]])
+    ax_spec_pcg.set_title("PCG Spectrogram", loc='left', color='purple', fontweight='bold')
+    ax_spec_pcg.set_ylabel("Hz")
+    img_ecg = ax_spec_ecg.imshow(ecg_stft.spectrogram(), aspect='auto', origin='lower', cmap='viridis',
+                                 extent=[0, ecg_stft.spec.shape[0], 0, ecg_stft.freqs[-1]])
+    ax_spec_ecg.set_title("ECG Spectrogram", loc='left', color='darkgreen', fontweight='bold')
+    ax_spec_ecg.set_ylabel("Hz")
+    ax_spec_ecg.set_xlabel("Frame")
+    text_mains = ax_spec_ecg.text(0.98, 0.9, '50Hz: --', transform=ax_spec_ecg.transAxes,
+                                  color='white', fontsize=11, ha='right')
+    text_resp = ax_spec_pcg.text(0.98, 0.9, 'Resp: --', transform=ax_spec_pcg.transAxes,
+                                 color='white', fontsize=11, ha='right')
+
+    def animate_spec(i):
+        nonlocal spec_last_n
+        n_total, raw_ecg, raw_pcg, _, raw_ir = reader.snapshot()
+        new = min(n_total - spec_last_n, len(raw_ecg))
+        spec_last_n = n_total
+        if new <= 0: return tuple()
+
+        pcg_stft.push(pcg_decim.process(raw_pcg[-new:]))
+        ecg_stft.push(ecg_decim.process(raw_ecg[-new:]))
+        resp_est.add_ppg_samples(-raw_ir[-new:].astype(float))
+
+        for img, stft in ((img_pcg, pcg_stft), (img_ecg, ecg_stft)):
+            spec = stft.spectrogram()
+            img.set_data(spec)
+            if stft.count > 1:
+                img.set_clim(*np.nanpercentile(spec, [5, 99.5]))
+
+        text_mains.set_text(f"50Hz: {ecg_stft.band_ratio(48, 52) * 100:.1f}% power")
+        rate, _ = resp_est.estimate()
+        text_resp.set_text(f"Resp: {rate:.0f} br/min" if rate > 0 else "Resp: --")
+        trend.update("resp", reader.wall_time(n_total, session_t0), rate)
+        return img_pcg, img_ecg, text_mains, text_resp
+
+    # CỬA SỔ XU HƯỚNG: HR / SpO2 cả phiên (mean + dải min-max) từ TrendStore.
+    # Mỗi lần vẽ chỉ đọc <= 1200 ô của archive phù hợp và set_data cho các line có sẵn.
+    fig_trend, trend_axes = plt.subplots(2, 1, figsize=(8, 6), sharex=True)
+    trend_lines = {}
+    for ax, metric, color, label in ((trend_axes[0], "hr", 'darkgreen', "HR (bpm)"),
+                                     (trend_axes[1], "spo2", 'red', "SpO2 (%)")):
+        mean_line, = ax.plot([], [], color=color, lw=1.5)
+        lo_line, = ax.plot([], [], color=color, lw=0.6, alpha=0.4)
+        hi_line, = ax.plot([], [], color=color, lw=0.6, alpha=0.4)
+        trend_lines[metric] = (ax, mean_line, lo_line, hi_line)
+        ax.set_ylabel(label)
+        ax.grid(True, linestyle='--', alpha=0.5)
+    trend_axes[0].set_title("Trend (min / mean / max)", loc='left', fontweight='bold')
+    trend_axes[1].set_xlabel("Minutes before now")
+
+    def animate_trend(i):
+        now = time.time()
+        span = max(now - session_t0, 60)
+        for metric, (ax, mean_line, lo_line, hi_line) in trend_lines.items():
+            t, lo, mean, hi = trend.series(metric, now - span, now)
+            x = (t - now) / 60
+            mean_line.set_data(x, mean)
+            lo_line.set_data(x, lo)
+            hi_line.set_data(x, hi)
+            if np.any(np.isfinite(lo)):
+                ax.set_ylim(np.nanmin(lo) - 5, np.nanmax(hi) + 5)
+        trend_axes[0].set_xlim(-span / 60, 0)
+        trend.flush()   # Chỉ ghi các trang memmap thay đổi
+        return tuple()
+
+    # Chạy animation
+    ani = FuncAnimation(fig, animate, interval=30, blit=True)
+    ani_spec = FuncAnimation(fig_spec, animate_spec, interval=500, blit=False)
+    ani_trend = FuncAnimation(fig_trend, animate_trend, interval=2000, blit=False)
+
+    plt.tight_layout()
+    plt.show()
+
+    # Đóng thread khi tắt cửa sổ
+    reader.close()
+    alarm_engine.close()
+    capture.close()
+    trend.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Python_process"))
+from recording_io import SAMPLE_DTYPE
+
+# CẤU HÌNH
+HEADER = "Timestamp,PCG,RED,IR,ECG"   # Khớp printf("%lld,%d,%lu,%lu,%d\n") trong logger_task
+ROW_FMT = "%d,%d,%d,%d,%d"
+BLOCK_ROWS = 1000                     # 1 block = 1 giây ở 1000Hz
+ROTATE_S = 600                        # Tách file mới sau 10 phút ...
+ROTATE_BYTES = 64 * 1024 * 1024       # ... hoặc khi file vượt 64MB
+FSYNC_INTERVAL_S = 1.0                # Group commit: flush + fsync tối đa 1 lần / giây
+
+
+class DoubleBufferedRecorder:
+    """
+    Ghi dữ liệu ra CSV bằng 2 buffer hoán đổi:
+    - Luồng đọc serial chỉ chép 1 dòng vào buffer đang hoạt động (mảng SAMPLE_DTYPE cấp phát sẵn, 20 byte / dòng).
+    - Buffer đầy được trao cho thread ghi qua queue và đổi sang buffer rảnh -> không bao giờ chờ I/O.
+      Nếu cả 2 buffer đều đang bận (đĩa bị nghẽn lâu) thì cấp thêm buffer mới và đếm overruns
+      thay vì chặn luồng đọc.
+    - Thread ghi gom nhiều block rồi flush + fsync theo chu kỳ, tách file theo thời gian / dung lượng,
+      đặt tên theo phiên (<prefix>_<phiên>_<số thứ tự>.csv) và cập nhật manifest JSON.
+    """
+    def __init__(self, out_dir=".", prefix="test", block_rows=BLOCK_ROWS, rotate_s=ROTATE_S,
+                 rotate_bytes=ROTATE_BYTES, fsync_interval_s=FSYNC_INTERVAL_S):
+        self.out_dir = out_dir
+        self.session = f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self.block_rows = block_rows
+        self.rotate_s = rotate_s
+        self.rotate_bytes = rotate_bytes
+        self.fsync_interval_s = fsync_interval_s
+        os.makedirs(out_dir, exist_ok=True)
+
+        self._free = queue.SimpleQueue()
+        self._free.put(np.empty(block_rows, dtype=SAMPLE_DTYPE))
+        self._active = np.empty(block_rows, dtype=SAMPLE_DTYPE)
+        self._n = 0
+        self._filled = queue.SimpleQueue()
+        self.overruns = 0
+
+        self.manifest_path = os.path.join(out_dir, f"{self.session}_manifest.json")
+        self.files = []           # Thông tin các file đã / đang ghi (cho manifest)
+        self.rows_written = 0
+        self.error = None
+        self._f = None
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    # --- PHÍA LUỒNG ĐỌC SERIAL ---
+    def append(self, ts, pcg, red, ir, ecg):
+        buf = self._active
+        buf[self._n] = (ts, pcg, red, ir, ecg)
+        self._n += 1
+        if self._n == self.block_rows:
+            self._swap()
+
+    def _swap(self):
+        self._filled.put((self._active, self._n))
+        try:
+            self._active = self._free.get_nowait()
+        except queue.Empty:
+            self.overruns += 1
+            self._active = np.empty(self.block_rows, dtype=SAMPLE_DTYPE)
+        self._n = 0
+
+    def close(self):
+        """Đẩy block dở dang, chờ thread ghi xong, fsync file cuối và chốt manifest"""
+        if self._n:
+            self._swap()
+        self._filled.put(None)
+        self._thread.join()
+        if self.error:
+            print(f"Recorder error: {self.error}")
+
+    # --- THREAD GHI ---
+    def _open_next(self):
+        path = os.path.join(self.out_dir, f"{self.session}_{len(self.files):03d}.csv")
+        self._f = open(path, "w", newline="")
+        self._f.write(HEADER + "\n")
+        self._opened = time.monotonic()
+        self.files.append({"file": os.path.basename(path), "rows": 0, "bytes": len(HEADER) + 1,
+                           "first_ts": None, "last_ts": None,
+                           "start_time": time.time(), "end_time": None})
+        self._write_manifest(done=False)
+
+    def _close_current(self):
+        if self._f is None:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        self._f = None
+        self.files[-1]["end_time"] = time.time()
+
+    def _write_manifest(self, done):
+        info = {"session": self.session, "header": HEADER.split(","), "complete": done,
+                "rows": self.rows_written, "overruns": self.overruns, "files": self.files}
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(info, f, indent=2)
+        os.replace(tmp, self.manifest_path)   # Manifest luôn ở trạng thái đọc được
+
+    def _writer(self):
+        last_sync = time.monotonic()
+        try:
+            self._open_next()
+            while True:
+                item = self._filled.get()
+                if item is None:
+                    break
+                buf, n = item
+                text = "\n".join(ROW_FMT % tuple(row) for row in buf[:n].tolist()) + "\n"
+                first_ts, last_ts = int(buf["Timestamp"][0]), int(buf["Timestamp"][n - 1])
+                self._free.put(buf)   # Trả buffer ngay sau khi đã định dạng xong
+
+                cur = self.files[-1]
+                self._f.write(text)
+                cur["rows"] += n
+                cur["bytes"] += len(text)
+                cur["first_ts"] = first_ts if cur["first_ts"] is None else cur["first_ts"]
+                cur["last_ts"] = last_ts
+                self.rows_written += n
+
+                now = time.monotonic()
+                if now - last_sync >= self.fsync_interval_s:
+                    self._f.flush()
+                    os.fsync(self._f.fileno())
+                    last_sync = now
+                if cur["bytes"] >= self.rotate_bytes or now - self._opened >= self.rotate_s:
+                    self._close_current()
+                    self._open_next()
+        except OSError as e:
+            # Lỗi đĩa: ghi nhận rồi tiếp tục rút queue để luồng đọc không bị ảnh hưởng
+            self.error = e
+            while self._filled.get() is not None:
+                pass
+        finally:
+            try:
+                self._close_current()
+                self._write_manifest(done=True)
+            except OSError as e:
+                self.error = self.error or e
@@ -0,0 +1,168 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Python_process"))
+from kernels import zoh_runs
+
+# CẤU HÌNH
+SQI_BLOCK = 100            # Cập nhật chỉ số chất lượng mỗi 100 mẫu (100ms)
+
+# Giới hạn ADC của từng kênh (rail)
+RAILS = {
+    "ECG": (0, 4095),          # ADC 12-bit (AD8232)
+    "PCG": (-32768, 32767),    # I2S int16
+    "RED": (0, 262143),        # MAX30102 18-bit
+    "IR":  (0, 262143),
+}
+
+# Biên độ đỉnh-đỉnh tối thiểu trong 1 block, dưới mức này coi là tín hiệu phẳng
+FLAT_PTP = {"ECG": 5, "PCG": 3, "RED": 2, "IR": 2}
+
+SAT_MAX_FRAC = 0.05        # > 5% mẫu chạm rail -> bão hòa (tuột điện cực / ngón tay)
+ZOH_MAX_MS = 200           # PPG giữ nguyên giá trị quá 200ms -> MAX30102 không cập nhật
+POWERLINE_MAX = 0.5        # Năng lượng 50Hz > 50% năng lượng AC -> nhiễu nguồn nặng
+TEMPLATE_MIN_CORR = 0.6    # Tương quan beat với template thấp -> hình dạng nhiễu
+EMA_ALPHA = 0.3            # Hệ số làm mượt chỉ số giữa các block
+
+GOOD, POOR, BAD = "good", "poor", "bad"
+
+
+class ChannelQuality:
+    """
+    Chỉ số chất lượng tín hiệu (SQI) streaming cho 1 kênh, cập nhật theo block mẫu thô.
+    Mỗi block chỉ tốn vài phép NumPy O(block) nên chạy được ngay trong thread đọc serial.
+    """
+    def __init__(self, name, fs=1000, powerline_hz=None, check_zoh=False):
+        self.name = name
+        self.fs = fs
+        self.lo, self.hi = RAILS[name]
+        self.flat_ptp = FLAT_PTP[name]
+        self.check_zoh = check_zoh
+
+        # Goertzel 50Hz dạng vector: 2 vector cos/sin tính sẵn cho block
+        self.powerline = powerline_hz is not None
+        if self.powerline:
+            n = np.arange(SQI_BLOCK)
+            self._cos = np.cos(2 * np.pi * powerline_hz * n / fs)
+            self._sin = np.sin(2 * np.pi * powerline_hz * n / fs)
+
+        self.flat = False
+        self.sat_frac = 0.0
+        self.zoh_run_ms = 0.0
+        self.powerline_ratio = 0.0
+        self.template_corr = None
+        self.template = None
+
+        # Trạng thái ZOH mang qua block
+        self._last_value = None
+        self._run = 0
+
+    def update(self, block):
+        """Nạp 1 block mẫu thô (array-like)"""
+        x = np.asarray(block)
+        if len(x) == 0:
+            return
+
+        # 1. Phẳng / bão hòa
+        self.flat = (x.max() - x.min()) < self.flat_ptp
+        sat = np.count_nonzero((x <= self.lo) | (x >= self.hi)) / len(x)
+        self.sat_frac += EMA_ALPHA * (sat - self.sat_frac)
+
+        # 2. ZOH: độ dài chuỗi giá trị lặp lại dài nhất (tính cả phần nối từ block trước)
+        if self.check_zoh:
+            _, runs = zoh_runs(x)
+            if self._last_value is not None and x[0] == self._last_value:
+                runs[0] += self._run
+            self._run = runs[-1]
+            self._last_value = x[-1]
+            self.zoh_run_ms = runs.max() * 1000 / self.fs
+
+        # 3. Tỷ lệ năng lượng 50Hz / năng lượng AC (Goertzel)
+        if self.powerline and len(x) == SQI_BLOCK:
+            ac = x - x.mean()
+            total = np.dot(ac, ac)
+            if total > 0:
+                re, im = np.dot(ac, self._cos), np.dot(ac, self._sin)
+                ratio = 2 * (re * re + im * im) / (len(x) * total)
+                self.powerline_ratio += EMA_ALPHA * (ratio - self.powerline_ratio)
+
+    def update_template(self, clean, peaks, half_width):
+        """
+        Cập nhật template beat từ tín hiệu đã lọc và vị trí đỉnh (do stage tính vitals cung cấp).
+        Tương quan từng beat với template -> template_corr.
+        """
+        peaks = np.asarray(peaks)
+        peaks = peaks[(peaks >= half_width) & (peaks + half_width < len(clean))]
+        if len(peaks) < 2:
+            return
+        epochs = clean[peaks[:, None] + np.arange(-half_width, half_width)]
+        epochs = epochs - epochs.mean(axis=1, keepdims=True)
+        if self.template is None:
+            self.template = np.median(epochs, axis=0)
+
+        t = self.template - self.template.mean()
+        norm = np.linalg.norm(epochs, axis=1) * np.linalg.norm(t)
+        corr = np.divide(epochs @ t, norm, out=np.zeros(len(epochs)), where=norm > 0)
+        self.template_corr = float(np.median(corr))
+
+        # Chỉ học từ các beat giống template để tránh trôi theo nhiễu
+        good = corr > TEMPLATE_MIN_CORR
+        if np.any(good):
+            self.template = 0.9 * self.template + 0.1 * epochs[good].mean(axis=0)
+        elif self.template_corr < 0:
+            self.template = None  # Template hỏng (đổi điện cực, đảo cực...) -> học lại
+
+    @property
+    def level(self):
+        """Mức chất lượng: GOOD / POOR / BAD"""
+        if self.flat or self.sat_frac > SAT_MAX_FRAC:
+            return BAD
+        if self.check_zoh and self.zoh_run_ms > ZOH_MAX_MS:
+            return BAD
+        if self.powerline_ratio > POWERLINE_MAX:
+            return POOR
+        if self.template_corr is not None and self.template_corr < TEMPLATE_MIN_CORR:
+            return POOR
+        return GOOD
+
+
+class SignalQuality:
+    """SQI cho cả 4 kênh, nạp theo block từ SerialReader"""
+    def __init__(self, fs=1000, powerline_hz=50.0):
+        self.fs = fs
+        self.channels = {
+            "ECG": ChannelQuality("ECG", fs, powerline_hz=powerline_hz),
+            "PCG": ChannelQuality("PCG", fs, powerline_hz=powerline_hz),
+            "RED": ChannelQuality("RED", fs, check_zoh=True),
+            "IR":  ChannelQuality("IR", fs, check_zoh=True),
+        }
+
+    def update_block(self, **blocks):
+        """vd: update_block(ECG=[...], RED=[...], IR=[...])"""
+        for name, block in blocks.items():
+            self.channels[name].update(block)
+
+    def level(self, name):
+        return self.channels[name].level
+
+    @property
+    def ppg_level(self):
+        """SpO2 cần cả RED và IR: lấy mức kém hơn"""
+        levels = (self.level("RED"), self.level("IR"))
+        for lv in (BAD, POOR):
+            if lv in levels:
+                return lv
+        return GOOD
+
+    def summary(self):
+        return " ".join(f"{k}:{ch.level}" for k, ch in self.channels.items())
+
+
+def format_vital(label, value, level, unit=""):
+    """Hiển thị chỉ số theo mức chất lượng: BAD -> '--', POOR -> thêm '?' (kết quả kém tin cậy)"""
+    if level == BAD or not value:
+        return f"{label}: --{unit}"
+    if level == POOR:
+        return f"{label}: {value}{unit}?"
+    return f"{label}: {value}{unit}"
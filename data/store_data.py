@@ -1,17 +1,35 @@
-import serial
-import csv
+import os
 import time
 import sys
+import argparse
+import numpy as np
+from recorder import DoubleBufferedRecorder, ROTATE_S, ROTATE_BYTES
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Python_process"))
+from kernels import scan_gaps, GAP_TOLERANCE_US
 
 # ===== CẤU HÌNH =====
 PORT = 'COM5'
 BAUD = 921600 
-FILENAME = "test15.csv"
+OUT_DIR = "."
+PREFIX = "test"   # File: test_<phiên>_000.csv, test_<phiên>_001.csv, ... + manifest
 
 # Target: 1000Hz => 1000 micro-seconds (us) giữa các mẫu
 TARGET_INTERVAL_US = 1000 
 
-def run_logger():
+
+def count_lost(ts_block, last_ts):
+    """
+    Số mẫu mất trong 1 block timestamp ESP32 (kể cả khoảng trống nối với mẫu cuối block trước).
+    Khoảng cách > 1050us (cho phép sai số 50us) coi như mất mẫu - quét cả block 1 lần bằng kernels.scan_gaps.
+    """
+    ts = np.array(ts_block if last_ts is None else [last_ts] + ts_block, dtype=np.int64)
+    _, lost = scan_gaps(ts, TARGET_INTERVAL_US, GAP_TOLERANCE_US)
+    return int(lost.sum())
+
+
+def run_logger(out_dir=OUT_DIR, prefix=PREFIX, rotate_s=ROTATE_S, rotate_bytes=ROTATE_BYTES):
+    import serial  # Import muộn: module import được trên máy không có pyserial
     ser = None
     try:
         # Tăng timeout để tránh treo nếu mất kết nối
@@ -23,87 +41,85 @@ def run_logger():
         print(f"!!! CONNECTION ERROR: {e}")
         sys.exit(1)
 
-    print(f"Writing data to file: {FILENAME}")
+    # Ghi file chạy ở thread riêng (2 buffer hoán đổi) -> vòng đọc serial không bao giờ chờ đĩa
+    recorder = DoubleBufferedRecorder(out_dir, prefix, rotate_s=rotate_s, rotate_bytes=rotate_bytes)
+    print(f"Writing data to: {recorder.session}_*.csv (manifest: {recorder.manifest_path})")
     print("Press Ctrl+C to stop the program...")
-    with open(FILENAME, mode='w', newline='') as f:
-        writer = csv.writer(f)
+    sample_count = 0
+    total_lost_samples = 0
+    last_esp_ts = None   # Timestamp cuối của block đã quét
+    ts_block = []        # Timestamp của block đang gom (quét mất mẫu mỗi 1000 mẫu)
+    start_time = time.time()
+
+    try:
+        while True:
+            # Đọc 1 dòng từ Serial
+            try:
+                line = ser.readline().decode('utf-8', errors='ignore').strip()
+            except serial.SerialException:
+                print("Serial Disconnected!")
+                break
+
+            if not line:
+                continue
+
+            parts = line.split(',')
+
+            # Kiểm tra đủ 5 cột dữ liệu (Timestamp, PCG, Red, IR, ECG)
+            if len(parts) != 5:
+                # In ra dòng lỗi để debug nếu cần (hoặc bỏ qua)
+                print(f"Format error: {line}")
+                continue
+
+            try:
+                # Parse dữ liệu
+                esp_ts  = int(parts[0]) # Timestamp từ ESP32 (micro-seconds)
+                pcg_val = int(parts[1])
+                red_val = int(parts[2])
+                ir_val  = int(parts[3])
+                ecg_val = int(parts[4])
+            except ValueError:
+                continue
+
+            #  KIỂM TRA MẤT MẪU (Dựa trên Timestamp ESP32): gom lại, quét theo block bên dưới
+            ts_block.append(esp_ts)
+
+            # GHI DỮ LIỆU (chỉ chép vào buffer, thread ghi lo phần I/O)
+            recorder.append(esp_ts, pcg_val, red_val, ir_val, ecg_val)
+            sample_count += 1
+
+            # Hiển thị trạng thái mỗi 1000 mẫu (1 giây)
+            if sample_count % 1000 == 0:
+                total_lost_samples += count_lost(ts_block, last_esp_ts)
+                last_esp_ts = ts_block[-1]
+                ts_block = []
+                elapsed = time.time() - start_time
+                fps = sample_count / elapsed
+                print(f"Time: {elapsed:.1f}s | Mau: {sample_count} | Lost: {total_lost_samples} | Speed: {fps:.1f} Hz"
+                      f" | File: {len(recorder.files)} | Overruns: {recorder.overruns}")
+
+    except KeyboardInterrupt:
+        print(f"\n Stopping data logger...")
+        if ts_block:
+            total_lost_samples += count_lost(ts_block, last_esp_ts)
+        print(f"Total samples collected: {sample_count}")
+        print(f"Total samples lost: {total_lost_samples}")
+        if sample_count > 0:
+            percent_loss = (total_lost_samples / (sample_count + total_lost_samples)) * 100
+            print(f"Packet loss rate: {percent_loss:.2f}%")
         
-        # Ghi Header cho file CSV (Khớp với printf trong C)
-        # C Code: printf("%lld,%d,%lu,%lu,%d\n", timestamp, pcg, red, ir, ecg);
-        writer.writerow(["Timestamp", "PCG", "RED", "IR", "ECG"])
-
-        sample_count = 0
-        total_lost_samples = 0
-        last_esp_ts = None
-        start_time = time.time()
-
-        try:
-            while True:
-                # Đọc 1 dòng từ Serial
-                try:
-                    line = ser.readline().decode('utf-8', errors='ignore').strip()
-                except serial.SerialException:
-                    print("Serial Disconnected!")
-                    break
-
-                if not line:
-                    continue
-
-                parts = line.split(',')
-
-                # Kiểm tra đủ 5 cột dữ liệu (Timestamp, PCG, Red, IR, ECG)
-                if len(parts) != 5:
-                    # In ra dòng lỗi để debug nếu cần (hoặc bỏ qua)
-                    print(f"Format error: {line}")
-                    continue
-
-                try:
-                    # Parse dữ liệu
-                    esp_ts  = int(parts[0]) # Timestamp từ ESP32 (micro-seconds)
-                    pcg_val = int(parts[1])
-                    red_val = int(parts[2])
-                    ir_val  = int(parts[3])
-                    ecg_val = int(parts[4])
-                except ValueError:
-                    continue
-
-                #  KIỂM TRA MẤT MẪU (Dựa trên Timestamp ESP32) 
-                if last_esp_ts is not None:
-                    # Tính khoảng cách thời gian giữa 2 mẫu liên tiếp
-                    delta_us = esp_ts - last_esp_ts
-                    
-                    # Nếu khoảng cách lớn hơn 1050us (cho phép sai số 50us), coi như mất mẫu
-                    # Lý thuyết: 1000us. Thực tế có thể dao động 999-1001us.
-                    if delta_us > (TARGET_INTERVAL_US + 50):
-                        # Tính số mẫu bị mất (làm tròn)
-                        lost = int((delta_us - TARGET_INTERVAL_US) / TARGET_INTERVAL_US)
-                        total_lost_samples += lost
-                        # print(f"!!! WARNING: Lost {lost} samples (Delta: {delta_us}us)")
-
-                last_esp_ts = esp_ts
-
-                # GHI DỮ LIỆU
-                writer.writerow([esp_ts, pcg_val, red_val, ir_val, ecg_val])
-                sample_count += 1
-
-                # Hiển thị trạng thái mỗi 1000 mẫu (1 giây)
-                if sample_count % 1000 == 0:
-                    elapsed = time.time() - start_time
-                    fps = sample_count / elapsed
-                    print(f"Time: {elapsed:.1f}s | Mau: {sample_count} | Lost: {total_lost_samples} | Speed: {fps:.1f} Hz")
-
-        except KeyboardInterrupt:
-            print(f"\n Stopping data logger...")
-            print(f"Total samples collected: {sample_count}")
-            print(f"Total samples lost: {total_lost_samples}")
-            if sample_count > 0:
-                percent_loss = (total_lost_samples / (sample_count + total_lost_samples)) * 100
-                print(f"Packet loss rate: {percent_loss:.2f}%")
-            
-        finally:
-            if ser and ser.is_open:
-                ser.close()
-                print("Serial port closed.")
+    finally:
+        recorder.close()
+        print(f"Rows written: {recorder.rows_written} in {len(recorder.files)} file(s)")
+        if ser and ser.is_open:
+            ser.close()
+            print("Serial port closed.")
 
 if __name__ == "__main__":
-    run_logger()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ghi dữ liệu ESP32 ra CSV (tách file theo thời gian / dung lượng)")
+    parser.add_argument("--out-dir", default=OUT_DIR, help="Thư mục lưu file")
+    parser.add_argument("--prefix", default=PREFIX, help="Tiền tố tên file")
+    parser.add_argument("--rotate-min", type=float, default=ROTATE_S / 60, help="Tách file sau N phút")
+    parser.add_argument("--rotate-mb", type=float, default=ROTATE_BYTES / 2**20, help="Tách file khi vượt N MB")
+    args = parser.parse_args()
+    run_logger(args.out_dir, args.prefix, args.rotate_min * 60, int(args.rotate_mb * 2**20))
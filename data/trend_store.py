@@ -0,0 +1,109 @@
+import os
+import numpy as np
+
+# CẤU HÌNH
+TREND_METRICS = ("hr", "spo2", "pat", "rmssd", "resp")
+# (độ phân giải s, số ô): 1s x 1 giờ, 1 phút x 24 giờ, 10 phút x 7 ngày
+ARCHIVES = ((1, 3600), (60, 1440), (600, 1008))
+
+
+def _archive_dtype(n_metrics):
+    return np.dtype([
+        ("bucket", "<i8", (n_metrics,)),   # Số thứ tự ô thời gian (t // step) đang nằm ở slot này
+        ("min", "<f4", (n_metrics,)),
+        ("max", "<f4", (n_metrics,)),
+        ("sum", "<f8", (n_metrics,)),
+        ("count", "<u4", (n_metrics,)),
+    ])
+
+
+class TrendStore:
+    """
+    Lưu xu hướng vitals kiểu RRD: mỗi archive là mảng vòng cố định, ô thời gian b = t // step
+    nằm ở slot b % rows. Khi 1 slot bị ô mới chiếm thì được reset -> bộ nhớ không đổi theo độ dài phiên,
+    dữ liệu cũ hơn (rows * step) giây tự bị ghi đè. Mỗi giá trị (theo beat / mỗi giây) cập nhật
+    min / tổng / max / đếm của ô tương ứng ở TẤT CẢ archive (O(số archive)).
+    Nếu có path: mỗi archive là file .npy ánh xạ bộ nhớ (memmap) -> flush() chỉ ghi các trang thay đổi,
+    và mở lại cùng thư mục sẽ tiếp tục phiên trước.
+    """
+    def __init__(self, path=None, metrics=TREND_METRICS, archives=ARCHIVES):
+        self.metrics = list(metrics)
+        self.col = {m: i for i, m in enumerate(self.metrics)}
+        self.archives = []
+        dtype = _archive_dtype(len(self.metrics))
+        if path:
+            os.makedirs(path, exist_ok=True)
+        for step, rows in archives:
+            fname = os.path.join(path, f"trend_{step}s.npy") if path else None
+            if fname and os.path.exists(fname):
+                arr = np.load(fname, mmap_mode="r+")
+                if arr.dtype != dtype or arr.shape != (rows,):
+                    raise ValueError(f"{fname}: cấu trúc archive khác cấu hình hiện tại")
+            elif fname:
+                arr = np.lib.format.open_memmap(fname, mode="w+", dtype=dtype, shape=(rows,))
+                arr["bucket"] = -1
+            else:
+                arr = np.zeros(rows, dtype=dtype)
+                arr["bucket"] = -1
+            self.archives.append((step, rows, arr))
+
+    def update(self, metric, t, value):
+        """Nạp 1 giá trị của metric tại thời điểm t (s, epoch). Bỏ qua NaN / 0 (chưa đo được)."""
+        if value is None or not np.isfinite(value) or value <= 0:
+            return
+        c = self.col[metric]
+        for step, rows, arr in self.archives:
+            b = int(t // step)
+            rec = arr[b % rows]
+            if rec["bucket"][c] != b:
+                if rec["bucket"][c] > b:
+                    continue   # Giá trị quá cũ (slot đã thuộc ô mới hơn)
+                rec["bucket"][c] = b
+                rec["min"][c] = value
+                rec["max"][c] = value
+                rec["sum"][c] = 0.0
+                rec["count"][c] = 0
+            rec["min"][c] = min(rec["min"][c], value)
+            rec["max"][c] = max(rec["max"][c], value)
+            rec["sum"][c] += value
+            rec["count"][c] += 1
+
+    def update_many(self, metric, t, values):
+        for ti, v in zip(t, values):
+            self.update(metric, ti, v)
+
+    def choose_archive(self, span_s, max_points=1200):
+        """Archive mịn nhất vừa phủ span_s mà không vượt max_points điểm vẽ"""
+        for i, (step, rows, _) in enumerate(self.archives):
+            if span_s <= step * rows and span_s / step <= max_points:
+                return i
+        return len(self.archives) - 1
+
+    def series(self, metric, t0, t1, archive=None):
+        """
+        Chuỗi (t, min, mean, max) theo thứ tự thời gian trong [t0, t1); ô không có dữ liệu = NaN.
+        Chi phí tỉ lệ số ô hiển thị, không phụ thuộc độ dài phiên.
+        """
+        i = self.choose_archive(t1 - t0) if archive is None else archive
+        step, rows, arr = self.archives[i]
+        c = self.col[metric]
+        b = np.arange(int(t0 // step), int(t1 // step) + 1)
+        b = b[-rows:]
+        rec = arr[b % rows]
+        ok = (rec["bucket"][:, c] == b) & (rec["count"][:, c] > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = rec["sum"][:, c] / rec["count"][:, c]
+        nan = np.float32(np.nan)
+        return (b * step + step / 2,
+                np.where(ok, rec["min"][:, c], nan),
+                np.where(ok, mean, np.nan),
+                np.where(ok, rec["max"][:, c], nan))
+
+    def flush(self):
+        for _, _, arr in self.archives:
+            if isinstance(arr, np.memmap):
+                arr.flush()
+
+    @property
+    def nbytes(self):
+        return sum(arr.nbytes for _, _, arr in self.archives)